@@ -0,0 +1,271 @@
+# app/admission.py
+"""
+Endpointlər üçün qəbul nəzarəti (admission control) və yük atma (load shedding).
+
+Hər endpoint sinfinin (ucuz oxuma, chat, batch, compare, upload) öz paralellik limiti və gözləmə
+növbəsi var. Limit doludursa sorğu növbədə (FIFO) gözləyir; növbə doludursa, təxmini gözləmə
+sorğunun deadline-ına sığmırsa və ya gözləmə vaxtı bitərsə sorğu dərhal 503 + Retry-After ilə
+rədd edilir. Beləliklə burst zamanı sorğular gunicorn timeout-una qədər yığılmır: bir qismi tez
+xidmət alır, qalanı tez rədd olunur və sonra təkrar cəhd edir.
+
+Qəbul olunan sorğunun deadline-ı (ADMISSION_<SİNİF>_DEADLINE, X-Request-Timeout başlığı ilə
+qısaldıla bilər) request_deadline kontekst dəyişəninə yazılır; OpenSearch axtarışları və Gemini
+çağırışları ona uyğun timeout alır. Sayğaclar (worker üzrə) /metrics-də "admission" bölməsindədir.
+"""
+import os
+import json
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.rag.gemini_scheduler import request_deadline
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Növbədəki sorğu deadline-ının ən çox bu hissəsini gözləyir (qalanı icra üçündür)
+ADMISSION_QUEUE_WAIT_FRACTION = float(os.getenv("ADMISSION_QUEUE_WAIT_FRACTION", 0.5))
+DEADLINE_HEADER = "x-request-timeout"
+# Lifespan, jurnal yazıcısının bağlanması kimi endpoint-dən kənar to_thread işləri üçün əlavə thread-lər
+ADMISSION_RESERVE_THREADS = int(os.getenv("ADMISSION_RESERVE_THREADS", 4))
+# Bir /chat/batch sorğusunun eyni vaxtda icra etdiyi generasiya sayı (hər biri default executor-da bir thread)
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", 8))
+# Xidmət müddəti EWMA-sının hamarlama əmsalı (Retry-After və təxmini gözləmə üçün)
+SERVICE_TIME_ALPHA = 0.2
+
+
+def _class_limits(name: str, concurrency: int, queue: int, deadline: float) -> Dict:
+    prefix = f"ADMISSION_{name.upper()}"
+    return {
+        "concurrency": int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        "queue": int(os.getenv(f"{prefix}_QUEUE", queue)),
+        "deadline": float(os.getenv(f"{prefix}_DEADLINE", deadline)),
+    }
+
+
+# Upload deadline-ı GEMINI_DEADLINE_INGESTION ilə eynidir (böyük paketlərin embedding-i uzun çəkir)
+ENDPOINT_CLASSES = {
+    "light": _class_limits("light", 32, 64, 10),
+    "chat": _class_limits("chat", 8, 16, 60),
+    "batch": _class_limits("batch", 2, 4, 240),
+    "compare": _class_limits("compare", 2, 4, 120),
+    "upload": _class_limits("upload", 2, 4, 600),
+}
+
+# Siyahıda olmayan yollar (/, /metrics, /docs, /admin/...) nəzarətdən keçmir —
+# yüklənmə zamanı da metrikalar əlçatan qalmalıdır
+EXACT_ROUTES = {
+    "/chat": "chat",
+    "/chat/batch": "batch",
+    "/compare-excel": "compare",
+    "/upload-document": "upload",
+    "/upload-documents": "upload",
+    "/reset": "light",
+}
+PREFIX_ROUTES = (("/history/", "light"),)
+
+
+class EndpointGate:
+    """Bir endpoint sinfi üçün paralellik limiti + məhdud FIFO növbə (bir event loop daxilində)."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, deadline: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_limit = max(0, queue)
+        self.deadline = deadline
+        self.in_flight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.service_time_ewma: Optional[float] = None
+        self.counters = {
+            "admitted": 0, "enqueued": 0, "completed": 0, "expired": 0,
+            "shed_queue_full": 0, "shed_predicted": 0, "shed_timeout": 0,
+        }
+
+    def estimated_wait(self) -> float:
+        """Növbənin sonuna qoşulan sorğunun təxmini gözləməsi (saniyə)."""
+        if self.service_time_ewma is None:
+            return 0.0
+        return self.service_time_ewma * (len(self._waiters) + 1) / self.concurrency
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait()))
+
+    async def acquire(self, remaining: float) -> Optional[str]:
+        """Yer ayırır. Qəbul olunduqda None, rədd edildikdə səbəbi qaytarır."""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return None
+        if len(self._waiters) >= self.queue_limit:
+            self.counters["shed_queue_full"] += 1
+            return "queue_full"
+        if self.estimated_wait() >= remaining * ADMISSION_QUEUE_WAIT_FRACTION:
+            self.counters["shed_predicted"] += 1
+            return "deadline_unreachable"
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.counters["enqueued"] += 1
+        try:
+            await asyncio.wait_for(future, remaining * ADMISSION_QUEUE_WAIT_FRACTION)
+            self.counters["admitted"] += 1
+            return None
+        except asyncio.TimeoutError:
+            # release() yeri timeout ilə eyni iterasiyada ötürübsə, sorğu qəbul olunmuş sayılır —
+            # əks halda in_flight azalmadan yer itərdi
+            if future.done() and not future.cancelled():
+                self.counters["admitted"] += 1
+                return None
+            self.counters["shed_timeout"] += 1
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # Müştəri ayrıldı; yer artıq ona ötürülübsə növbətiyə qaytarılır
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+
+    def release(self, service_time: Optional[float] = None):
+        """Yeri növbədəki ilk sorğuya birbaşa ötürür (in_flight dəyişmir) və ya azad edir."""
+        if service_time is not None:
+            self.counters["completed"] += 1
+            self.service_time_ewma = service_time if self.service_time_ewma is None else (
+                SERVICE_TIME_ALPHA * service_time + (1 - SERVICE_TIME_ALPHA) * self.service_time_ewma
+            )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_limit": self.queue_limit,
+            "deadline_s": self.deadline,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "shed_total": self.counters["shed_queue_full"] + self.counters["shed_predicted"]
+                          + self.counters["shed_timeout"],
+            "service_time_ewma_ms": round(self.service_time_ewma * 1000, 1) if self.service_time_ewma else None,
+            **self.counters,
+        }
+
+
+gates = {name: EndpointGate(name, **limits) for name, limits in ENDPOINT_CLASSES.items()}
+
+
+def request_thread_budget() -> int:
+    """
+    Default executor-un ölçüsü: bütün siniflərin paralellik limitlərinin cəmi (batch sinfi üçün
+    CHAT_BATCH_CONCURRENCY qatı ilə). Endpoint-lər bloklayan işi asyncio.to_thread ilə icra etdiyindən
+    qəbul olunmuş hər sorğuya thread çatır — yavaş /chat sorğuları /history-nin thread-lərini tutmur.
+    """
+    threads = sum(gate.concurrency * (CHAT_BATCH_CONCURRENCY if name == "batch" else 1)
+                  for name, gate in gates.items())
+    return threads + ADMISSION_RESERVE_THREADS
+
+
+def gate_for_path(path: str) -> Optional[EndpointGate]:
+    name = EXACT_ROUTES.get(path.rstrip("/") or "/")
+    if name is None:
+        name = next((cls for prefix, cls in PREFIX_ROUTES if path.startswith(prefix)), None)
+    return gates.get(name) if name else None
+
+
+def _requested_timeout(scope) -> Optional[float]:
+    for key, value in scope.get("headers", ()):
+        if key == DEADLINE_HEADER.encode():
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _send_overloaded(send, gate: EndpointGate, reason: str):
+    body = json.dumps({
+        "detail": "Server hazırda yüklənib, sorğu qəbul edilmədi. Bir azdan yenidən cəhd edin.",
+        "reason": reason,
+        "endpoint_class": gate.name,
+    }, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(gate.retry_after()).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    Saf ASGI middleware: sorğunu endpoint sinfinin qapısından keçirir və deadline-ı kontekstə yazır.
+    Yer cavabın son hissəsi göndərilən kimi azad olunur (fon tapşırıqları yer tutmur).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        gate = gate_for_path(scope["path"]) if scope["type"] == "http" and ADMISSION_ENABLED else None
+        if gate is None:
+            return await self.app(scope, receive, send)
+
+        arrived = time.monotonic()
+        budget = gate.deadline
+        requested = _requested_timeout(scope)
+        if requested is not None and requested > 0:
+            budget = min(budget, requested)
+
+        reason = await gate.acquire(budget)
+        if reason is not None:
+            return await _send_overloaded(send, gate, reason)
+
+        started = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                gate.release(time.monotonic() - started)
+
+        async def send_and_release(message):
+            if message["type"] == "http.response.start" and message["status"] == 503:
+                gate.counters["expired"] += 1
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                release()
+
+        token = request_deadline.set(arrived + budget)
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            request_deadline.reset(token)
+            release()
+
+
+def deadline_http_error(exc: Exception) -> HTTPException:
+    """Endpoint daxilində deadline keçdikdə (DeadlineExceeded) 500 əvəzinə 503 + Retry-After."""
+    return HTTPException(
+        status_code=503,
+        detail=f"Sorğu vaxt limitinə sığmadı, yenidən cəhd edin. ({exc})",
+        headers={"Retry-After": "5"}
+    )
+
+
+def admission_snapshot() -> Dict:
+    return {"enabled": ADMISSION_ENABLED, "classes": {name: gate.snapshot() for name, gate in gates.items()}}
@@ -0,0 +1,142 @@
+# app/database/cache_store.py
+from typing import Dict, List, Optional, Tuple
+
+from app.database.connection import get_table_connection
+
+CREATE_GEMINI_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS gemini_cache (
+    cache_key VARCHAR(128) PRIMARY KEY,
+    namespace VARCHAR(64) NOT NULL,
+    value BYTEA NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_hit_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+CREATE INDEX IF NOT EXISTS gemini_cache_last_hit_idx ON gemini_cache (namespace, last_hit_at DESC);
+"""
+
+
+def fetch_entries(keys: List[str]) -> Optional[Dict[str, Tuple[bytes, float]]]:
+    """
+    Vaxtı keçməmiş girişləri açar -> (dəyər, qalan TTL saniyə) kimi qaytarır. DB əlçatmazdırsa None.
+    last_hit_at burada yenilənmir — touch_entries ilə paketlər halında yazılır.
+    """
+    conn = get_table_connection(CREATE_GEMINI_CACHE_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT cache_key, value, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)
+                FROM gemini_cache
+                WHERE cache_key = ANY(%s) AND expires_at > CURRENT_TIMESTAMP
+                """,
+                (list(keys),)
+            )
+            return {key: (bytes(value), float(remaining)) for key, value, remaining in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def touch_entries(keys: List[str]) -> bool:
+    """Toplanmış L2 hit-lərinin last_hit_at-ını bir sorğu ilə yeniləyir (eviction LRU sırası üçün)."""
+    conn = get_table_connection(CREATE_GEMINI_CACHE_TABLE)
+    if conn is None:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE gemini_cache SET last_hit_at = CURRENT_TIMESTAMP WHERE cache_key = ANY(%s)",
+                (list(keys),)
+            )
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def store_entries(namespace: str, entries: Dict[str, bytes], ttl_seconds: int) -> bool:
+    """Girişləri bir sorğu ilə yazır (mövcud açar üzərinə yazılır)."""
+    from psycopg2.extras import execute_values
+
+    conn = get_table_connection(CREATE_GEMINI_CACHE_TABLE)
+    if conn is None:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO gemini_cache (cache_key, namespace, value, size_bytes, expires_at)
+                VALUES %s
+                ON CONFLICT (cache_key) DO UPDATE
+                SET value = EXCLUDED.value,
+                    size_bytes = EXCLUDED.size_bytes,
+                    last_hit_at = CURRENT_TIMESTAMP,
+                    expires_at = EXCLUDED.expires_at
+                """,
+                [(key, namespace, value, len(value), ttl_seconds) for key, value in entries.items()],
+                template="(%s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))"
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Keş yazma xətası: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def evict_entries(max_bytes: int) -> int:
+    """Vaxtı keçmiş girişləri, sonra ümumi ölçü max_bytes-i aşan ən köhnə (last_hit_at) girişləri silir."""
+    conn = get_table_connection(CREATE_GEMINI_CACHE_TABLE)
+    if conn is None:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM gemini_cache WHERE expires_at <= CURRENT_TIMESTAMP")
+            deleted = cursor.rowcount
+            cursor.execute(
+                """
+                DELETE FROM gemini_cache WHERE cache_key IN (
+                    SELECT cache_key FROM (
+                        SELECT cache_key, SUM(size_bytes) OVER (ORDER BY last_hit_at DESC, cache_key) AS running
+                        FROM gemini_cache
+                    ) ranked
+                    WHERE running > %s
+                )
+                """,
+                (max_bytes,)
+            )
+            deleted += cursor.rowcount
+        conn.commit()
+        return deleted
+    finally:
+        conn.close()
+
+
+def recent_entries(namespace: str, limit: int) -> Optional[Dict[str, Tuple[bytes, float]]]:
+    """
+    Son istifadə olunmuş girişlər (açar -> (dəyər, qalan TTL saniyə)) — yeni worker-in yaddaş keşini
+    isitmək üçün. DB əlçatmazdırsa None.
+    """
+    conn = get_table_connection(CREATE_GEMINI_CACHE_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT cache_key, value, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)
+                FROM gemini_cache
+                WHERE namespace = %s AND expires_at > CURRENT_TIMESTAMP
+                ORDER BY last_hit_at DESC LIMIT %s
+                """,
+                (namespace, limit)
+            )
+            return {key: (bytes(value), float(remaining)) for key, value, remaining in cursor.fetchall()}
+    finally:
+        conn.close()
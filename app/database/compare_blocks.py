@@ -0,0 +1,86 @@
+# app/database/compare_blocks.py
+from typing import Dict, List, Optional
+
+from app.database.connection import get_table_connection
+
+CREATE_COMPARE_BLOCKS_TABLE = """
+CREATE TABLE IF NOT EXISTS compare_blocks (
+    session_id VARCHAR(255) NOT NULL,
+    fingerprint VARCHAR(64) NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    scores BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (session_id, fingerprint)
+);
+"""
+
+
+def fetch_block_scores(session_id: str, fingerprints: List[str]) -> Optional[Dict[str, bytes]]:
+    """Sessiyanın əvvəlki blok nəticələrini barmaq izi üzrə qaytarır. DB əlçatmazdırsa None."""
+    conn = get_table_connection(CREATE_COMPARE_BLOCKS_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE compare_blocks SET updated_at = CURRENT_TIMESTAMP
+                WHERE session_id = %s AND fingerprint = ANY(%s)
+                RETURNING fingerprint, scores
+                """,
+                (session_id, list(fingerprints))
+            )
+            rows = cursor.fetchall()
+        conn.commit()
+        return {fingerprint: bytes(scores) for fingerprint, scores in rows}
+    finally:
+        conn.close()
+
+
+def store_block_scores(session_id: str, entries: Dict[str, bytes], kinds: Dict[str, str],
+                       retention_days: int) -> bool:
+    """Blok nəticələrini bir sorğu ilə yazır və sessiyanın retention_days-dən köhnə bloklarını silir."""
+    from psycopg2.extras import execute_values
+
+    conn = get_table_connection(CREATE_COMPARE_BLOCKS_TABLE)
+    if conn is None:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO compare_blocks (session_id, fingerprint, kind, scores)
+                VALUES %s
+                ON CONFLICT (session_id, fingerprint) DO UPDATE
+                SET scores = EXCLUDED.scores, updated_at = CURRENT_TIMESTAMP
+                """,
+                [(session_id, fingerprint, kinds[fingerprint], scores) for fingerprint, scores in entries.items()]
+            )
+            cursor.execute(
+                "DELETE FROM compare_blocks WHERE session_id = %s "
+                "AND updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+                (session_id, retention_days)
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Müqayisə blokları yazma xətası: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def delete_block_scores(session_id: str) -> bool:
+    """Sessiyanın bütün blok nəticələrini silir (/reset)."""
+    conn = get_table_connection(CREATE_COMPARE_BLOCKS_TABLE)
+    if conn is None:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM compare_blocks WHERE session_id = %s", (session_id,))
+        conn.commit()
+        return True
+    finally:
+        conn.close()
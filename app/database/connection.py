@@ -1,30 +1,160 @@
 # app/database/connection.py
 import os
+import re
+import time
+import threading
+from typing import Optional
+
 import psycopg2
 from dotenv import load_dotenv
 
 # .env faylını yükləyir
 load_dotenv()
 
+# Tətbiq (SQLChatMessageHistory, startup yoxlaması) DB_URL-dən istifadə edir; ayrı DB_* dəyişənləri
+# yalnız DB_URL təyin olunmadıqda nəzərə alınır
+DB_URL = os.getenv("DB_URL")
 DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
+# app/database/* modullarının ortaq əlaqə pool-u (worker üzrə)
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 8))
+# Pool dolu olduqda boş əlaqə üçün gözləmə (saniyə); keçərsə çağıran None alır
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+# Bağlantı uğursuz olduqdan sonra bu müddət ərzində yeni cəhd edilmir (hər sorğu timeout gözləməsin)
+DB_RETRY_BACKOFF = float(os.getenv("DB_RETRY_BACKOFF", 10))
+
+
+def _connect_kwargs() -> dict:
+    """psycopg2.connect arqumentləri: DB_URL (SQLAlchemy formatı) üstünlük təşkil edir."""
+    if DB_URL:
+        # "postgresql+psycopg2://..." -> libpq-nin başa düşdüyü "postgresql://..."
+        return {"dsn": re.sub(r"^postgres(?:ql)?(?:\+\w+)?://", "postgresql://", DB_URL)}
+    return {"user": DB_USER, "password": DB_PASS, "host": DB_HOST, "port": DB_PORT, "database": DB_NAME}
+
+
 def get_db_connection():
     """
-    PostgreSQL verilənlər bazası ilə əlaqə yaradır.
+    PostgreSQL verilənlər bazası ilə (pool-suz) əlaqə yaradır.
     """
     try:
-        conn = psycopg2.connect(
-            user=DB_USER,
-            password=DB_PASS,
-            host=DB_HOST, # Docker Compose-da xidmətin adı (db)
-            port=DB_PORT,
-            database=DB_NAME
-        )
+        conn = psycopg2.connect(**_connect_kwargs())
         return conn
     except psycopg2.Error as e:
         print(f"PostgreSQL ilə əlaqə xətası: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class _PooledConnection:
+    """psycopg2 əlaqəsinin örtüyü: close() əlaqəni bağlamır, pool-a qaytarır."""
+
+    def __init__(self, pool: "ConnectionPool", conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.put(conn)
+
+
+class ConnectionPool:
+    """
+    Thread-safe, bloklayan əlaqə pool-u. Boş əlaqələr təkrar istifadə olunur, açıq əlaqə sayı
+    DB_POOL_MAX ilə məhdudlaşır. DB əlçatmaz olduqda DB_RETRY_BACKOFF ərzində dərhal None qaytarır.
+    """
+
+    def __init__(self, max_size: int = DB_POOL_MAX, timeout: float = DB_POOL_TIMEOUT,
+                 retry_backoff: float = DB_RETRY_BACKOFF):
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.retry_backoff = retry_backoff
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._unavailable_until = 0.0
+
+    def get(self) -> Optional[_PooledConnection]:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        if not self._slots.acquire(timeout=self.timeout):
+            print(f"WARNING: DB pool dolu ({self.max_size} əlaqə), sorğu DB-siz davam edir.")
+            return None
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None or conn.closed:
+            try:
+                conn = psycopg2.connect(**_connect_kwargs())
+            except psycopg2.Error as e:
+                self._slots.release()
+                self._unavailable_until = time.monotonic() + self.retry_backoff
+                print(f"PostgreSQL ilə əlaqə xətası (növbəti cəhd {self.retry_backoff:.0f} s sonra): {e}")
+                return None
+        return _PooledConnection(self, conn)
+
+    def put(self, conn):
+        # Açıq qalmış tranzaksiya növbəti istifadəçiyə keçməsin; qırılmış əlaqə atılır
+        try:
+            if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+        if not conn.closed:
+            with self._lock:
+                self._idle.append(conn)
+        self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pool = ConnectionPool()
+
+
+def get_pooled_connection() -> Optional[_PooledConnection]:
+    """
+    Ortaq pool-dan əlaqə qaytarır (DB əlçatmazdırsa və ya pool doludursa None).
+    conn.close() əlaqəni pool-a qaytarır.
+    """
+    return _pool.get()
+
+
+_ready_tables = set()
+
+
+def get_table_connection(ddl: str) -> Optional[_PooledConnection]:
+    """
+    Pool-dan əlaqə qaytarır və `ddl` ilə yaradılan cədvəlin mövcudluğunu (proses üzrə bir dəfə) təmin edir.
+    DDL uğursuz olarsa (məs. CREATE hüququ yoxdur) tranzaksiya geri qaytarılır, əlaqə pool-a qaytarılır və None.
+    """
+    conn = get_pooled_connection()
+    if conn is None or ddl in _ready_tables:
+        return conn
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(ddl)
+        conn.commit()
+    except Exception as e:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        conn.close()
+        print(f"WARNING: Cədvəl yaradıla bilmədi, sorğu DB-siz davam edir: {e}")
+        return None
+    _ready_tables.add(ddl)
+    return conn
+
+
+def close_pool():
+    """Boş pool əlaqələrini bağlayır (worker dayananda)."""
+    _pool.close_all()
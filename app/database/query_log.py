@@ -0,0 +1,96 @@
+# app/database/query_log.py
+import json
+from typing import Dict, List, Optional
+
+from app.database.connection import get_table_connection
+
+CREATE_QUERY_LOG_TABLE = """
+CREATE TABLE IF NOT EXISTS query_log (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    endpoint VARCHAR(64) NOT NULL,
+    session_id VARCHAR(255),
+    question TEXT,
+    payload JSONB,
+    retrieved JSONB,
+    timings_ms JSONB,
+    prompt_tokens INTEGER,
+    response_tokens INTEGER,
+    status_code INTEGER,
+    duration_ms REAL
+);
+CREATE INDEX IF NOT EXISTS query_log_created_at_idx ON query_log (created_at);
+"""
+
+QUERY_LOG_COLUMNS = (
+    "created_at", "endpoint", "session_id", "question", "payload", "retrieved",
+    "timings_ms", "prompt_tokens", "response_tokens", "status_code", "duration_ms",
+)
+JSON_COLUMNS = {"payload", "retrieved", "timings_ms"}
+
+
+def insert_query_logs(records: List[Dict]) -> bool:
+    """Qeydləri bir INSERT sorğusu ilə yazır. created_at unix vaxtı (saniyə) kimi gözlənilir."""
+    from psycopg2.extras import execute_values
+
+    conn = get_table_connection(CREATE_QUERY_LOG_TABLE)
+    if conn is None:
+        return False
+    try:
+        rows = [
+            tuple(
+                json.dumps(record.get(column), ensure_ascii=False) if column in JSON_COLUMNS else record.get(column)
+                for column in QUERY_LOG_COLUMNS
+            )
+            for record in records
+        ]
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"INSERT INTO query_log ({', '.join(QUERY_LOG_COLUMNS)}) VALUES %s",
+                rows,
+                template="(to_timestamp(%s), %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb, %s, %s, %s, %s)"
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Sorğu jurnalı yazma xətası: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def fetch_query_logs(since: Optional[str] = None, until: Optional[str] = None,
+                     endpoints: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Replay üçün qeydləri vaxt sırası ilə qaytarır (created_at unix vaxtı kimi)."""
+    conn = get_table_connection(CREATE_QUERY_LOG_TABLE)
+    if conn is None:
+        return []
+    conditions, params = [], []
+    if since:
+        conditions.append("created_at >= %s")
+        params.append(since)
+    if until:
+        conditions.append("created_at < %s")
+        params.append(until)
+    if endpoints:
+        conditions.append("endpoint = ANY(%s)")
+        params.append(endpoints)
+    query = (
+        f"SELECT EXTRACT(EPOCH FROM created_at), {', '.join(QUERY_LOG_COLUMNS[1:])} FROM query_log"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+        + " ORDER BY created_at"
+        + (" LIMIT %s" if limit else "")
+    )
+    if limit:
+        params.append(limit)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return [
+                {**dict(zip(QUERY_LOG_COLUMNS, row)), "created_at": float(row[0])}
+                for row in cursor.fetchall()
+            ]
+    finally:
+        conn.close()
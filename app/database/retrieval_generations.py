@@ -0,0 +1,57 @@
+# app/database/retrieval_generations.py
+from typing import Optional
+
+from app.database.connection import get_table_connection
+
+# session_key: sessiya üzrə sayğac üçün session_id, indeks üzrə sayğac üçün boş sətir
+CREATE_RETRIEVAL_GENERATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS retrieval_generations (
+    index_name VARCHAR(255) NOT NULL,
+    session_key VARCHAR(255) NOT NULL DEFAULT '',
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (index_name, session_key)
+);
+"""
+
+
+def fetch_generation(index_name: str, session_key: str = "") -> Optional[int]:
+    """Ortaq generasiya sayğacını qaytarır (heç yazılmayıbsa 0). DB əlçatmazdırsa None."""
+    conn = get_table_connection(CREATE_RETRIEVAL_GENERATIONS_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT generation FROM retrieval_generations WHERE index_name = %s AND session_key = %s",
+                (index_name, session_key)
+            )
+            row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else 0
+    finally:
+        conn.close()
+
+
+def increment_generation(index_name: str, session_key: str = "") -> Optional[int]:
+    """Sayğacı atomik artırır və yeni dəyəri qaytarır. DB əlçatmazdırsa None."""
+    conn = get_table_connection(CREATE_RETRIEVAL_GENERATIONS_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO retrieval_generations (index_name, session_key, generation)
+                VALUES (%s, %s, 1)
+                ON CONFLICT (index_name, session_key) DO UPDATE
+                SET generation = retrieval_generations.generation + 1, updated_at = CURRENT_TIMESTAMP
+                RETURNING generation
+                """,
+                (index_name, session_key)
+            )
+            generation = cursor.fetchone()[0]
+        conn.commit()
+        return generation
+    finally:
+        conn.close()
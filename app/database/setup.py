@@ -1,10 +1,18 @@
 # app/database/setup.py
 from app.database.connection import get_db_connection
+from app.database.summaries import CREATE_CHAT_SUMMARIES_TABLE
+from app.database.cache_store import CREATE_GEMINI_CACHE_TABLE
+from app.database.query_log import CREATE_QUERY_LOG_TABLE
+from app.database.compare_blocks import CREATE_COMPARE_BLOCKS_TABLE
+from app.database.retrieval_generations import CREATE_RETRIEVAL_GENERATIONS_TABLE
 
 
 def create_tables():
     """
-    Chat tarixçəsi üçün chat_history cədvəlini yaradır.
+    Chat tarixçəsi üçün chat_history, yığılmış xülasələr üçün chat_summaries,
+    ortaq Gemini keşi üçün gemini_cache, sorğu jurnalı üçün query_log, inkremental Excel
+    müqayisəsi üçün compare_blocks və axtarış keşinin ortaq generasiyaları üçün
+    retrieval_generations cədvəllərini yaradır.
     """
     conn = get_db_connection()
     if conn is None:
@@ -26,8 +34,13 @@ def create_tables():
 
     try:
         cursor.execute(create_chat_history_table)
+        cursor.execute(CREATE_CHAT_SUMMARIES_TABLE)
+        cursor.execute(CREATE_GEMINI_CACHE_TABLE)
+        cursor.execute(CREATE_QUERY_LOG_TABLE)
+        cursor.execute(CREATE_COMPARE_BLOCKS_TABLE)
+        cursor.execute(CREATE_RETRIEVAL_GENERATIONS_TABLE)
         conn.commit()
-        print("✅ chat_history cədvəli uğurla yaradıldı və ya mövcuddur.")
+        print("✅ chat_history, chat_summaries, gemini_cache, query_log, compare_blocks və retrieval_generations cədvəlləri uğurla yaradıldı və ya mövcuddur.")
     except Exception as e:
         print(f"Cədvəl yaratma xətası: {e}")
         conn.rollback()
@@ -0,0 +1,79 @@
+# app/database/summaries.py
+from typing import Optional, Tuple
+
+from app.database.connection import get_table_connection
+
+CREATE_CHAT_SUMMARIES_TABLE = """
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    session_id VARCHAR(255) PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_messages INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def get_summary(session_id: str) -> Optional[Tuple[str, int]]:
+    """
+    Sessiyanın yığılmış xülasəsini və xülasəyə daxil edilmiş mesaj sayını qaytarır.
+    Xülasə yoxdursa ("", 0); DB əlçatmazdırsa None.
+    """
+    conn = get_table_connection(CREATE_CHAT_SUMMARIES_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT summary, summarized_messages FROM chat_summaries WHERE session_id = %s",
+                (session_id,)
+            )
+            row = cursor.fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+    finally:
+        conn.close()
+
+
+def save_summary(session_id: str, summary: str, summarized_messages: int) -> bool:
+    """
+    Xülasəni yazır. Paralel yeniləmələrdə köhnə xülasənin yenisinin üzərinə yazılmaması üçün
+    yalnız daha çox mesajı əhatə edən xülasə saxlanılır.
+    """
+    conn = get_table_connection(CREATE_CHAT_SUMMARIES_TABLE)
+    if conn is None:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO chat_summaries (session_id, summary, summarized_messages, updated_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (session_id) DO UPDATE
+                SET summary = EXCLUDED.summary,
+                    summarized_messages = EXCLUDED.summarized_messages,
+                    updated_at = EXCLUDED.updated_at
+                WHERE chat_summaries.summarized_messages < EXCLUDED.summarized_messages
+                """,
+                (session_id, summary, summarized_messages)
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Xülasə yazma xətası: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def delete_summary(session_id: str) -> Optional[bool]:
+    """Sessiya tarixçəsi sıfırlananda onun xülasəsini də silir."""
+    conn = get_table_connection(CREATE_CHAT_SUMMARIES_TABLE)
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_summaries WHERE session_id = %s", (session_id,))
+        conn.commit()
+        return True
+    finally:
+        conn.close()
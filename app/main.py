@@ -1,75 +1,157 @@
 import os
+import time
+import asyncio
 import logging
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Header, BackgroundTasks, Request
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from urllib.parse import quote_plus
-from langchain_community.chat_message_histories import SQLChatMessageHistory
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # RAG Servisindən lazım olan bütün funksiyaları import edirik
+# (rag_service ağır asılılıqları ilk istifadədə yükləyir, ona görə bu import ucuzdur)
 from app.rag.rag_service import (
     process_and_index_file,
 extract_excel_context_for_comparison,
     search_knowledge_base,
     search_standards_base,
+    batch_search_contexts,
     create_llm_client,
-    index_standards_from_directory,
-    create_pipeline_if_not_exists
+    index_standards_from_directory
 )
+from app.rag.disclosure_catalog import format_gap_table
+from app.rag.incremental_compare import analyze_workbook_gaps
+from app.rag.package_ingest import PackageError, collect_package_files, ingest_package, read_uploads, shutdown_parse_pool
+from app.rag.gemini_scheduler import DeadlineExceeded, get_scheduler, gemini_lane, LANE_COMPARE, LANE_INGESTION
+from app.rag.standards_router import standards_router_snapshot
+from app.startup_report import lazy_import, timed_phase, startup_report
+from app.profiling import PROFILING_ENABLED, ProfilingMiddleware, profile_store, thread_pool_executor
+from app.admission import (
+    CHAT_BATCH_CONCURRENCY, AdmissionMiddleware, admission_snapshot, deadline_http_error, request_thread_budget
+)
+from app.query_log import query_log_writer, query_trace, stage, start_trace
+from app.rag.retrieval_cache import retrieval_cache
+from app.rag.gemini_cache import cache_snapshot, warm_caches
+from app.database.connection import close_pool
+from app.rag.conversation_summary import format_summary_context, record_history_tokens, summary_stats, update_summary
 
-load_dotenv()
+if TYPE_CHECKING:
+    from langchain_community.chat_message_histories import SQLChatMessageHistory
 
-from sqlalchemy import create_engine
+load_dotenv()
 
 # PostgreSQL Bağlantısı üçün Environment Variable-lardan istifadə edilməsi tövsiyə olunur
 DB_URL = os.getenv("DB_URL")
 OPENSEARCH_HOST = os.getenv("OPENSEARCH_HOSTS")  # <<< Düzgün Env Var adı
 OPENSEARCH_INDEX = os.getenv("OPENSEARCH_INDEX")
 
-# Engine yaradılması
-engine = create_engine(DB_URL)
-connection = engine.connect()
-print("PostgreSQL bağlantısı uğurla yoxlandı.")
-connection.close()
-
-print(f"DEBUG URL: {DB_URL}")
-
-app = FastAPI()
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", 5))
+DB_CONNECT_BACKOFF = float(os.getenv("DB_CONNECT_BACKOFF", 1.0))
+# Standartların yoxlanılması/indekslənməsi worker-in işə düşməsini gecikdirməsin deyə fon thread-də aparılır
+STANDARDS_BOOTSTRAP_ON_STARTUP = os.getenv("STANDARDS_BOOTSTRAP_ON_STARTUP", "true").lower() == "true"
 
+logger = logging.getLogger(__name__)
 
-# --- TƏTBİQİN BAŞLANĞIC DÜZƏLİŞİ (STARTUP EVENT) ---
-@app.on_event("startup")
-async def startup_event():
-    # 1. Pipeline-ı yaratmağa çalışırıq
-    print("INFO: Checking/Creating OpenSearch Pipeline...")
-    create_pipeline_if_not_exists()
 
-    # 2. Başlanğıc yolu təyin edilir
+def check_database_connection() -> bool:
+    """PostgreSQL bağlantısını yoxlayır; müvəqqəti əlçatmazlıqda eksponensial gözləmə ilə təkrar cəhd edir."""
+    create_engine = lazy_import("sqlalchemy", "create_engine")
+    engine = create_engine(DB_URL)
+    try:
+        for attempt in range(1, DB_CONNECT_RETRIES + 1):
+            try:
+                connection = engine.connect()
+                connection.close()
+                print("PostgreSQL bağlantısı uğurla yoxlandı.")
+                return True
+            except Exception as e:
+                print(f"WARNING: PostgreSQL bağlantısı uğursuz oldu ({attempt}/{DB_CONNECT_RETRIES}): {e}")
+                if attempt < DB_CONNECT_RETRIES:
+                    time.sleep(DB_CONNECT_BACKOFF * (2 ** (attempt - 1)))
+        print("ERROR: PostgreSQL əlçatmazdır. Tətbiq işə düşür, lakin tarixçə endpointləri xəta verə bilər.")
+        return False
+    finally:
+        engine.dispose()
+
+
+def bootstrap_standards():
+    # 1. Başlanğıc yolu təyin edilir
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-    # 3. 'standards_data' qovluğuna nisbi yol təyin edilir
+    # 2. 'standards_data' qovluğuna nisbi yol təyin edilir
     STANDARDS_DIR = os.path.join(BASE_DIR, "..", "standards_data")
 
-    # 4. İndeksləmə funksiyasını çağırırıq
+    # 3. İndeksləmə funksiyasını çağırırıq
     print(f"INFO: Searching for standards in: {STANDARDS_DIR}")
-    index_standards_from_directory(STANDARDS_DIR)
+    with timed_phase("standards_bootstrap"), gemini_lane(LANE_INGESTION):
+        index_standards_from_directory(STANDARDS_DIR)
+
+
+# --- TƏTBİQİN BAŞLANĞICI (LIFESPAN) ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Endpoint-lərin bloklayan işi (axtarış, Gemini, PostgreSQL) asyncio.to_thread ilə bu executor-da icra olunur
+    asyncio.get_running_loop().set_default_executor(
+        thread_pool_executor(max_workers=request_thread_budget(), thread_name_prefix="request")
+    )
+
+    with timed_phase("database_check"):
+        await asyncio.to_thread(check_database_connection)
+
+    if STANDARDS_BOOTSTRAP_ON_STARTUP:
+        threading.Thread(target=bootstrap_standards, name="standards-bootstrap", daemon=True).start()
 
+    # Yeni worker ortaq keşin ən son girişləri ilə "isti" başlayır (startup-ı gözlətmir)
+    threading.Thread(target=warm_caches, name="cache-warmup", daemon=True).start()
 
-def get_history_manager(session_id: str) -> SQLChatMessageHistory:
+    print(f"INFO: Startup hesabatı: {startup_report()}")
+    yield
+
+    # Növbədə qalan sorğu jurnalı qeydləri yazılır
+    await asyncio.to_thread(query_log_writer.close)
+    shutdown_parse_pool()
+    close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Profilləşdirmə yalnız açıq şəkildə aktivləşdirildikdə qoşulur (söndürüldükdə sıfır yük)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Endpoint sinfi üzrə paralellik/növbə limitləri və sorğu deadline-ı (ən xarici qat: rədd edilən sorğu heç nə işlətmir)
+app.add_middleware(AdmissionMiddleware)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    # Endpoint-in öz xəta blokundan kənarda keçən deadline da 500 deyil, 503 + Retry-After qaytarır
+    return await http_exception_handler(request, deadline_http_error(exc))
+
+
+def get_history_manager(session_id: str) -> "SQLChatMessageHistory":
     global DB_URL
+    SQLChatMessageHistory = lazy_import("langchain_community.chat_message_histories", "SQLChatMessageHistory")
     return SQLChatMessageHistory(
         session_id=session_id,
         connection=DB_URL
     )
 
 
-def format_history_for_prompt(history_manager: SQLChatMessageHistory, limit: int = 3) -> str:
+def format_history_for_prompt(history_manager: "SQLChatMessageHistory", limit: int = 3) -> str:
     """
     PostgreSQL bazasından son 'limit' sayda mesajı oxuyur və prompt üçün formatlayır.
     """
-    messages = history_manager.messages[-limit:]
+    return format_messages_for_prompt(history_manager.messages[-limit:])
+
 
+def format_messages_for_prompt(messages) -> str:
     formatted_history = "--- KEÇMİŞ ÇAT MƏLUMATI ---\n"
     if not messages:
         return ""
@@ -81,6 +163,23 @@ def format_history_for_prompt(history_manager: SQLChatMessageHistory, limit: int
     return formatted_history + "-------------------------\n\n"
 
 
+def build_history_context(history_manager: "SQLChatMessageHistory", session_id: str) -> str:
+    """
+    Prompt üçün sabit ölçülü tarixçə: sessiyanın yığılmış xülasəsi + yalnız son istifadəçi sualı.
+    Xülasə oxuna bilmirsə, köhnə formata (son 3 xam mesaj) qayıdılır.
+    """
+    messages = history_manager.messages
+    legacy_history = format_messages_for_prompt(messages[-3:])
+    try:
+        history = format_summary_context(messages, session_id)
+    except Exception as e:
+        logger.warning(f"Sessiya xülasəsi oxunmadı, son mesajlardan istifadə olunur: {e}")
+        return legacy_history
+
+    record_history_tokens(history, legacy_history)
+    return history
+
+
 # --- Pydantic Modelləri ---
 class ChatRequest(BaseModel):
     session_id: str
@@ -103,6 +202,45 @@ async def read_root():
     return {"message": "RAG FastAPI Service is running."}
 
 
+# --- Metrics: Gemini növbə dərinliyi, paralellik limiti və throttling ---
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "gemini": get_scheduler().snapshot(),
+        "startup": startup_report(),
+        "standards_router": standards_router_snapshot(),
+        "conversation": summary_stats(),
+        "retrieval_cache": retrieval_cache.snapshot(),
+        "gemini_cache": cache_snapshot(),
+        "query_log": query_log_writer.snapshot(),
+        "admission": admission_snapshot(),
+    }
+
+
+# --- ADMIN: Profillər (PROFILING_ENABLED=true, sorğuda `X-Profile: 1` və ya PROFILE_SAMPLE_RATE) ---
+def check_admin_token(x_admin_token: Optional[str]):
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token yanlışdır.")
+
+
+@app.get("/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return {"profiling_enabled": PROFILING_ENABLED, "profiles": profile_store.list()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "speedscope", x_admin_token: Optional[str] = Header(None)):
+    """Profili speedscope JSON (default) və ya collapsed-stack (`format=collapsed`) formatında qaytarır."""
+    check_admin_token(x_admin_token)
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profil '{profile_id}' tapılmadı.")
+    if format == "collapsed":
+        return PlainTextResponse(profile.to_collapsed())
+    return profile.to_speedscope()
+
+
 # --- Sənəd Yükləmə Endpointi (EXCEL DƏSTƏYİ VƏ LİMİT UYARISI ƏLAVƏ OLUNDU) ---
 @app.post("/upload-document")
 async def upload_document(
@@ -125,7 +263,7 @@ async def upload_document(
             detail=f"Yalnız PDF, XLSX və XLS sənədləri qəbul edilir. Göndərilən tip: {file.content_type}"
         )
 
-    success = process_and_index_file(file, session_id)
+    success = await asyncio.to_thread(process_and_index_file, file, session_id)
 
     if success:
         return {
@@ -139,11 +277,59 @@ async def upload_document(
         )
 
 
+@app.post("/upload-documents")
+async def upload_documents(
+        files: List[UploadFile] = File(...),
+        session_id: str = Form(...)
+):
+    """
+    Hesabat paketini (bir neçə PDF/Excel faylı və ya ZIP arxivi) bir sorğuda indeksləyir.
+    Fayllar paralel parse olunur, chunk-lar ortaq embedding batch-lərində vektorlaşdırılır
+    və rag_knowledge_base-ə bir bulk əməliyyatı ilə yazılır.
+    """
+    # Tip fayl adının uzantısına görə yoxlanılır — ZIP-in content_type-ı brauzerdən asılı olaraq fərqlənir
+    try:
+        uploads = await read_uploads(files)
+        # ZIP açılması (UPLOAD_MAX_UNPACKED_MB-a qədər) event loop-u bloklamasın
+        package_files, skipped = await asyncio.to_thread(collect_package_files, uploads)
+    except PackageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not package_files:
+        raise HTTPException(
+            status_code=400,
+            detail="Paketdə PDF, XLSX və ya XLS sənədi tapılmadı (ZIP arxivləri açılır)."
+        )
+
+    try:
+        result = await asyncio.to_thread(ingest_package, package_files, session_id)
+    except Exception as e:
+        logger.exception(f"KRİTİK HATA (Paket yükləmə): {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Paketin emalı zamanı daxili xəta baş verdi. OpenSearch və Gemini əlaqəsini yoxlayın."
+        )
+
+    indexed = [entry for entry in result["files"] if entry["status"] == "indexed"]
+    if not indexed:
+        raise HTTPException(
+            status_code=500,
+            detail={"message": "Paketdəki heç bir fayl emal oluna bilmədi.", "files": result["files"]}
+        )
+
+    return {
+        "message": f"{len(indexed)}/{len(package_files)} fayl {session_id} sessiyası üçün indeksləndi.",
+        **result,
+        "skipped": skipped,
+    }
+
+
 # ----     Excel fayl yuklenmesi
 # from main import get_history_manager
 
 @app.post("/compare-excel")
 async def compare_excel_with_standards(
+        background_tasks: BackgroundTasks,
         file: UploadFile = File(...),
         message: str = Form("Excel faylındakı məlumatı mövcud standartlarla müqayisə et və çatışmazlıqları göstər."),
         session_id: str = Form(...)
@@ -165,54 +351,92 @@ async def compare_excel_with_standards(
             detail=f"Yalnız Excel sənədləri (.xlsx, .xls) qəbul edilir. Göndərilən tip: {file.content_type}"
         )
 
-    # 2. Excel faylından konteksti çıxar
-    excel_context = await extract_excel_context_for_comparison(file)
-
-    if not excel_context:
-        raise HTTPException(
-            status_code=500,
-            detail="Excel faylının emalı uğursuz oldu. Faylın formatını yoxlayın."
-        )
+    # Bu endpointin bütün Gemini çağırışları compare zolağındadır (chat-dan aşağı prioritet)
+    with gemini_lane(LANE_COMPARE), query_trace("/compare-excel", session_id, message,
+                                                 payload={"message": message, "filename": file.filename}):
+        return await _compare_excel(file, message, session_id, background_tasks)
 
-    # 3. OpenSearch Standartlar bazasında axtarış (Müqayisə üçün Standart Konteksti)
-    standards_context_list = search_standards_base(message)
-    standards_context = "\n---\n".join(
-        standards_context_list) if standards_context_list else "Standartlar bazasında relevant məlumat tapılmadı."
 
-    # 4. İxtisaslaşmış Müqayisə Prompunu təyin et
-    system_prompt = (
-        "Sən yüksək səviyyəli ESG Auditörsən. Sənin tapşırığın **Standartlar (Kontekst 2)** tərəfindən tələb olunan hər bir elementi "
-        "**Yüklənən Excel Məlumatı (Kontekst 1)** ilə müqayisə etməkdir. "
-        "Cavabında, Kontekst 2-də tələb olunan, lakin Kontekst 1-də **tapılmayan (çatışmayan)** məlumat nöqtələrinin **dəqiq siyahısını** ver (Gap Analysis). "
-        "Nəticəni yalnız bir **Markdown Cədvəli** formatında təqdim et. Başlıqlar: [Tələb Olunan Standart], [Excel-də Çatışmayan Məlumat]. "
-    )
+async def _compare_excel(file: UploadFile, message: str, session_id: str, background_tasks: BackgroundTasks):
+    # 2. Deterministik boşluq analizi: Excel sətirləri açıqlama kataloquna uyğunlaşdırılır.
+    # Eyni sessiyada yenidən göndərilən faylda yalnız dəyişmiş vərəq/sətir blokları yenidən hesablanır.
+    gaps, compare_stats = None, None
+    try:
+        file_content = await file.read()
+        with stage("gap_analysis"):
+            gaps, compare_stats = await asyncio.to_thread(analyze_workbook_gaps, file_content, message, session_id)
+    except DeadlineExceeded as e:
+        raise deadline_http_error(e)
+    except Exception as e:
+        print(f"WARNING: Kataloq əsaslı boşluq analizi alınmadı, standart axtarışına keçilir: {e}")
+
+    if gaps is None:
+        # 3. Kataloq yoxdursa Excel konteksti LLM müqayisəsi üçün çıxarılır
+        await file.seek(0)
+        with stage("excel_parse"):
+            excel_context = await extract_excel_context_for_comparison(file)
+
+        if not excel_context:
+            raise HTTPException(
+                status_code=500,
+                detail="Excel faylının emalı uğursuz oldu. Faylın formatını yoxlayın."
+            )
 
-    # 5. Promptun hazırlanması
-    user_prompt = (
-        f"Müqayisə Sorğusu: {message}\n\n"
-        f"KONTEKST 1 (Yüklənən Excel Məlumatı):\n{excel_context}\n\n"
-        f"KONTEKST 2 (Standartlar Bazası / ESG Standartları):\n{standards_context}\n\n"
-    )
+    if gaps is not None:
+        # 4-5. LLM yalnız hazır nəticəni ifadə edir
+        system_prompt = (
+            "Sən yüksək səviyyəli ESG Auditörsən. Boşluq analizi (Gap Analysis) artıq açıqlama kataloqu əsasında hesablanıb. "
+            "Sənin tapşırığın yalnız verilmiş nəticəni aydın ifadə etməkdir: yeni tələb əlavə etmə və siyahıdan heç nəyi çıxarma. "
+            "Nəticəni yalnız bir **Markdown Cədvəli** formatında təqdim et. Başlıqlar: [Tələb Olunan Standart], [Excel-də Çatışmayan Məlumat]. "
+        )
+        covered = ", ".join(f"{e['standard']} {e['disclosure_id']}" for e in gaps["covered"]) or "-"
+        missing_heading = "ÇATIŞMAYAN AÇIQLAMALAR (Kataloq əsasında)"
+        truncated = gaps.get("truncated")
+        if truncated:
+            # Fayl qismən yoxlanılıb — siyahı qəti çatışmazlıq kimi təqdim edilmir
+            system_prompt += (
+                f"Faylın yalnız ilk {truncated['rows_analyzed']} sətri (cəmi {truncated['rows_total']}) yoxlanılıb: "
+                "siyahıdakı açıqlamaları qəti çatışmazlıq kimi deyil, yoxlanılmamış sətirlərdə ola biləcək "
+                "və əl ilə yoxlanılmalı açıqlamalar kimi təqdim et və bunu cavabda açıq qeyd et. "
+            )
+            missing_heading = (f"TAPILMAYAN AÇIQLAMALAR (yalnız ilk {truncated['rows_analyzed']} / "
+                               f"{truncated['rows_total']} sətir yoxlanılıb, qəti deyil)")
+        user_prompt = (
+            f"Müqayisə Sorğusu: {message}\n\n"
+            f"{missing_heading}:\n{format_gap_table(gaps)}\n\n"
+            f"Excel-də əhatə olunan açıqlamalar: {covered}\n\n"
+        )
+    else:
+        # 3. OpenSearch Standartlar bazasında axtarış (Müqayisə üçün Standart Konteksti)
+        standards_context_list = await asyncio.to_thread(search_standards_base, message)
+        standards_context = "\n---\n".join(
+            standards_context_list) if standards_context_list else "Standartlar bazasında relevant məlumat tapılmadı."
 
-    # 6. Modelə Göndərmə və Cavab Alma
-    try:
-        llm = create_llm_client(os.getenv("GEMINI_API_KEY"))
-        # response = (llm.invoke(input=user_prompt, system=system_prompt))
-        response = llm.invoke(
-            input=user_prompt,
-            config={"system_instruction": system_prompt}
+        # 4. İxtisaslaşmış Müqayisə Prompunu təyin et
+        system_prompt = (
+            "Sən yüksək səviyyəli ESG Auditörsən. Sənin tapşırığın **Standartlar (Kontekst 2)** tərəfindən tələb olunan hər bir elementi "
+            "**Yüklənən Excel Məlumatı (Kontekst 1)** ilə müqayisə etməkdir. "
+            "Cavabında, Kontekst 2-də tələb olunan, lakin Kontekst 1-də **tapılmayan (çatışmayan)** məlumat nöqtələrinin **dəqiq siyahısını** ver (Gap Analysis). "
+            "Nəticəni yalnız bir **Markdown Cədvəli** formatında təqdim et. Başlıqlar: [Tələb Olunan Standart], [Excel-də Çatışmayan Məlumat]. "
         )
-        final_response = response.content
 
-        # 7. 💾 SESSION MANAGEMENT: Çat Keçmişini PostgreSQL-ə yazırıq (YENİ HİSSƏ)
-        history_manager = get_history_manager(session_id)
+        # 5. Promptun hazırlanması
+        user_prompt = (
+            f"Müqayisə Sorğusu: {message}\n\n"
+            f"KONTEKST 1 (Yüklənən Excel Məlumatı):\n{excel_context}\n\n"
+            f"KONTEKST 2 (Standartlar Bazası / ESG Standartları):\n{standards_context}\n\n"
+        )
 
+    # 6-7. Modelə göndərmə və tarixçəyə yazma (bloklayan çağırışlar thread-də)
+    try:
         # İstifadəçinin sorğusu: Fayl adı + Mətn sorğusu
         user_message_to_save = f"[EXCEL FAYLI YÜKLƏNDİ: {file.filename}] Sorğu: {message}"
+        final_response = await asyncio.to_thread(
+            _generate_comparison, system_prompt, user_prompt, session_id, user_message_to_save
+        )
 
-        # Sorğunu və Cavabı PostgreSQL-ə yaz
-        history_manager.add_user_message(user_message_to_save)
-        history_manager.add_ai_message(final_response)
+        # Sessiya xülasəsi fonda yenilənir
+        background_tasks.add_task(update_summary, session_id, get_history_manager)
 
         # --------------------------------------------------------------------
 
@@ -220,15 +444,37 @@ async def compare_excel_with_standards(
             "message": "Müqayisə tamamlandı.",
             "excel_filename": file.filename,
             "session_id": session_id,
-            "comparison_result": final_response
+            "comparison_result": final_response,
+            "missing_disclosures": [
+                f"{e['standard']} {e['disclosure_id']}" for e in gaps["missing"]
+            ] if gaps is not None else None,
+            "gap_analysis_truncated": gaps.get("truncated") if gaps is not None else None,
+            "incremental": compare_stats
         }
 
+    except DeadlineExceeded as e:
+        raise deadline_http_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"LLM prosesi zamanı ve PostgreSql zamani daxili xəta baş verdi: {e}"
         )
 
+
+def _generate_comparison(system_prompt: str, user_prompt: str, session_id: str, user_message_to_save: str) -> str:
+    llm = create_llm_client(os.getenv("GEMINI_API_KEY"))
+    response = llm.invoke(
+        input=user_prompt,
+        config={"system_instruction": system_prompt}
+    )
+    final_response = response.content
+
+    # 💾 SESSION MANAGEMENT: Sorğunu və Cavabı PostgreSQL-ə yaz
+    history_manager = get_history_manager(session_id)
+    history_manager.add_user_message(user_message_to_save)
+    history_manager.add_ai_message(final_response)
+    return final_response
+
 # ----     Son Excel setri
 
 # --- ÇAT TARİXÇƏSİNİ GÖSTƏRƏN ENDPOINT ---
@@ -238,12 +484,7 @@ async def get_chat_history(session_id: str):
     Verilmiş session_id üçün bütün chat keçmişini bazadan oxuyur.
     """
     try:
-        history_manager = get_history_manager(session_id)
-
-        messages_list = [
-            {"type": msg.type, "content": msg.content}
-            for msg in history_manager.messages
-        ]
+        messages_list = await asyncio.to_thread(_read_history, session_id)
 
         return HistoryResponse(
             session_id=session_id,
@@ -257,6 +498,10 @@ async def get_chat_history(session_id: str):
         )
 
 
+def _read_history(session_id: str) -> List[Dict]:
+    return [{"type": msg.type, "content": msg.content} for msg in get_history_manager(session_id).messages]
+
+
 # --- SESSION HISTORY SIFIRLAMA ENDPOINTİ (YENİ ƏLAVƏ OLUNDU) ---
 @app.post("/reset")
 async def reset_chat_history(request: ChatRequest):
@@ -264,10 +509,7 @@ async def reset_chat_history(request: ChatRequest):
     Verilmiş session_id üçün bütün chat tarixçəsini sıfırlayır (bazadan silir).
     """
     try:
-        history_manager = get_history_manager(request.session_id)
-
-        # history_manager obyektinin təmizləmə metodunu çağırırıq
-        history_manager.clear()
+        await asyncio.to_thread(_clear_session, request.session_id)
 
         return {
             "message": f"Sessiya '{request.session_id}' üçün chat tarixçəsi uğurla sıfırlandı.",
@@ -281,7 +523,15 @@ async def reset_chat_history(request: ChatRequest):
         )
 
 
-logger = logging.getLogger(__name__)
+def _clear_session(session_id: str):
+    # history_manager obyektinin təmizləmə metodunu çağırırıq
+    get_history_manager(session_id).clear()
+
+    # Yığılmış xülasə və əvvəlki Excel müqayisə blokları da silinir
+    from app.database.summaries import delete_summary
+    from app.database.compare_blocks import delete_block_scores
+    delete_summary(session_id)
+    delete_block_scores(session_id)
 
 
 # Fərz edilən Pydantic Modelləri
@@ -313,68 +563,109 @@ def clean_llm_response(raw_content: str) -> str:
     return cleaned
 
 
+MARKDOWN_CLEAN = "Cavabı tamamilə formatlamadan, yalnız təmiz mətn kimi təqdim et. Markdown formatından (**, *, #) qaç."
+
+
+def is_gap_question(message: str) -> bool:
+    lowered = message.lower()
+    return "çatışmazlıq" in lowered or "tapılmadı" in lowered or "gap" in lowered
+
+
+def build_chat_prompts(message: str, user_context_list: List[str], standards_context_list: List[str],
+                       chat_history: str) -> Tuple[str, str, bool]:
+    """
+    Sualın növünə görə ixtisaslaşmış sistem promptunu seçir və istifadəçi promptunu hazırlayır.
+    Kataloq əsaslı deterministik boşluq analizi yalnız /compare-excel-də (bütün iş kitabı üzrə) aparılır:
+    /chat-da yalnız bir neçə tapılmış chunk var və onlara görə "çatışmayan" siyahısı yanlış olardı.
+    Qaytarır: (system_prompt, user_prompt, is_table_required)
+    """
+    user_context = "\n---\n".join(
+        user_context_list) if user_context_list else "İstifadəçi sənədində relevant məlumat tapılmadı."
+    standards_context = "\n---\n".join(
+        standards_context_list) if standards_context_list else "Standartlar bazasında relevant məlumat tapılmadı."
+
+    # İXTİSASLAŞMIŞ PROMPTLARIN SEÇİLMƏSİ
+    is_table_required = False
+    lowered = message.lower()
+
+    if is_gap_question(message):
+        is_table_required = True
+        # Tələb: Specialized Prompt - Gap Detection
+        system_prompt = (
+            "Sən yüksək səviyyəli ESG Auditörsən. Sənin əsas tapşırığın **Standartlar (Kontekst 2)** tərəfindən tələb olunan hər bir elementi **Şirkət Məlumatı (Kontekst 1)** ilə müqayisə etməkdir. "
+            "Cavabında, Kontekst 2-də tələb olunan, lakin Kontekst 1-də **tapılmayan (çatışmayan)** məlumat nöqtələrinin **dəqiq siyahısını** ver. "
+            "Nəticəni bir **Markdown Cədvəli** formatında təqdim et. Cədvəl yaratmaq üçün lazım olan bütün Markdown sintaksisindən istifadə etməyə icazə verilir."
+        )
+
+    elif "dəqiqliyi" in lowered or "formatı" in lowered or "rəqəmsal" in lowered or "quote" in lowered:
+        is_table_required = True
+        # Tələb: Specialized Prompt - Line-by-Line Analysis
+        system_prompt = (
+            "Sən SASB/ISSB standartları üzrə Dəqiqlik Analitiksən. Sənin vəzifən istifadəçinin sualı əsasında Kontekst 1-dən **dəqiq sətiri çıxarmaq** (Quote the exact line) və Kontekst 2-də tələb olunan **spesifik numerik (rəqəmsal) və ya formatlama** tələblərinə uyğun olub-olmadığını yoxlamaqdır. "
+            "Cavabını bir **Markdown Cədvəlində**, təhlil etdiyin **dəqiq sətiri qeyd edərək** təqdim et. Cədvəl [Tələb Olunan Standart], [Şirkət Mətnindən Dəqiq Sitat], [Uyğunluq Statusu] sütunlarından ibarət olsun. "
+            "Cədvəl yaratmaq üçün lazım olan bütün Markdown sintaksisindən istifadə etməyə icazə verilir."
+        )
+
+    else:
+        # Ümumi Müqayisə Promptu
+        system_prompt = (
+                            "Sən Keyfiyyət Təminatı üzrə Ekspert Auditörsən. Sənin məqsədin verilmiş kontekstləri müqayisə etməkdir. Keçmiş məlumatları nəzərə alaraq, Azərbaycan dilində ətraflı cavab ver."
+                        ) + MARKDOWN_CLEAN
+
+    user_prompt = (
+            chat_history +
+            f"Cari Sual: {message}\n\n"
+            f"KONTEKST 1 (Şirkət Məlumatı / İstifadəçi Faylı):\n{user_context}\n\n"
+            f"KONTEKST 2 (Standartlar Bazası / ESG Standartları):\n{standards_context}\n\n"
+    )
+
+    return system_prompt, user_prompt, is_table_required
+
+
+def finalize_llm_response(raw_response: str, is_table_required: bool) -> str:
+    """Cədvəl tələb olunmayanda (təmiz mətn) Markdown ulduzlarını təmizləyir."""
+    if not is_table_required:
+        return clean_llm_response(raw_response)
+    # Cədvəl formatı tələb olunan yerlərdə (Markdown-a ehtiyac var)
+    return raw_response
+
+
+def no_context_response(session_id: str) -> str:
+    return f"Sessiya '{session_id}' üçün OpenSearch-də relevant kontekst tapılmadı."
+
+
 # Fərz edilir ki, @app.post('/chat') burada yerləşir
 @app.post("/chat", response_model=ChatResponse)
-async def chat_with_rag(request: ChatRequest):
+async def chat_with_rag(request: ChatRequest, background_tasks: BackgroundTasks):
     """
     Multi-Source RAG, Çat Keçmişi və İxtisaslaşmış Audit Promtları ilə cavab verir.
     """
+    with query_trace("/chat", request.session_id, request.message,
+                     payload={"session_id": request.session_id, "message": request.message}):
+        # Axtarış, Gemini və PostgreSQL çağırışları bloklayandır: thread-də (kontekst — zolaq, deadline,
+        # jurnal qeydi — asyncio.to_thread ilə ötürülür), event loop digər sorğular üçün boş qalır
+        return await asyncio.to_thread(_chat, request, background_tasks)
+
+
+def _chat(request: ChatRequest, background_tasks: BackgroundTasks) -> ChatResponse:
     try:
         # 1. RETRIEVER LOGIC: Hər iki bazadan konteksti çıxar
         user_context_list = search_knowledge_base(request.message, request.session_id)
         standards_context_list = search_standards_base(request.message)
 
         if not user_context_list and not standards_context_list:
-            ai_response = f"Sessiya '{request.session_id}' üçün OpenSearch-də relevant kontekst tapılmadı."
-            return ChatResponse(session_id=request.session_id, ai_response=ai_response)
-
-        user_context = "\n---\n".join(
-            user_context_list) if user_context_list else "İstifadəçi sənədində relevant məlumat tapılmadı."
-        standards_context = "\n---\n".join(
-            standards_context_list) if standards_context_list else "Standartlar bazasında relevant məlumat tapılmadı."
+            return ChatResponse(session_id=request.session_id, ai_response=no_context_response(request.session_id))
 
         # 2. SESSION MANAGEMENT: History Manager yaradılır
         history_manager = get_history_manager(request.session_id)
 
-        # Keçmişi formatlayıb prompta əlavə etmək üçün oxuyur
-        chat_history = format_history_for_prompt(history_manager, limit=3)
-
-        # YENİ MARKDOWN NƏZARƏTİ
-        MARKDOWN_CLEAN = "Cavabı tamamilə formatlamadan, yalnız təmiz mətn kimi təqdim et. Markdown formatından (**, *, #) qaç."
-
-        # 3. İXTİSASLAŞMIŞ PROMPTLARIN SEÇİLMƏSİ
-        is_table_required = False
+        # Keçmiş: yığılmış xülasə + son istifadəçi sualı (sabit ölçülü prompt)
+        with stage("history"):
+            chat_history = build_history_context(history_manager, request.session_id)
 
-        if "çatışmazlıq" in request.message.lower() or "tapılmadı" in request.message.lower() or "gap" in request.message.lower():
-            is_table_required = True
-            # Tələb: Specialized Prompt - Gap Detection
-            system_prompt = (
-                "Sən yüksək səviyyəli ESG Auditörsən. Sənin əsas tapşırığın **Standartlar (Kontekst 2)** tərəfindən tələb olunan hər bir elementi **Şirkət Məlumatı (Kontekst 1)** ilə müqayisə etməkdir. "
-                "Cavabında, Kontekst 2-də tələb olunan, lakin Kontekst 1-də **tapılmayan (çatışmayan)** məlumat nöqtələrinin **dəqiq siyahısını** ver. "
-                "Nəticəni bir **Markdown Cədvəli** formatında təqdim et. Cədvəl yaratmaq üçün lazım olan bütün Markdown sintaksisindən istifadə etməyə icazə verilir."
-            )
-
-        elif "dəqiqliyi" in request.message.lower() or "formatı" in request.message.lower() or "rəqəmsal" in request.message.lower() or "quote" in request.message.lower():
-            is_table_required = True
-            # Tələb: Specialized Prompt - Line-by-Line Analysis
-            system_prompt = (
-                "Sən SASB/ISSB standartları üzrə Dəqiqlik Analitiksən. Sənin vəzifən istifadəçinin sualı əsasında Kontekst 1-dən **dəqiq sətiri çıxarmaq** (Quote the exact line) və Kontekst 2-də tələb olunan **spesifik numerik (rəqəmsal) və ya formatlama** tələblərinə uyğun olub-olmadığını yoxlamaqdır. "
-                "Cavabını bir **Markdown Cədvəlində**, təhlil etdiyin **dəqiq sətiri qeyd edərək** təqdim et. Cədvəl [Tələb Olunan Standart], [Şirkət Mətnindən Dəqiq Sitat], [Uyğunluq Statusu] sütunlarından ibarət olsun. "
-                "Cədvəl yaratmaq üçün lazım olan bütün Markdown sintaksisindən istifadə etməyə icazə verilir."
-            )
-
-        else:
-            # Ümumi Müqayisə Promptu
-            system_prompt = (
-                                "Sən Keyfiyyət Təminatı üzrə Ekspert Auditörsən. Sənin məqsədin verilmiş kontekstləri müqayisə etməkdir. Keçmiş məlumatları nəzərə alaraq, Azərbaycan dilində ətraflı cavab ver."
-                            ) + MARKDOWN_CLEAN
-
-        # 4. Promptun Hazırlanması
-        user_prompt = (
-                chat_history +
-                f"Cari Sual: {request.message}\n\n"
-                f"KONTEKST 1 (Şirkət Məlumatı / İstifadəçi Faylı):\n{user_context}\n\n"
-                f"KONTEKST 2 (Standartlar Bazası / ESG Standartları):\n{standards_context}\n\n"
+        # 3-4. İxtisaslaşmış promptun seçilməsi və promptun hazırlanması
+        system_prompt, user_prompt, is_table_required = build_chat_prompts(
+            request.message, user_context_list, standards_context_list, chat_history
         )
 
         # 5. Modelə Göndərmə və Cavab Alma
@@ -384,25 +675,25 @@ async def chat_with_rag(request: ChatRequest):
             input=user_prompt,
             config={"system_instruction": system_prompt}
         )
-        raw_response = response.content
 
         # --- Ulduz simvollarının təmizlənməsi ---
-        if not is_table_required:
-            # Yalnız cədvəl tələb olunmayanda (təmiz mətn) təmizləmə aparırıq.
-            final_response = clean_llm_response(raw_response)
-        else:
-            # Cədvəl formatı tələb olunan yerlərdə (Markdown-a ehtiyac var)
-            final_response = raw_response
+        final_response = finalize_llm_response(response.content, is_table_required)
 
         # 6. SESSION MANAGEMENT: Çat Keçmişini PostgreSQL-ə yaziriq
-        history_manager.add_user_message(request.message)
-        history_manager.add_ai_message(final_response)
+        with stage("save_history"):
+            history_manager.add_user_message(request.message)
+            history_manager.add_ai_message(final_response)
+
+        # 7. Sessiya xülasəsi cavab göndərildikdən sonra fonda yenilənir
+        background_tasks.add_task(update_summary, request.session_id, get_history_manager)
 
         return ChatResponse(
             session_id=request.session_id,
             ai_response=final_response
         )
 
+    except DeadlineExceeded as e:
+        raise deadline_http_error(e)
     except Exception as e:
         # --- Gücləndirilmiş Xəta İdarəetməsi ---
         logger.exception(f"KRİTİK HATA (Chat Endpoint): RAG prosesi zamanı gözlənilməyən xəta: {e}")
@@ -412,3 +703,150 @@ async def chat_with_rag(request: ChatRequest):
             status_code=500,
             detail=f"RAG prosesi zamanı daxili xəta baş verdi. Logları və OpenSearch/LLM bağlantılarını yoxlayın. (Xəta növü: {type(e).__name__}, Mesaj: {str(e)[:70]}...)"
         )
+
+
+# --- BATCH ÇAT: Bir sessiya üçün çoxlu sualın bir çağırışda icrası ---
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", 100))
+
+
+class BatchChatRequest(BaseModel):
+    session_id: str
+    messages: List[str]
+    stream: bool = False
+
+
+class BatchChatItem(BaseModel):
+    index: int
+    message: str
+    ai_response: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    session_id: str
+    results: List[BatchChatItem]
+
+
+def _answer_batch_item(llm, index: int, message: str, contexts: Tuple[List[str], List[str]],
+                       chat_history: str, session_id: str) -> BatchChatItem:
+    """Batch-in bir sualı üçün promptu hazırlayır və Gemini cavabını alır (thread daxilində işləyir)."""
+    user_context_list, standards_context_list = contexts
+    if not user_context_list and not standards_context_list:
+        return BatchChatItem(index=index, message=message, ai_response=no_context_response(session_id))
+
+    try:
+        system_prompt, user_prompt, is_table_required = build_chat_prompts(
+            message, user_context_list, standards_context_list, chat_history
+        )
+        response = llm.invoke(
+            input=user_prompt,
+            config={"system_instruction": system_prompt}
+        )
+        return BatchChatItem(index=index, message=message,
+                             ai_response=finalize_llm_response(response.content, is_table_required))
+    except Exception as e:
+        logger.exception(f"Batch çat sualı #{index} uğursuz oldu: {e}")
+        return BatchChatItem(index=index, message=message, error=f"{type(e).__name__}: {str(e)[:200]}")
+
+
+def _prepare_batch(request: BatchChatRequest):
+    # 1. Bütün sualların konteksti: bir embedding çağırışı + bir msearch sorğusu
+    contexts = batch_search_contexts(request.messages, request.session_id)
+
+    # 2. Keçmiş yalnız bir dəfə oxunur
+    history_manager = get_history_manager(request.session_id)
+    with stage("history"):
+        chat_history = build_history_context(history_manager, request.session_id)
+
+    llm = create_llm_client(os.getenv("GEMINI_API_KEY"))
+    return contexts, history_manager, chat_history, llm
+
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest, background_tasks: BackgroundTasks):
+    """
+    Eyni sessiya üçün sual siyahısını bir çağırışda cavablandırır:
+    bütün sorğular bir batch embedding-lə vektorlaşdırılır, axtarışlar bir msearch
+    sorğusu ilə icra olunur, generasiyalar isə məhdud paralelliklə aparılır.
+    Nəticələr sualların sırası ilə qaytarılır (stream=true olduqda NDJSON axını kimi).
+    """
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="Ən azı bir sual göndərilməlidir.")
+    if len(request.messages) > CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bir batch-də maksimum {CHAT_BATCH_MAX_QUESTIONS} sual göndərilə bilər."
+        )
+
+    # Jurnal qeydi cavab (axın daxil) tam göndərildikdən sonra bağlanır
+    trace = start_trace("/chat/batch", request.session_id, "\n".join(request.messages),
+                        payload={"session_id": request.session_id, "messages": request.messages})
+
+    try:
+        contexts, history_manager, chat_history, llm = await asyncio.to_thread(_prepare_batch, request)
+    except DeadlineExceeded as e:
+        if trace is not None:
+            trace.status_code = 503
+            trace.finish()
+        raise deadline_http_error(e)
+    except Exception as e:
+        if trace is not None:
+            trace.status_code = 500
+            trace.finish()
+        logger.exception(f"KRİTİK HATA (Batch Chat Endpoint): {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Batch RAG prosesi zamanı daxili xəta baş verdi. (Xəta növü: {type(e).__name__}, Mesaj: {str(e)[:70]}...)"
+        )
+
+    # 3. Generasiyalar default executor-da (qəbul büdcəsi daxilində) məhdud paralelliklə aparılır;
+    # asyncio.to_thread cari konteksti — zolaq, deadline, profil — thread-ə ötürür
+    slots = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+    async def answer(i: int, message: str) -> BatchChatItem:
+        async with slots:
+            return await asyncio.to_thread(
+                _answer_batch_item, llm, i, message, contexts[i], chat_history, request.session_id
+            )
+
+    tasks = [asyncio.create_task(answer(i, message)) for i, message in enumerate(request.messages)]
+
+    def cancel_pending():
+        # Müştəri axını yarımçıq kəsdikdə başlanmamış generasiyalar Gemini-yə getmir
+        for task in tasks:
+            task.cancel()
+
+    def save_to_history(item: BatchChatItem):
+        if item.ai_response is not None and item.error is None:
+            history_manager.add_user_message(item.message)
+            history_manager.add_ai_message(item.ai_response)
+
+    # Bütün cavablar yazıldıqdan sonra sessiya xülasəsi bir dəfə yenilənir
+    background_tasks.add_task(update_summary, request.session_id, get_history_manager)
+
+    def finish_trace():
+        if trace is not None:
+            trace.finish()
+
+    if request.stream:
+        async def stream_results():
+            try:
+                for task in tasks:
+                    item = await task
+                    await asyncio.to_thread(save_to_history, item)
+                    yield item.model_dump_json() + "\n"
+            finally:
+                cancel_pending()
+                finish_trace()
+
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    try:
+        results = [await task for task in tasks]
+        for item in results:
+            await asyncio.to_thread(save_to_history, item)
+    finally:
+        cancel_pending()
+        finish_trace()
+
+    return BatchChatResponse(session_id=request.session_id, results=results)
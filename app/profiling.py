@@ -0,0 +1,290 @@
+# app/profiling.py
+"""
+Opt-in sorğu profilləşdirməsi (sampling profiler).
+
+PROFILING_ENABLED=true olduqda middleware qoşulur və sorğu ya `X-Profile: 1` başlığı ilə,
+ya da PROFILE_SAMPLE_RATE ehtimalı ilə profilləşdirilir. Profil collapsed-stack və speedscope
+formatlarında yaddaşda saxlanılır və /admin/profiles endpointindən götürülür.
+PROFILE_INGESTION=true olduqda eyni mexanizm rag_service və ingest_standards-dakı indeksləmə
+funksiyalarına da tətbiq olunur.
+
+Yalnız profilə aid thread-lər nümunələnir: profili başladan thread və profil aktiv olan kontekstdən
+thread_pool_executor() (asyncio.to_thread-in default executor-u) ilə göndərilmiş
+işləri icra edən thread-lər — eyni vaxtda işləyən digər sorğular və fon thread-ləri (keş isitmə,
+jurnal yazıcısı, standartların yüklənməsi) profilə düşmür. Stack-lar `thread:<ad>` kökü ilə işarələnir.
+HTTP sorğusunu başladan thread event loop-dur və eyni vaxtda digər sorğulara da xidmət edir — onun
+nümunələri `shared-loop:<ad>` kökü altına düşür və sorğunun öz işi kimi oxunmamalıdır.
+
+Söndürüldükdə heç bir yük yoxdur: middleware qoşulmur, `profiled` dekoratoru funksiyanı dəyişmədən qaytarır.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+import functools
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_INGESTION = os.getenv("PROFILE_INGESTION", "false").lower() == "true"
+PROFILE_HEADER = "x-profile"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", 50))
+# Təyin olunduqda hər profil həm də speedscope JSON faylı kimi bu qovluğa yazılır (CLI ingestion üçün faydalıdır)
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR")
+
+# Gözləmədə olan (boş) thread-lərin stack-ları nümunələrə daxil edilmir
+IDLE_LEAF_FUNCTIONS = {"wait", "select", "_wait_for_tstate_lock", "_worker"}
+
+
+class Profile:
+    """Bir sorğunun/funksiyanın toplanmış stack nümunələri."""
+
+    def __init__(self, profile_id: str, name: str):
+        self.id = profile_id
+        self.name = name
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.interval_ms = PROFILE_INTERVAL_MS
+        self.stacks: Dict[tuple, int] = {}  # (kök -> yarpaq kadrları) -> nümunə sayı
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.stacks.values())
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": self.sample_count,
+        }
+
+    def to_collapsed(self) -> str:
+        """Brendan Gregg collapsed-stack formatı: `kadr1;kadr2;kadr3 say`."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in
+                         sorted(self.stacks.items(), key=lambda kv: -kv[1]))
+
+    def to_speedscope(self) -> Dict:
+        frames: List[Dict] = []
+        frame_index: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame})
+                indices.append(frame_index[frame])
+            samples.append(indices)
+            weights.append(count * self.interval_ms)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "app.profiling",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class ProfileStore:
+    """Son PROFILE_MAX_STORED profili saxlayan yaddaş buferi."""
+
+    def __init__(self, max_size: int = PROFILE_MAX_STORED):
+        self.max_size = max_size
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles.values())]
+
+
+profile_store = ProfileStore()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Cari kontekstin profili — thread_pool_executor() ilə göndərilən işlər onun thread-lərinə əlavə olunur
+active_profiler = contextvars.ContextVar("active_profiler", default=None)
+
+
+class SamplingProfiler:
+    """
+    Fon thread-də `sys._current_frames()` vasitəsilə yalnız profilə aid thread-lərin stack-larını nümunələyir:
+    start() çağıran thread və run_in_thread() ilə qoşulan thread-lər. start(shared=True) — çağıran thread
+    başqa işlərə də xidmət edir (event loop); onun nümunələri ayrıca `shared-loop:` kökü ilə işarələnir.
+    """
+
+    def __init__(self, name: str):
+        self.profile = Profile(uuid.uuid4().hex[:12], name)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.profile.id}", daemon=True)
+        self._started = 0.0
+        self._threads: Dict[int, str] = {}  # ident -> stack-ın kök kadrı ("thread:<ad>" / "shared-loop:<ad>")
+        self._threads_lock = threading.Lock()
+
+    def start(self, shared: bool = False) -> "SamplingProfiler":
+        self._attach("shared-loop" if shared else "thread")
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _attach(self, kind: str = "thread") -> bool:
+        current = threading.current_thread()
+        with self._threads_lock:
+            if current.ident in self._threads:
+                return False
+            self._threads[current.ident] = f"{kind}:{current.name}"
+            return True
+
+    def run_in_thread(self, fn: Callable, *args, **kwargs):
+        """`fn`-i cari (executor) thread-də icra edir; icra müddətində thread nümunələnir."""
+        attached = self._attach()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if attached:
+                with self._threads_lock:
+                    self._threads.pop(threading.get_ident(), None)
+
+    def _run(self):
+        interval = self.profile.interval_ms / 1000
+        while not self._stop.wait(interval):
+            with self._threads_lock:
+                threads = dict(self._threads)
+            frames = sys._current_frames()
+            for thread_id, root in threads.items():
+                frame = frames.get(thread_id)
+                if frame is None or frame.f_code.co_name in IDLE_LEAF_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(root)
+                key = tuple(reversed(stack))
+                self.profile.stacks[key] = self.profile.stacks.get(key, 0) + 1
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        self._thread.join()
+        self.profile.duration_ms = (time.perf_counter() - self._started) * 1000
+        profile_store.add(self.profile)
+        if PROFILE_OUTPUT_DIR:
+            path = os.path.join(PROFILE_OUTPUT_DIR, f"{self.profile.id}.speedscope.json")
+            with open(path, "w") as f:
+                json.dump(self.profile.to_speedscope(), f)
+            print(f"INFO: Profil yazıldı: {path}")
+        return self.profile
+
+
+class _ProfiledThreadPoolExecutor(ThreadPoolExecutor):
+    """Göndərən kontekstdə aktiv profil varsa, işi icra edən thread həmin profildə nümunələnir."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        profiler = active_profiler.get()
+        if profiler is not None:
+            return super().submit(profiler.run_in_thread, fn, *args, **kwargs)
+        return super().submit(fn, *args, **kwargs)
+
+
+def thread_pool_executor(**kwargs) -> ThreadPoolExecutor:
+    """Sorğu işləri üçün ThreadPoolExecutor; profilləşdirmə söndürülübsə adi executor (sıfır yük)."""
+    if PROFILING_ENABLED or PROFILE_INGESTION:
+        return _ProfiledThreadPoolExecutor(**kwargs)
+    return ThreadPoolExecutor(**kwargs)
+
+
+def profiled(name: str) -> Callable:
+    """
+    İndeksləmə funksiyaları üçün dekorator. PROFILE_INGESTION söndürülübsə funksiya olduğu kimi qaytarılır.
+    """
+    def decorator(fn: Callable) -> Callable:
+        if not PROFILE_INGESTION:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = SamplingProfiler(name).start()
+            token = active_profiler.set(profiler)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                active_profiler.reset(token)
+                profile = profiler.stop()
+                print(f"INFO: '{name}' profili: id={profile.id}, {profile.sample_count} nümunə.")
+
+        return wrapper
+
+    return decorator
+
+
+class ProfilingMiddleware:
+    """
+    Saf ASGI middleware: başlıq və ya sampling ilə seçilən sorğunu profilləşdirir və
+    cavaba `X-Profile-Id` başlığını əlavə edir.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _wants_profile(scope) -> bool:
+        for key, value in scope.get("headers", ()):
+            if key == PROFILE_HEADER.encode() and value in (b"1", b"true"):
+                return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wants_profile(scope):
+            return await self.app(scope, receive, send)
+
+        # Event loop digər sorğularla ortaqdır — onun nümunələri ayrıca işarələnir
+        profiler = SamplingProfiler(f"{scope['method']} {scope['path']}").start(shared=True)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", profiler.profile.id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = active_profiler.set(profiler)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            active_profiler.reset(token)
+            profiler.stop()
@@ -0,0 +1,368 @@
+# app/query_log.py
+"""
+Production sorğu jurnalı və replay aləti.
+
+Hər /chat, /chat/batch və /compare-excel sorğusu üçün sual, sessiya, endpoint, tapılan chunk
+ID-ləri və skorları, mərhələ vaxtları (embed, search, generate, ...) və token sayları toplanır.
+Qeydlər yaddaşdakı növbəyə atılır və fon thread-i onları PostgreSQL-ə (query_log cədvəli)
+batch-lərlə yazır — sorğunun özünə gecikmə əlavə olunmur; növbə dolarsa qeyd atılır.
+
+Replay (yazılmış trafiki işləyən instansa orijinal və ya sürətləndirilmiş tempdə göndərir):
+    python -m app.query_log export jurnal.jsonl [--since 2026-01-01] [--until ...] [--endpoint /chat]
+    python -m app.query_log replay --base-url http://localhost:8000 [--input jurnal.jsonl] [--speed 2.0]
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import contextvars
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() == "true"
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", 100))
+QUERY_LOG_FLUSH_SECONDS = float(os.getenv("QUERY_LOG_FLUSH_SECONDS", 2.0))
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", 10000))
+# Replay zamanı yalnız bu endpointlər yenidən göndərilə bilir (/compare-excel faylı jurnalda saxlanılmır)
+REPLAYABLE_ENDPOINTS = ("/chat", "/chat/batch")
+
+
+class QueryTrace:
+    """Bir sorğunun jurnal qeydi; batch thread-ləri də eyni obyektə yazdığı üçün thread-safe-dir."""
+
+    def __init__(self, endpoint: str, session_id: Optional[str], question: Optional[str],
+                 payload: Optional[Dict] = None):
+        self.endpoint = endpoint
+        self.session_id = session_id
+        self.question = question
+        self.payload = payload
+        self.created_at = time.time()
+        self.status_code = 200
+        self.timings: Dict[str, float] = {}
+        self.retrieved: List[Dict] = []
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def add_timing(self, stage_name: str, elapsed_ms: float):
+        with self._lock:
+            if not self._finished:
+                self.timings[stage_name] = round(self.timings.get(stage_name, 0.0) + elapsed_ms, 2)
+
+    def add_hits(self, index_name: str, sources: List[Dict]):
+        with self._lock:
+            if not self._finished:
+                self.retrieved.extend(
+                    {"index": index_name, "id": src.get("_id"), "score": src.get("_score")} for src in sources
+                )
+
+    def add_tokens(self, prompt_tokens: int, response_tokens: int):
+        with self._lock:
+            if not self._finished:
+                self.prompt_tokens += prompt_tokens
+                self.response_tokens += response_tokens
+
+    def finish(self):
+        """Qeydi bağlayıb yazıcı növbəsinə verir (ikinci çağırış heç nə etmir)."""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            record = {
+                "created_at": self.created_at,
+                "endpoint": self.endpoint,
+                "session_id": self.session_id,
+                "question": self.question,
+                "payload": self.payload,
+                "retrieved": self.retrieved,
+                "timings_ms": self.timings,
+                "prompt_tokens": self.prompt_tokens,
+                "response_tokens": self.response_tokens,
+                "status_code": self.status_code,
+                "duration_ms": round((time.perf_counter() - self._started) * 1000, 2),
+            }
+        query_log_writer.submit(record)
+
+
+current_trace: contextvars.ContextVar[Optional[QueryTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(endpoint: str, session_id: Optional[str], question: Optional[str],
+                payload: Optional[Dict] = None) -> Optional[QueryTrace]:
+    """Cari kontekst üçün qeyd açır; sonda `trace.finish()` çağırılmalıdır."""
+    if not QUERY_LOG_ENABLED:
+        return None
+    trace = QueryTrace(endpoint, session_id, question, payload)
+    current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def query_trace(endpoint: str, session_id: Optional[str], question: Optional[str],
+                payload: Optional[Dict] = None) -> Iterator[Optional[QueryTrace]]:
+    """Sinxron cavab verən endpointlər üçün: xəta olduqda status kodu qeyd olunur."""
+    trace = start_trace(endpoint, session_id, question, payload)
+    try:
+        yield trace
+    except Exception as e:
+        if trace is not None:
+            trace.status_code = getattr(e, "status_code", 500)
+        raise
+    finally:
+        if trace is not None:
+            trace.finish()
+
+
+@contextmanager
+def stage(name: str):
+    """Mərhələ vaxtını cari qeydə əlavə edir; aktiv qeyd yoxdursa heç nə etmir."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_timing(name, (time.perf_counter() - started) * 1000)
+
+
+def record_retrieval(index_name: str, sources: List[Dict]):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_hits(index_name, sources)
+
+
+def record_llm_usage(prompt_text: str, response):
+    """Gemini-nin usage_metadata-sı varsa onu, yoxdursa (məs. keşdən gələn cavab) təxmini sayı yazır."""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    from app.rag.conversation_summary import estimate_tokens
+
+    usage = getattr(response, "usage_metadata", None) or {}
+    trace.add_tokens(
+        usage.get("input_tokens") or estimate_tokens(prompt_text),
+        usage.get("output_tokens") or estimate_tokens(str(response.content)),
+    )
+
+
+class QueryLogWriter:
+    """Növbədəki qeydləri fon thread-də QUERY_LOG_BATCH_SIZE-lik batch-lərlə və ya hər QUERY_LOG_FLUSH_SECONDS-də yazır."""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=QUERY_LOG_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.counters = {"submitted": 0, "written": 0, "dropped": 0, "write_errors": 0, "flushes": 0}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.counters[key] += amount
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, record: Dict):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            self._count("submitted")
+        except queue.Full:
+            self._count("dropped")
+
+    def _flush(self, batch: List[Dict]):
+        from app.database.query_log import insert_query_logs
+        try:
+            ok = insert_query_logs(batch)
+        except Exception as e:
+            print(f"WARNING: Sorğu jurnalı yazılmadı: {e}")
+            ok = False
+        if ok:
+            self._count("written", len(batch))
+            self._count("flushes")
+        else:
+            self._count("write_errors")
+            self._count("dropped", len(batch))
+
+    def _run(self):
+        batch: List[Dict] = []
+        deadline = time.monotonic() + QUERY_LOG_FLUSH_SECONDS
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if record is None:
+                    if batch:
+                        self._flush(batch)
+                    return
+                batch.append(record)
+            except queue.Empty:
+                pass
+            if len(batch) >= QUERY_LOG_BATCH_SIZE or time.monotonic() >= deadline:
+                if batch:
+                    self._flush(batch)
+                    batch = []
+                deadline = time.monotonic() + QUERY_LOG_FLUSH_SECONDS
+
+    def close(self, timeout: float = 5.0):
+        """Shutdown zamanı növbədə qalanları yazır."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def snapshot(self) -> Dict:
+        with self._stats_lock:
+            return {"enabled": QUERY_LOG_ENABLED, "queued": self._queue.qsize(), **self.counters}
+
+
+query_log_writer = QueryLogWriter()
+
+
+# --- REPLAY ---
+
+def _load_records(args) -> List[Dict]:
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        from app.database.query_log import fetch_query_logs
+        records = fetch_query_logs(args.since, args.until, args.endpoint, args.limit)
+    if args.endpoint:
+        records = [r for r in records if r["endpoint"] in args.endpoint]
+    return records[:args.limit] if args.limit else records
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def _replay_request(base_url: str, record: Dict, session_prefix: str, timeout: float) -> Dict:
+    payload = dict(record["payload"])
+    if session_prefix and payload.get("session_id"):
+        payload["session_id"] = f"{session_prefix}{payload['session_id']}"
+    payload.pop("stream", None)
+
+    request = urllib.request.Request(
+        base_url.rstrip("/") + record["endpoint"],
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return {"status": status, "latency_ms": (time.perf_counter() - started) * 1000}
+
+
+def replay(records: List[Dict], base_url: str, speed: float = 1.0, concurrency: int = 32,
+           session_prefix: str = "replay-", timeout: float = 120.0) -> Dict:
+    """
+    Qeydləri orijinal aralıqlarla (speed dəfə sürətləndirilmiş) göndərir.
+    speed=0 — gözləmədən, yalnız `concurrency` ilə məhdud maksimal yük.
+    """
+    replayable = [r for r in records if r["endpoint"] in REPLAYABLE_ENDPOINTS and r.get("payload")]
+    skipped = len(records) - len(replayable)
+    if not replayable:
+        print("WARNING: Replay üçün uyğun qeyd yoxdur.")
+        return {"sent": 0, "skipped": skipped}
+
+    print(f"INFO: {len(replayable)} sorğu göndərilir ({skipped} ötürüldü), speed={speed}, concurrency={concurrency}.")
+    origin = replayable[0]["created_at"]
+    started = time.monotonic()
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in replayable:
+            if speed > 0:
+                delay = (record["created_at"] - origin) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append((record, executor.submit(_replay_request, base_url, record, session_prefix, timeout)))
+        results = [(record, future.result()) for record, future in futures]
+    elapsed = time.monotonic() - started
+
+    latencies = [r["latency_ms"] for _, r in results]
+    original = [record["duration_ms"] for record, _ in results if record.get("duration_ms") is not None]
+    report = {
+        "sent": len(results),
+        "skipped": skipped,
+        "errors": sum(1 for _, r in results if not 200 <= r["status"] < 300),
+        "elapsed_s": round(elapsed, 1),
+        "achieved_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95),
+                       "p99": _percentile(latencies, 0.99)},
+        "original_latency_ms": {"p50": _percentile(original, 0.5), "p95": _percentile(original, 0.95),
+                                "p99": _percentile(original, 0.99)},
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sorğu jurnalının ixracı və replay-i.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(sub):
+        sub.add_argument("--input", help="DB əvəzinə export edilmiş JSONL faylı")
+        sub.add_argument("--since", help="Məs. 2026-01-01 və ya '2026-01-01 12:00+04'")
+        sub.add_argument("--until")
+        sub.add_argument("--endpoint", action="append", help="Təkrarlana bilər: --endpoint /chat")
+        sub.add_argument("--limit", type=int)
+
+    export_parser = subparsers.add_parser("export", help="Jurnalı JSONL faylına yaz")
+    export_parser.add_argument("path")
+    add_filters(export_parser)
+
+    replay_parser = subparsers.add_parser("replay", help="Jurnalı işləyən instansa yenidən göndər")
+    replay_parser.add_argument("--base-url", default="http://localhost:8000")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="1.0 — orijinal temp, 4.0 — 4 dəfə sürətli, 0 — gözləmədən")
+    replay_parser.add_argument("--concurrency", type=int, default=32)
+    replay_parser.add_argument("--timeout", type=float, default=120.0)
+    replay_parser.add_argument("--session-prefix", default="replay-",
+                               help="Replay sessiyalarının prefiksi (real tarixçəyə yazmamaq üçün); '' — orijinal sessiyalar")
+    add_filters(replay_parser)
+
+    args = parser.parse_args()
+    records = _load_records(args)
+
+    if args.command == "export":
+        with open(args.path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"SUCCESS: {len(records)} qeyd '{args.path}' faylına yazıldı.")
+    else:
+        replay(records, args.base_url, args.speed, args.concurrency, args.session_prefix, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# app/rag/chunk_schema.py
+"""
+İndekslənən chunk-ların metadata sxemi.
+
+Loader-lərin (PyPDFLoader, UnstructuredExcelLoader) bütün metadata lüğəti (producer, creator,
+creationdate, moddate, total_pages, source, ...) indeksə yazılmır — hər chunk yalnız
+CHUNK_METADATA_FIELDS sahələrini daşıyır. PDF tarixləri ("D:20151102094541+01'00'" və ya ISO)
+indeksləmədən əvvəl klient tərəfində UTC ISO 8601-ə çevrilir, ona görə OpenSearch ingest
+pipeline-ı (əvvəlki pdf_date_fixer) lazım deyil.
+
+Ölçü müqayisəsi (köhnə tam metadata + pipeline və yeni sxem):
+    python -m app.rag.chunk_schema compare [--limit N]
+    python -m app.rag.chunk_schema compare --opensearch    # müvəqqəti indekslərə bulk yazır
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+# İndeksə yazılan metadata sahələri (text və vector_field LangChain tərəfindən əlavə olunur)
+CHUNK_METADATA_FIELDS = ("source_file", "standard_name", "session_id", "page", "disclosure_id", "date")
+
+# Tarix mənbəyi prioriteti: son dəyişiklik, sonra yaradılma (Excel üçün last_modified)
+DATE_SOURCE_FIELDS = ("moddate", "creationdate", "last_modified")
+
+PDF_DATE_PATTERN = re.compile(
+    r"^D:(?P<year>\d{4})(?P<month>\d{2})?(?P<day>\d{2})?(?P<hour>\d{2})?(?P<minute>\d{2})?(?P<second>\d{2})?"
+    r"(?P<tz>[Zz]|[+-]\d{2}'?\d{2}'?)?"
+)
+
+
+def normalize_pdf_date(value) -> Optional[str]:
+    """
+    PDF/ISO tarixini UTC ISO 8601 sətrinə ("2015-11-02T08:45:41Z") çevirir; tanınmırsa None.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+
+    match = PDF_DATE_PATTERN.match(value)
+    if match:
+        parts = match.groupdict()
+        try:
+            parsed = datetime(
+                int(parts["year"]), int(parts["month"] or 1), int(parts["day"] or 1),
+                int(parts["hour"] or 0), int(parts["minute"] or 0), int(parts["second"] or 0),
+            )
+        except ValueError:
+            return None
+        offset = timedelta(0)
+        tz = parts["tz"]
+        if tz and tz not in ("Z", "z"):
+            digits = tz[1:].replace("'", "")
+            offset = timedelta(hours=int(digits[:2]), minutes=int(digits[2:4] or 0))
+            if tz[0] == "-":
+                offset = -offset
+        parsed = parsed.replace(tzinfo=timezone(offset))
+    else:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def chunk_metadata(loader_metadata: Dict, **fields) -> Dict:
+    """
+    Loader metadata-sından və verilmiş sahələrdən (source_file, standard_name, session_id, ...)
+    yalnız sxem sahələrini saxlayır. Boş dəyərlər yazılmır.
+    """
+    metadata = {
+        "page": loader_metadata.get("page"),
+        "disclosure_id": loader_metadata.get("disclosure_id"),
+        "date": next(
+            (date for date in (normalize_pdf_date(loader_metadata.get(f)) for f in DATE_SOURCE_FIELDS) if date),
+            None
+        ),
+    }
+    metadata.update(fields)
+    return {key: metadata[key] for key in CHUNK_METADATA_FIELDS if metadata.get(key) is not None}
+
+
+# --- MÜQAYİSƏ ---
+
+# Əvvəlki server tərəfi tarix düzəlişi (yalnız müqayisədə köhnə yolu təkrarlamaq üçün).
+# date prosessoruna "if" əlavə olunub — əks halda moddate-i ISO olan sənədlər rədd edilir.
+LEGACY_PIPELINE = {
+    "description": "PDF metadata.moddate field cleaner for D:YYYYMMDDhhmmss format",
+    "processors": [
+        {"grok": {"field": "metadata.moddate", "patterns": ["D:%{NOTSPACE:metadata.moddate_cleaned}"],
+                  "if": "ctx.metadata.moddate != null && ctx.metadata.moddate.startsWith(\"D:\")"}},
+        {"date": {"field": "metadata.moddate_cleaned", "target_field": "metadata.moddate",
+                  "formats": ["yyyyMMddHHmmss"], "timezone": "UTC", "if": "ctx.metadata.moddate_cleaned != null"}},
+        {"remove": {"field": "metadata.moddate_cleaned", "if": "ctx.metadata.moddate_cleaned != null"}}
+    ]
+}
+EMBEDDING_DIMENSIONS = 768
+
+
+def _load_standard_chunks(directory: str, limit: Optional[int]) -> List:
+    from app.startup_report import lazy_import
+    from app.rag.structured_chunker import split_standard_documents
+
+    PyPDFLoader = lazy_import("langchain_community.document_loaders", "PyPDFLoader")
+    filenames = sorted(f for f in os.listdir(directory) if f.lower().endswith(".pdf"))[:limit]
+    chunks = []
+    for filename in filenames:
+        for doc in split_standard_documents(PyPDFLoader(os.path.join(directory, filename)).load(), filename):
+            chunks.append((filename, doc))
+    return chunks
+
+
+def _legacy_metadata(filename: str, doc) -> Dict:
+    return {**doc.metadata, "standard_name": filename.replace('.pdf', '').replace('.PDF', ''), "source_file": filename}
+
+
+def _slim_metadata(filename: str, doc) -> Dict:
+    return chunk_metadata(doc.metadata, standard_name=filename.replace('.pdf', '').replace('.PDF', ''),
+                          source_file=filename)
+
+
+def _json_bytes(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def _bulk_index(client, index_name: str, documents: List[Dict], pipeline: Optional[str]) -> Dict:
+    from opensearchpy.helpers import bulk
+
+    client.indices.create(index=index_name, body={
+        "settings": {"index": {"knn": True, "number_of_replicas": 0}},
+        "mappings": {"properties": {"vector_field": {
+            "type": "knn_vector", "dimension": EMBEDDING_DIMENSIONS,
+            "method": {"name": "hnsw", "space_type": "l2", "engine": "nmslib"}}}},
+    })
+    actions = [{"_index": index_name, **doc} for doc in documents]
+    started = time.perf_counter()
+    bulk(client, actions, max_chunk_bytes=1024 * 1024, **({"pipeline": pipeline} if pipeline else {}))
+    client.indices.refresh(index=index_name)
+    elapsed = time.perf_counter() - started
+    client.indices.forcemerge(index=index_name, max_num_segments=1)
+    stats = client.indices.stats(index=index_name, metric="store")
+    return {
+        "docs_per_s": round(len(documents) / elapsed, 1),
+        "bulk_s": round(elapsed, 2),
+        "store_bytes": stats["indices"][index_name]["total"]["store"]["size_in_bytes"],
+    }
+
+
+def compare(directory: str, limit: Optional[int] = None, use_opensearch: bool = False) -> Dict:
+    chunks = _load_standard_chunks(directory, limit)
+    rng = random.Random(0)
+    vectors = [[rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)] for _ in chunks]
+
+    report = {"chunks": len(chunks)}
+    variants = {"legacy": _legacy_metadata, "slim": _slim_metadata}
+    documents = {}
+    for name, build in variants.items():
+        documents[name] = [
+            {"text": doc.page_content, "metadata": build(filename, doc), "vector_field": vector}
+            for (filename, doc), vector in zip(chunks, vectors)
+        ]
+        metadata_bytes = sum(_json_bytes(d["metadata"]) for d in documents[name])
+        report[name] = {
+            "metadata_bytes_avg": round(metadata_bytes / max(len(chunks), 1), 1),
+            "source_bytes_total": sum(_json_bytes(d) for d in documents[name]),
+            "source_bytes_without_vector": sum(_json_bytes({**d, "vector_field": None}) for d in documents[name]),
+        }
+
+    if use_opensearch:
+        from app.rag.rag_service import get_raw_opensearch_client
+
+        client = get_raw_opensearch_client(timeout=120)
+        if client is None:
+            raise RuntimeError("OpenSearch mühit dəyişənləri natamamdır.")
+        pipeline_name = "chunk_schema_compare_legacy"
+        client.ingest.put_pipeline(id=pipeline_name, body=LEGACY_PIPELINE)
+        try:
+            for name in variants:
+                index_name = f"chunk_schema_compare_{name}"
+                client.indices.delete(index=index_name, ignore=[404])
+                try:
+                    report[name].update(_bulk_index(
+                        client, index_name, documents[name], pipeline_name if name == "legacy" else None
+                    ))
+                finally:
+                    client.indices.delete(index=index_name, ignore=[404])
+        finally:
+            client.ingest.delete_pipeline(id=pipeline_name, ignore=[404])
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk metadata sxemi: köhnə və yeni ölçü müqayisəsi")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("--dir", default=os.path.join(os.path.dirname(__file__), "..", "..", "standards_data"))
+    compare_parser.add_argument("--limit", type=int)
+    compare_parser.add_argument("--opensearch", action="store_true",
+                                help="Müvəqqəti indekslərə bulk yazıb store ölçüsü və docs/s ölçür")
+    args = parser.parse_args()
+
+    print(json.dumps(compare(args.dir, args.limit, args.opensearch), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# app/rag/conversation_summary.py
+"""
+Sessiyalar üçün yığılan (rolling) söhbət xülasəsi.
+
+Prompta son N xam mesaj əvəzinə məhdud ölçülü xülasə + yalnız son istifadəçi sualı daxil edilir.
+Xülasə PostgreSQL-də (chat_summaries) SQLChatMessageHistory ilə yanaşı saxlanılır və hər
+cavabdan sonra fon tapşırığı kimi (aşağı prioritetli Gemini zolağında) yenilənir.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+from app.rag.gemini_scheduler import gemini_lane, request_deadline_scope, LANE_INGESTION
+
+# ---- Konfiqurasiya ----
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 400))
+# Xülasəyə göndərilən hər yeni mesajın maksimum uzunluğu (simvol) — böyük Markdown cədvəlləri kəsilir
+SUMMARY_MESSAGE_MAX_CHARS = int(os.getenv("SUMMARY_MESSAGE_MAX_CHARS", 3000))
+LAST_TURN_MAX_CHARS = int(os.getenv("LAST_TURN_MAX_CHARS", 1500))
+
+# session_id -> [kilid, onu tutan və ya gözləyən yeniləmələrin sayı]; say sıfıra düşəndə giriş silinir
+_session_locks: Dict[str, List] = {}
+_session_locks_guard = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "prompts": 0,
+    "history_tokens_total": 0,
+    "legacy_history_tokens_total": 0,
+    "summary_updates": 0,
+    "summary_update_errors": 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Gemini tokenlərinin kobud qiymətləndirməsi (~4 simvol = 1 token)."""
+    return (len(text) + 3) // 4
+
+
+@contextmanager
+def _session_lock(session_id: str):
+    with _session_locks_guard:
+        entry = _session_locks.setdefault(session_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _session_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _session_locks[session_id]
+
+
+def record_history_tokens(history_text: str, legacy_history_text: str):
+    """Yeni (xülasə) və köhnə (son 3 xam mesaj) tarixçə formatının token ölçülərini metrics üçün toplayır."""
+    with _stats_lock:
+        _stats["prompts"] += 1
+        _stats["history_tokens_total"] += estimate_tokens(history_text)
+        _stats["legacy_history_tokens_total"] += estimate_tokens(legacy_history_text)
+
+
+def summary_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    prompts = stats["prompts"] or 1
+    stats["avg_history_tokens"] = round(stats["history_tokens_total"] / prompts, 1)
+    stats["avg_legacy_history_tokens"] = round(stats["legacy_history_tokens_total"] / prompts, 1)
+    stats["avg_tokens_saved"] = round(stats["avg_legacy_history_tokens"] - stats["avg_history_tokens"], 1)
+    return stats
+
+
+def format_summary_context(messages, session_id: str) -> str:
+    """
+    Prompt üçün tarixçə bloku: sessiyanın xülasəsi + yalnız son istifadəçi sualı.
+    `messages` — history_manager.messages (artıq oxunmuş siyahı).
+    """
+    from app.database.summaries import get_summary
+
+    summary, _ = get_summary(session_id) or ("", 0)
+    last_user = next((m.content for m in reversed(messages) if m.type == "human"), None)
+
+    if not summary and not last_user:
+        return ""
+
+    block = "--- KEÇMİŞ ÇAT MƏLUMATI ---\n"
+    if summary:
+        block += f"[XÜLASƏ]: {summary}\n"
+    if last_user:
+        block += f"[SON SUAL]: {last_user[:LAST_TURN_MAX_CHARS]}\n"
+    return block + "-------------------------\n\n"
+
+
+def update_summary(session_id: str, history_manager_factory):
+    """
+    Sessiyanın xülasəsinə hələ daxil edilməmiş mesajları əlavə edir (fon tapşırığı).
+    Eyni sessiya üçün yeniləmələr ardıcıl işləyir; növbəti yeniləmə yalnız qalan mesajları götürür.
+    """
+    from app.database.summaries import get_summary, save_summary
+    from app.rag.rag_service import create_llm_client
+
+    with _session_lock(session_id):
+        try:
+            stored = get_summary(session_id)
+            if stored is None:
+                # Xülasə saxlana bilmirsə bütün tarixçəni hər növbədə Gemini-yə göndərməmək üçün yeniləmə atlanır
+                raise RuntimeError("DB əlçatmazdır")
+            summary, summarized = stored
+            messages = history_manager_factory(session_id).messages
+            new_messages = messages[summarized:]
+            if not new_messages:
+                return
+
+            conversation = "\n".join(
+                f"[{m.type.upper()}]: {m.content[:SUMMARY_MESSAGE_MAX_CHARS]}" for m in new_messages
+            )
+            max_words = int(SUMMARY_MAX_TOKENS * 0.75)
+            system_prompt = (
+                "Sən ESG audit söhbətlərinin xülasəsini aparan köməkçisən. Mövcud xülasəni yeni mesajlarla yenilə. "
+                "İstifadəçinin məqsədlərini, yüklənmiş sənədləri, aşkar edilmiş çatışmazlıqları (standart və açıqlama ID-ləri ilə) "
+                f"və açıq qalan sualları saxla. Cədvəlləri təkrarlama, yalnız nəticələrini qeyd et. Maksimum {max_words} söz, təmiz mətn."
+            )
+            user_prompt = (
+                f"MÖVCUD XÜLASƏ:\n{summary or '(boş)'}\n\n"
+                f"YENİ MESAJLAR:\n{conversation}\n\n"
+                "YENİLƏNMİŞ XÜLASƏ:"
+            )
+
+            # Fon tapşırığı sorğu kontekstini miras alır; cavab artıq göndərilib, sorğunun deadline-ı tətbiq olunmur
+            with gemini_lane(LANE_INGESTION), request_deadline_scope(None):
+                llm = create_llm_client(os.getenv("GEMINI_API_KEY"))
+                response = llm.invoke(input=user_prompt, config={"system_instruction": system_prompt})
+
+            new_summary = " ".join(response.content.split())
+            # Model limiti aşarsa, xülasəni sərt şəkildə məhdudlaşdırırıq (prompt ölçüsü sabit qalsın)
+            new_summary = new_summary[:SUMMARY_MAX_TOKENS * 4]
+
+            if not save_summary(session_id, new_summary, summarized + len(new_messages)):
+                raise RuntimeError("xülasə DB-yə yazılmadı")
+            with _stats_lock:
+                _stats["summary_updates"] += 1
+
+        except Exception as e:
+            print(f"WARNING: Sessiya '{session_id}' üçün xülasə yenilənmədi: {e}")
+            with _stats_lock:
+                _stats["summary_update_errors"] += 1
@@ -0,0 +1,319 @@
+# app/rag/disclosure_catalog.py
+"""
+Standartların açıqlama (disclosure) kataloqu.
+
+Bir dəfəlik oflayn addımla `standards_data/` qovluğundakı PDF-lərdən strukturlaşdırılmış
+açıqlama tələbləri (standart, açıqlama ID-si məs. 305-1, tələb mətni, gözlənilən vahidlər)
+və onların embedding-ləri çıxarılıb lokal fayla yazılır. Sorğu zamanı Excel başlıqları/sətirləri
+bir matris əməliyyatı ilə kataloqa uyğunlaşdırılır və boşluq (gap) analizi deterministik hesablanır.
+
+İstifadə:
+    python -m app.rag.disclosure_catalog build [--standards-dir standards_data] [--out <fayl>.npz]
+"""
+import os
+import re
+import json
+import hashlib
+import argparse
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.startup_report import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STANDARDS_DIR = os.path.join(BASE_DIR, "..", "..", "standards_data")
+DISCLOSURE_CATALOG_PATH = os.getenv(
+    "DISCLOSURE_CATALOG_PATH", os.path.join(DEFAULT_STANDARDS_DIR, "disclosure_catalog.npz")
+)
+# Excel sətri ilə açıqlama arasında "əhatə olunub" sayılmaq üçün minimal kosinus oxşarlığı
+CATALOG_MATCH_THRESHOLD = float(os.getenv("CATALOG_MATCH_THRESHOLD", 0.62))
+# Sorğu mətninə görə əhatəyə əlavə olunan standartların sayı
+CATALOG_QUERY_TOP_STANDARDS = int(os.getenv("CATALOG_QUERY_TOP_STANDARDS", 2))
+# Bütün Excel sətirləri batch-lərlə vektorlaşdırılır; bu hədd yalnız qeyri-adi böyük fayllar üçün
+# təhlükəsizlik limitidir — aşıldıqda nəticə "truncated" işarələnir və çatışmazlıqlar qəti sayılmır
+CATALOG_MAX_EXCEL_ROWS = int(os.getenv("CATALOG_MAX_EXCEL_ROWS", 20000))
+# Bir embedding çağırışındakı mətn sayı (Gemini batchEmbedContents limiti 100)
+CATALOG_EMBED_BATCH_SIZE = int(os.getenv("CATALOG_EMBED_BATCH_SIZE", 100))
+
+# Gemini-də simmetrik müqayisə üçün task növü (həm kataloq, həm də Excel sətirləri)
+SIMILARITY_TASK_TYPE = "SEMANTIC_SIMILARITY"
+
+# "Disclosure 305-1 Direct (Scope 1) GHG emissions"
+DISCLOSURE_HEADING_RE = re.compile(r"Disclosure\s+(\d{1,3}-\d{1,2})\s+([^\n]{3,160})")
+REQUIREMENT_MARKER_RE = re.compile(r"shall\s+report", re.IGNORECASE)
+# Tələb mətnini bitirən bölmə başlıqları
+SECTION_END_RE = re.compile(r"\n\s*(Guidance|GUIDANCE|Compilation requirements|Recommendations)\b")
+
+UNIT_PATTERNS = {
+    "tCO2e": r"metric tons? of CO2 equivalent|tCO2e|CO2 equivalent",
+    "J": r"\bjoules?\b|\bGJ\b|\bwatt-hours?\b|\bkWh\b|\bMWh\b",
+    "ML": r"\bmegalit(?:er|re)s?\b|\bML\b",
+    "t": r"\bmetric tons?\b|\btonnes?\b|\bweight\b",
+    "ha": r"\bhectares?\b|\bkm2\b",
+    "%": r"\bpercentage\b|%",
+    "hours": r"\bhours?\b",
+    "count": r"\bnumber of\b|\btotal number\b",
+    "currency": r"\bmonetary value\b|\bcurrency\b",
+    "rate": r"\brates?\b|\bratio\b",
+}
+
+
+def detect_units(text: str) -> List[str]:
+    """Tələb mətnində gözlənilən ölçü vahidlərini tapır."""
+    return [unit for unit, pattern in UNIT_PATTERNS.items() if re.search(pattern, text, re.IGNORECASE)]
+
+
+def extract_disclosures(pages: List[str], source_file: str) -> List[Dict]:
+    """
+    Bir standartın səhifə mətnlərindən açıqlama tələblərini çıxarır.
+    Məzmun cədvəli və istinadlardakı təkrarlardan qaçmaq üçün hər ID üzrə
+    "shall report" ifadəsini ehtiva edən ən uzun bölmə saxlanılır.
+    """
+    # "GRI_305__Emissions_2016 (1).pdf" kimi surətlər eyni standart sayılır
+    standard = re.sub(r"\s*\(\d+\)$", "", os.path.splitext(source_file)[0])
+
+    # Səhifələri birləşdiririk ki, səhifə sərhədini keçən bölmələr kəsilməsin
+    offsets, text = [], ""
+    for page in pages:
+        offsets.append(len(text))
+        text += page + "\n"
+
+    def page_of(position: int) -> int:
+        return max(i for i, start in enumerate(offsets) if start <= position)
+
+    headings = list(DISCLOSURE_HEADING_RE.finditer(text))
+    best: Dict[str, Dict] = {}
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        body = text[match.end():end]
+        section_end = SECTION_END_RE.search(body)
+        if section_end:
+            body = body[:section_end.start()]
+        if not REQUIREMENT_MARKER_RE.search(body):
+            continue
+
+        requirement = " ".join(body.split())[:2000]
+        disclosure_id = match.group(1)
+        if disclosure_id in best and len(best[disclosure_id]["requirement"]) >= len(requirement):
+            continue
+
+        best[disclosure_id] = {
+            "standard": standard,
+            "source_file": source_file,
+            "disclosure_id": disclosure_id,
+            "title": " ".join(match.group(2).split()),
+            "requirement": requirement,
+            "units": detect_units(requirement),
+            "page": page_of(match.start()),
+        }
+
+    return sorted(best.values(), key=lambda e: [int(p) for p in e["disclosure_id"].split("-")])
+
+
+def catalog_entry_text(entry: Dict) -> str:
+    return f"Disclosure {entry['disclosure_id']} {entry['title']}. {entry['requirement'][:1000]}"
+
+
+def build_catalog(standards_dir: str = DEFAULT_STANDARDS_DIR, out_path: str = DISCLOSURE_CATALOG_PATH) -> int:
+    """PDF-lərdən kataloqu qurur, embedding-ləri hesablayır və `out_path`-a yazır. Qeyd sayını qaytarır."""
+    from langchain_community.document_loaders import PyPDFLoader
+    from app.rag.rag_service import create_embeddings_client
+    from app.rag.gemini_scheduler import current_lane, LANE_INGESTION
+
+    current_lane.set(LANE_INGESTION)
+
+    entries: List[Dict] = []
+    seen = set()
+    pdf_files = sorted(f for f in os.listdir(standards_dir) if f.lower().endswith(".pdf"))
+    for filename in pdf_files:
+        try:
+            pages = [doc.page_content for doc in PyPDFLoader(os.path.join(standards_dir, filename)).load()]
+        except Exception as e:
+            print(f"ERROR: {filename} oxunmadı: {e}")
+            continue
+        found = [e for e in extract_disclosures(pages, filename) if (e["standard"], e["disclosure_id"]) not in seen]
+        seen.update((e["standard"], e["disclosure_id"]) for e in found)
+        if found:
+            print(f"INFO: {filename}: {len(found)} açıqlama tapıldı.")
+        entries.extend(found)
+
+    if not entries:
+        print("WARNING: Heç bir açıqlama tapılmadı, kataloq yazılmadı.")
+        return 0
+
+    embeddings = create_embeddings_client(os.getenv("GEMINI_API_KEY"))
+    vectors = embeddings.embed_with_task([catalog_entry_text(e) for e in entries], SIMILARITY_TASK_TYPE)
+
+    np = lazy_import("numpy")
+    np.savez_compressed(
+        out_path,
+        vectors=np.asarray(vectors, dtype=np.float32),
+        entries=np.array(json.dumps(entries, ensure_ascii=False)),
+    )
+    print(f"SUCCESS: {len(entries)} açıqlamadan ibarət kataloq yazıldı: {out_path}")
+    return len(entries)
+
+
+def _normalize(matrix: "np.ndarray") -> "np.ndarray":
+    np = lazy_import("numpy")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class DisclosureCatalog:
+    """Yaddaşa yüklənmiş kataloq və vektorlaşdırılmış uyğunlaşdırıcı."""
+
+    def __init__(self, entries: List[Dict], vectors: "np.ndarray"):
+        np = lazy_import("numpy")
+        self.entries = entries
+        self.vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        self.standards = np.array([e["standard"] for e in entries])
+        # Kataloq yenidən qurulduqda əvvəlki (keşlənmiş) oxşarlıq nəticələri etibarsız olur
+        self.version = hashlib.sha256(self.vectors.tobytes()).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, path: str = DISCLOSURE_CATALOG_PATH) -> "DisclosureCatalog":
+        data = lazy_import("numpy").load(path)
+        return cls(json.loads(str(data["entries"])), data["vectors"])
+
+    def similarity(self, vectors) -> "np.ndarray":
+        """(n sətir x m açıqlama) kosinus oxşarlıq matrisi — bir matris vurması."""
+        np = lazy_import("numpy")
+        return _normalize(np.asarray(vectors, dtype=np.float32)) @ self.vectors.T
+
+    def gap_analysis(self, row_vectors, query_vector=None,
+                     threshold: float = CATALOG_MATCH_THRESHOLD) -> Dict[str, List[Dict]]:
+        """
+        Excel sətirlərinin vektorlarını kataloqla müqayisə edir.
+        Əhatə dairəsi: sətirlərin toxunduğu standartlar + sorğuya ən yaxın standartlar.
+        Qaytarır: {"covered": [...], "missing": [...]} (hər qeyd kataloq qeydi + "score").
+        """
+        return self.gaps_from_scores(self.best_scores(row_vectors), query_vector, threshold)
+
+    def best_scores(self, row_vectors) -> "np.ndarray":
+        """Hər açıqlama üçün sətirlər arasında ən yüksək oxşarlıq. Sətir blokları üzrə np.maximum ilə birləşir."""
+        np = lazy_import("numpy")
+        if not len(row_vectors):
+            return np.zeros(len(self.entries), dtype=np.float32)
+        return self.similarity(row_vectors).max(axis=0)
+
+    def gaps_from_scores(self, best_scores: "np.ndarray", query_vector=None,
+                         threshold: float = CATALOG_MATCH_THRESHOLD) -> Dict[str, List[Dict]]:
+        """gap_analysis-in ikinci yarısı: hazır best_scores vektorundan əhatə/çatışmazlıq siyahısı."""
+        np = lazy_import("numpy")
+        covered_mask = best_scores >= threshold
+
+        scope = set(self.standards[covered_mask].tolist())
+        if query_vector is not None:
+            query_scores = self.similarity([query_vector])[0]
+            ranked = []
+            for standard in self.standards[np.argsort(-query_scores)]:
+                if standard not in ranked:
+                    ranked.append(standard)
+                if len(ranked) >= CATALOG_QUERY_TOP_STANDARDS:
+                    break
+            scope.update(ranked)
+
+        result = {"covered": [], "missing": []}
+        for i, entry in enumerate(self.entries):
+            if entry["standard"] not in scope:
+                continue
+            key = "covered" if covered_mask[i] else "missing"
+            result[key].append({**entry, "score": round(float(best_scores[i]), 3)})
+        return result
+
+
+def format_gap_table(gaps: Dict[str, List[Dict]]) -> str:
+    """Deterministik boşluq analizini LLM-in ifadə etməsi üçün Markdown cədvəlinə çevirir."""
+    if not gaps["missing"]:
+        return "Kataloqa görə əhatə dairəsindəki bütün açıqlamalar Excel-də tapıldı."
+
+    lines = ["| Standart | Açıqlama | Tələb | Gözlənilən vahid |", "|---|---|---|---|"]
+    for entry in gaps["missing"]:
+        requirement = entry["requirement"][:300].replace("|", "/")
+        lines.append(
+            f"| {entry['standard']} | {entry['disclosure_id']} {entry['title']} | {requirement} | "
+            f"{', '.join(entry['units']) or '-'} |"
+        )
+    return "\n".join(lines)
+
+
+_catalog: Optional[DisclosureCatalog] = None
+_catalog_loaded = False
+_catalog_lock = threading.Lock()
+
+
+def get_disclosure_catalog() -> Optional[DisclosureCatalog]:
+    """Kataloqu bir dəfə yükləyir; fayl yoxdursa None qaytarır (LLM-əsaslı köhnə yola düşülür)."""
+    global _catalog, _catalog_loaded
+    if not _catalog_loaded:
+        with _catalog_lock:
+            if not _catalog_loaded:
+                if os.path.exists(DISCLOSURE_CATALOG_PATH):
+                    try:
+                        _catalog = DisclosureCatalog.load(DISCLOSURE_CATALOG_PATH)
+                        print(f"INFO: Açıqlama kataloqu yükləndi ({len(_catalog.entries)} qeyd).")
+                    except Exception as e:
+                        print(f"WARNING: Açıqlama kataloqu yüklənmədi: {e}")
+                else:
+                    print(f"INFO: Açıqlama kataloqu tapılmadı ({DISCLOSURE_CATALOG_PATH}).")
+                _catalog_loaded = True
+    return _catalog
+
+
+def embed_texts(embeddings, texts: List[str]) -> List[List[float]]:
+    """Mətnləri CATALOG_EMBED_BATCH_SIZE-lik embedding çağırışları ilə vektorlaşdırır."""
+    vectors = []
+    for start in range(0, len(texts), CATALOG_EMBED_BATCH_SIZE):
+        vectors.extend(embeddings.embed_with_task(texts[start:start + CATALOG_EMBED_BATCH_SIZE], SIMILARITY_TASK_TYPE))
+    return vectors
+
+
+def mark_truncated(gaps: Dict, rows_analyzed: int, rows_total: int) -> Dict:
+    """Fayl CATALOG_MAX_EXCEL_ROWS-dan böyükdürsə: "missing" siyahısı qəti deyil (yoxlanılmamış sətirlər var)."""
+    if rows_total > rows_analyzed:
+        gaps["truncated"] = {"rows_analyzed": rows_analyzed, "rows_total": rows_total}
+    return gaps
+
+
+def analyze_gaps(row_texts: List[str], query: str) -> Optional[Dict[str, List[Dict]]]:
+    """
+    Mətn sətirlərini (Excel sətirləri və ya sənəd parçaları) kataloqa uyğunlaşdırır.
+    Kataloq yoxdursa None qaytarır.
+    """
+    catalog = get_disclosure_catalog()
+    if catalog is None:
+        return None
+
+    from app.rag.rag_service import create_embeddings_client
+
+    embeddings = create_embeddings_client(os.getenv("GEMINI_API_KEY"))
+    rows = row_texts[:CATALOG_MAX_EXCEL_ROWS]
+    vectors = embed_texts(embeddings, rows + [query])
+    gaps = catalog.gap_analysis(vectors[:-1], query_vector=vectors[-1])
+    return mark_truncated(gaps, len(rows), len(row_texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standartların açıqlama kataloqunu qurur.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="standards_data/ qovluğundan kataloqu qur")
+    build.add_argument("--standards-dir", default=DEFAULT_STANDARDS_DIR)
+    build.add_argument("--out", default=DISCLOSURE_CATALOG_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_catalog(args.standards_dir, args.out)
+
+
+if __name__ == "__main__":
+    main()
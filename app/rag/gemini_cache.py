@@ -0,0 +1,321 @@
+# app/rag/gemini_cache.py
+"""
+Embedding və LLM cavabları üçün iki səviyyəli keş.
+
+L1 — proses daxilində LRU (ən sürətli, hər worker-in özünə məxsus).
+L2 — PostgreSQL-dəki gemini_cache cədvəli: bütün gunicorn worker-ləri arasında ortaqdır və
+konteyner yenidən başladıqda itmir. Vektorlar float32 baytları kimi kompakt saxlanılır,
+girişlərin TTL-i var, ümumi ölçü CACHE_SHARED_MAX_MB ilə məhdudlaşdırılır (ən az istifadə olunan silinir).
+Yeni worker startup zamanı ən son istifadə olunmuş girişləri L1-ə yükləyir (warm start).
+
+L2 əlçatmaz olduqda keş "açıq" uğursuz olur: sorğular birbaşa Gemini-yə gedir və
+DB-yə bir müddət (CACHE_SHARED_RETRY_SECONDS) müraciət edilmir.
+"""
+import os
+import time
+import array
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.startup_report import lazy_import
+from app.query_log import record_llm_usage, stage
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+# "postgres" — ortaq L2 səviyyəsi, "none" — yalnız proses daxilində L1
+CACHE_SHARED_BACKEND = os.getenv("CACHE_SHARED_BACKEND", "postgres")
+CACHE_L1_MAX_ITEMS = int(os.getenv("CACHE_L1_MAX_ITEMS", 5000))
+CACHE_EMBEDDING_TTL = int(os.getenv("CACHE_EMBEDDING_TTL", 30 * 24 * 3600))
+CACHE_ANSWER_TTL = int(os.getenv("CACHE_ANSWER_TTL", 24 * 3600))
+CACHE_SHARED_MAX_MB = float(os.getenv("CACHE_SHARED_MAX_MB", 512))
+# Hər bu qədər L2 yazısından sonra ölçü/TTL əsaslı eviction işləyir
+CACHE_EVICT_EVERY = int(os.getenv("CACHE_EVICT_EVERY", 500))
+CACHE_SHARED_RETRY_SECONDS = float(os.getenv("CACHE_SHARED_RETRY_SECONDS", 30))
+# Startup zamanı hər namespace üçün L1-ə yüklənən girişlərin sayı
+CACHE_WARM_ITEMS = int(os.getenv("CACHE_WARM_ITEMS", 1000))
+# L2 hit-lərinin last_hit_at yeniləməsi paketlə yazılır: bu qədər açar yığıldıqda və ya bu qədər saniyədən bir
+CACHE_TOUCH_BATCH = int(os.getenv("CACHE_TOUCH_BATCH", 200))
+CACHE_TOUCH_SECONDS = float(os.getenv("CACHE_TOUCH_SECONDS", 30))
+
+_shared_lock = threading.Lock()
+_shared_state = {"disabled_until": 0.0, "writes_since_evict": 0, "touched_at": time.monotonic()}
+_pending_touches = set()
+
+
+def _shared_available() -> bool:
+    return CACHE_SHARED_BACKEND == "postgres" and time.monotonic() >= _shared_state["disabled_until"]
+
+
+def _shared_failed(error: Exception):
+    print(f"WARNING: Ortaq keş (PostgreSQL) əlçatmazdır, {CACHE_SHARED_RETRY_SECONDS:.0f}s ərzində yalnız L1 istifadə olunur: {error}")
+    with _shared_lock:
+        _shared_state["disabled_until"] = time.monotonic() + CACHE_SHARED_RETRY_SECONDS
+
+
+def _record_touches(keys: List[str]):
+    """L2 hit-lərini yığır; paket dolduqda və ya vaxtı çatdıqda bir UPDATE ilə yazır."""
+    with _shared_lock:
+        _pending_touches.update(keys)
+        now = time.monotonic()
+        if len(_pending_touches) < CACHE_TOUCH_BATCH and now - _shared_state["touched_at"] < CACHE_TOUCH_SECONDS:
+            return
+        keys = list(_pending_touches)
+        _pending_touches.clear()
+        _shared_state["touched_at"] = now
+
+    from app.database.cache_store import touch_entries
+    try:
+        touch_entries(keys)
+    except Exception as e:
+        print(f"WARNING: Keş last_hit_at yeniləməsi uğursuz oldu: {e}")
+
+
+def encode_vector(vector: List[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+
+def decode_vector(value: bytes) -> List[float]:
+    values = array.array("f")
+    values.frombytes(value)
+    return values.tolist()
+
+
+class TwoTierCache:
+    """Bir namespace üçün L1 (LRU) + L2 (PostgreSQL) keşi; dəyərlər L2-də bayt kimi saxlanılır."""
+
+    def __init__(self, namespace: str, ttl: int, encode: Callable, decode: Callable,
+                 max_items: int = CACHE_L1_MAX_ITEMS):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.encode = encode
+        self.decode = decode
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "l2_errors": 0, "l2_writes": 0}
+
+    def key(self, *parts: str) -> str:
+        digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _l1_put(self, key: str, value, ttl: Optional[float] = None):
+        # L2-dən gələn giriş öz expires_at-ından artıq yaşamır (ttl — qalan saniyə)
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, object]:
+        """Tapılan açar -> dəyər. Əvvəl L1, qalanlar bir L2 sorğusu ilə yoxlanılır."""
+        found, remaining = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    remaining.append(key)
+        self._count("l1_hits", len(found))
+
+        if remaining and _shared_available():
+            from app.database.cache_store import fetch_entries
+            try:
+                rows = fetch_entries(remaining)
+                if rows is None:
+                    raise ConnectionError("DB əlaqəsi yoxdur")
+            except Exception as e:
+                self._count("l2_errors")
+                _shared_failed(e)
+                rows = {}
+            for key, (value, ttl_left) in rows.items():
+                found[key] = self.decode(value)
+                self._l1_put(key, found[key], ttl_left)
+            self._count("l2_hits", len(rows))
+            if rows:
+                _record_touches(list(rows))
+
+        self._count("misses", len(set(keys)) - len(found))
+        return found
+
+    def put_many(self, values: Dict[str, object]):
+        for key, value in values.items():
+            self._l1_put(key, value)
+        if not values or not _shared_available():
+            return
+
+        from app.database.cache_store import store_entries, evict_entries
+        try:
+            if not store_entries(self.namespace, {k: self.encode(v) for k, v in values.items()}, self.ttl):
+                self._count("l2_errors")
+                return
+        except Exception as e:
+            self._count("l2_errors")
+            _shared_failed(e)
+            return
+        self._count("l2_writes", len(values))
+
+        with _shared_lock:
+            _shared_state["writes_since_evict"] += len(values)
+            run_eviction = _shared_state["writes_since_evict"] >= CACHE_EVICT_EVERY
+            if run_eviction:
+                _shared_state["writes_since_evict"] = 0
+        if run_eviction:
+            try:
+                deleted = evict_entries(int(CACHE_SHARED_MAX_MB * 1024 * 1024))
+                if deleted:
+                    print(f"INFO: Ortaq keşdən {deleted} giriş silindi (TTL/ölçü limiti).")
+            except Exception as e:
+                print(f"WARNING: Keş eviction uğursuz oldu: {e}")
+
+    def get_or_compute(self, keys: List[str], compute: Callable[[List[int]], List]) -> List:
+        """
+        `keys` sırası ilə dəyərlər qaytarır. Keşdə olmayanlar üçün compute(indekslər) bir dəfə
+        çağırılır (batch), nəticələr hər iki səviyyəyə yazılır.
+        """
+        if not CACHE_ENABLED:
+            return compute(list(range(len(keys))))
+
+        found = self.get_many(keys)
+        # Keşdə olmayan hər unikal açar üçün ilk indeks (təkrarlanan mətnlər bir dəfə hesablanır)
+        missing: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                missing.setdefault(key, i)
+        if missing:
+            computed = compute(list(missing.values()))
+            new_values = {key: value for key, value in zip(missing, computed)}
+            self.put_many(new_values)
+            found.update(new_values)
+        return [found[key] for key in keys]
+
+    def warm(self, limit: int = CACHE_WARM_ITEMS) -> int:
+        """L2-dən ən son istifadə olunmuş girişləri L1-ə yükləyir."""
+        if not CACHE_ENABLED or limit <= 0 or not _shared_available():
+            return 0
+        from app.database.cache_store import recent_entries
+        rows = recent_entries(self.namespace, min(limit, self.max_items))
+        if rows is None:
+            _shared_failed(ConnectionError("DB əlaqəsi yoxdur"))
+            return 0
+        # Ən köhnədən yeniyə yazılır ki, LRU sırası L2 ilə eyni olsun
+        for key, (value, ttl_left) in reversed(list(rows.items())):
+            self._l1_put(key, self.decode(value), ttl_left)
+        return len(rows)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["l1_hits"] + counters["l2_hits"] + counters["misses"]
+        return {
+            "l1_size": size,
+            **counters,
+            "l1_hit_rate": round(counters["l1_hits"] / lookups, 3) if lookups else 0.0,
+            "l2_hit_rate": round(counters["l2_hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+embedding_cache = TwoTierCache("embedding", CACHE_EMBEDDING_TTL, encode_vector, decode_vector)
+answer_cache = TwoTierCache(
+    "answer", CACHE_ANSWER_TTL, lambda text: text.encode("utf-8"), lambda value: value.decode("utf-8")
+)
+
+
+def warm_caches() -> Dict[str, int]:
+    """Startup zamanı (fon thread-də) çağırılır; DB əlçatmazdırsa səssizcə keçir."""
+    loaded = {}
+    for cache in (embedding_cache, answer_cache):
+        try:
+            loaded[cache.namespace] = cache.warm()
+        except Exception as e:
+            print(f"WARNING: '{cache.namespace}' keşi isidilmədi: {e}")
+    return loaded
+
+
+def cache_snapshot() -> Dict:
+    return {
+        "enabled": CACHE_ENABLED,
+        "shared_backend": CACHE_SHARED_BACKEND,
+        "shared_available": _shared_available(),
+        "embedding": embedding_cache.snapshot(),
+        "answer": answer_cache.snapshot(),
+    }
+
+
+class CachedEmbeddings:
+    """
+    ScheduledEmbeddings üçün keşli sarğı: yalnız keşdə olmayan mətnlər (bir batch-da) Gemini-yə göndərilir.
+    Açar: model + task_type + mətn.
+    """
+
+    def __init__(self, inner, model: str):
+        self._inner = inner
+        self.model = model
+
+    def _embed(self, texts: List[str], task_type: str, compute: Callable[[List[str]], List[List[float]]]):
+        keys = [embedding_cache.key(self.model, task_type, text) for text in texts]
+        with stage("embed"):
+            return embedding_cache.get_or_compute(keys, lambda indices: compute([texts[i] for i in indices]))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "RETRIEVAL_DOCUMENT", self._inner.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "RETRIEVAL_QUERY", lambda texts: [self._inner.embed_query(texts[0])])[0]
+
+    def embed_with_task(self, texts: List[str], task_type: str) -> List[List[float]]:
+        return self._embed(texts, task_type, lambda missing: self._inner.embed_with_task(missing, task_type))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_with_task(texts, "RETRIEVAL_QUERY")
+
+
+class CachedChatModel:
+    """
+    ScheduledChatModel üçün keşli sarğı. Model temperature=0 ilə deterministik işlədiyindən eyni
+    (model, system_instruction, prompt) üçün cavab təkrar istifadə olunur.
+    """
+
+    def __init__(self, inner, model: str):
+        self._inner = inner
+        self.model = model
+
+    def invoke(self, input, config=None, **kwargs):
+        with stage("generate"):
+            response = self._invoke(input, config, **kwargs)
+        system_instruction = (config or {}).get("system_instruction", "")
+        record_llm_usage(f"{system_instruction}\n{input}", response)
+        return response
+
+    def _invoke(self, input, config=None, **kwargs):
+        if not isinstance(input, str) or kwargs or not CACHE_ENABLED:
+            return self._inner.invoke(input, config=config, **kwargs)
+
+        system_instruction = (config or {}).get("system_instruction", "")
+        key = answer_cache.key(self.model, str(system_instruction), input)
+        cached = answer_cache.get_many([key])
+        if key in cached:
+            AIMessage = lazy_import("langchain_core.messages", "AIMessage")
+            return AIMessage(content=cached[key])
+
+        response = self._inner.invoke(input, config=config)
+        if isinstance(response.content, str):
+            answer_cache.put_many({key: response.content})
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
@@ -0,0 +1,344 @@
+# app/rag/gemini_scheduler.py
+import os
+import time
+import heapq
+import random
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# ---- Konfiqurasiya ----
+# Prioritet zolaqları: kiçik rəqəm = yüksək prioritet
+LANE_CHAT = "chat"
+LANE_COMPARE = "compare"
+LANE_INGESTION = "ingestion"
+
+LANE_PRIORITY = {
+    LANE_CHAT: 0,
+    LANE_COMPARE: 1,
+    LANE_INGESTION: 2,
+}
+
+# Hər zolaq üçün default deadline (saniyə) — sorğu öz deadline-ını vermədikdə istifadə olunur
+LANE_DEADLINES = {
+    LANE_CHAT: float(os.getenv("GEMINI_DEADLINE_CHAT", 60)),
+    LANE_COMPARE: float(os.getenv("GEMINI_DEADLINE_COMPARE", 120)),
+    LANE_INGESTION: float(os.getenv("GEMINI_DEADLINE_INGESTION", 600)),
+}
+
+GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", 1))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+GEMINI_INITIAL_CONCURRENCY = int(os.getenv("GEMINI_INITIAL_CONCURRENCY", 4))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 4))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", 0.5))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", 20))
+# Token başına gecikmə (çağırış növü üzrə) EWMA-dan bu qədər dəfə çox olduqda limit azaldılır
+GEMINI_LATENCY_TOLERANCE = float(os.getenv("GEMINI_LATENCY_TOLERANCE", 2.0))
+# Kiçik girişlər bu qədər token sayılır — qısa çağırışlarda sabit şəbəkə/model gecikməsi üstündür
+GEMINI_LATENCY_MIN_TOKENS = int(os.getenv("GEMINI_LATENCY_MIN_TOKENS", 256))
+
+# Cari sorğunun zolağı və mütləq deadline-ı (time.monotonic() əsasında)
+current_lane = contextvars.ContextVar("gemini_lane", default=LANE_CHAT)
+request_deadline = contextvars.ContextVar("gemini_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Gemini çağırışı sorğunun deadline-ı daxilində başlaya və ya bitə bilmədi."""
+
+
+@contextmanager
+def gemini_lane(lane: str):
+    """Blok daxilindəki bütün Gemini çağırışlarını verilmiş zolağa yönləndirir."""
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+@contextmanager
+def request_deadline_scope(deadline: Optional[float]):
+    """
+    Blok daxilində sorğu deadline-ını əvəz edir. None — sorğudan ayrılmış iş (məs. fon tapşırığı)
+    zolağın default deadline-ını istifadə edir.
+    """
+    token = request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Cari sorğunun deadline-ına qalan saniyə; deadline yoxdursa None. Keçibsə DeadlineExceeded."""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Sorğunun deadline-ı keçdi.")
+    return remaining
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """429 / RESOURCE_EXHAUSTED (kvota) xətalarını tanıyır."""
+    text = f"{type(exc).__name__} {exc}"
+    return "429" in text or "ResourceExhausted" in text or "RESOURCE_EXHAUSTED" in text
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """Təkrar cəhd etməyə dəyən müvəqqəti xətalar (kvota, 5xx, timeout)."""
+    if is_rate_limit_error(exc):
+        return True
+    text = f"{type(exc).__name__} {exc}"
+    return any(marker in text for marker in ("500", "502", "503", "504", "Unavailable", "ServiceUnavailable",
+                                             "InternalServerError", "Timeout", "timed out"))
+
+
+def input_tokens(value) -> int:
+    """Çağırış girişinin token sayının kobud qiyməti (~4 simvol = 1 token): mətn, mətn siyahısı və ya mesajlar."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return (len(value) + 3) // 4
+    if isinstance(value, (list, tuple)):
+        return sum(input_tokens(item) for item in value)
+    return input_tokens(getattr(value, "content", None))
+
+
+class _Ticket:
+    __slots__ = ("lane", "granted")
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.granted = False
+
+
+class GeminiScheduler:
+    """
+    Gemini (embedding + generasiya) çağırışları üçün ortaq planlayıcı.
+
+    - Prioritet zolaqları: chat > compare > ingestion
+    - AIMD adaptiv paralellik limiti: uğurlu çağırışda additiv artım, 429-da multiplikativ azalma —
+      limit "nəsli" başına bir dəfə (son azalmadan əvvəl başlamış çağırışların 429-ları limiti təkrar
+      yarıya bölmür). Yüksək gecikmədə də multiplikativ azalma olur, amma gecikmə çağırış növü üzrə
+      giriş tokeni başına müqayisə edilir — uzun prompt-un uzun cavabı yüklənmə siqnalı sayılmır.
+    - Jitter-li eksponensial təkrar cəhdlər və sorğu deadline-ları
+    """
+
+    def __init__(
+            self,
+            min_limit: int = GEMINI_MIN_CONCURRENCY,
+            max_limit: int = GEMINI_MAX_CONCURRENCY,
+            initial_limit: int = GEMINI_INITIAL_CONCURRENCY,
+            max_retries: int = GEMINI_MAX_RETRIES,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.max_retries = max_retries
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._waiting: List = []  # heap: (prioritet, sıra, ticket)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._latency_ewma: Dict[str, float] = {}
+        self._token_latency_ewma: Dict[str, float] = {}
+        self._generation = 0
+        self._counters = {
+            "completed_total": 0,
+            "errors_total": 0,
+            "throttled_total": 0,
+            "retries_total": 0,
+            "deadline_exceeded_total": 0,
+            "limit_decreases_total": 0,
+        }
+
+    # --- Növbə idarəetməsi ---
+
+    def _grant_waiting(self):
+        """Limit imkan verdikcə növbənin başındakı (ən yüksək prioritetli) sorğulara icazə verir."""
+        while self._waiting and self._in_flight < int(self._limit):
+            _, _, ticket = heapq.heappop(self._waiting)
+            ticket.granted = True
+            self._in_flight += 1
+        self._cond.notify_all()
+
+    def _acquire(self, lane: str, deadline: Optional[float]) -> int:
+        """Yer ayırır və çağırışın başladığı limit nəslini qaytarır."""
+        ticket = _Ticket(lane)
+        with self._cond:
+            # Deadline-ı keçmiş sorğu üçün boş yer olsa belə çağırış başladılmır
+            if deadline is not None and deadline <= time.monotonic():
+                self._counters["deadline_exceeded_total"] += 1
+                raise DeadlineExceeded(f"Gemini çağırışından əvvəl deadline keçdi (zolaq: {lane}).")
+            heapq.heappush(self._waiting, (LANE_PRIORITY.get(lane, len(LANE_PRIORITY)), next(self._seq), ticket))
+            self._grant_waiting()
+            while not ticket.granted:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    self._waiting = [entry for entry in self._waiting if entry[2] is not ticket]
+                    heapq.heapify(self._waiting)
+                    self._counters["deadline_exceeded_total"] += 1
+                    raise DeadlineExceeded(f"Gemini növbəsində deadline keçdi (zolaq: {lane}).")
+                self._cond.wait(timeout)
+            return self._generation
+
+    def _release(self, kind: str, latency: float, throttled: bool, failed: bool, generation: int,
+                 tokens: int = 0):
+        with self._cond:
+            self._in_flight -= 1
+
+            if throttled:
+                self._counters["throttled_total"] += 1
+                # Çağırış son azalmadan sonra başlayıbsa — yeni siqnal; əks halda həmin burst artıq nəzərə alınıb
+                if generation == self._generation:
+                    self._decrease(0.5)
+            elif not failed:
+                per_token = latency / max(tokens, GEMINI_LATENCY_MIN_TOKENS)
+                baseline = self._token_latency_ewma.get(kind)
+                if baseline is not None and per_token > baseline * GEMINI_LATENCY_TOLERANCE:
+                    # 429 kimi: limit nəsli başına bir azalma
+                    if generation == self._generation:
+                        self._decrease(0.9)
+                else:
+                    # Additiv artım: hər "tam pəncərə" uğurlu çağırışa təxminən +1
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                self._token_latency_ewma[kind] = per_token if baseline is None else 0.8 * baseline + 0.2 * per_token
+                raw = self._latency_ewma.get(kind)
+                self._latency_ewma[kind] = latency if raw is None else 0.8 * raw + 0.2 * latency
+
+            if failed:
+                self._counters["errors_total"] += 1
+            else:
+                self._counters["completed_total"] += 1
+
+            self._grant_waiting()
+
+    def _decrease(self, factor: float):
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        self._generation += 1
+        self._counters["limit_decreases_total"] += 1
+
+    # --- İctimai API ---
+
+    def run(self, fn: Callable, *args, lane: Optional[str] = None, deadline: Optional[float] = None,
+            kind: str = "generate", tokens: int = 0, **kwargs) -> Any:
+        """
+        `fn(*args, **kwargs)` çağırışını planlayıcı vasitəsilə icra edir.
+        `deadline` time.monotonic() əsasında mütləq vaxtdır; verilmədikdə kontekstdən
+        və ya zolağın default deadline-ından götürülür. `tokens` — girişin təxmini token sayı
+        (gecikmə ona bölünərək müqayisə olunur).
+        """
+        lane = lane or current_lane.get()
+        if deadline is None:
+            deadline = request_deadline.get()
+        if deadline is None:
+            deadline = time.monotonic() + LANE_DEADLINES.get(lane, LANE_DEADLINES[LANE_CHAT])
+
+        attempt = 0
+        while True:
+            generation = self._acquire(lane, deadline)
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                self._release(kind, time.monotonic() - started, throttled=throttled, failed=True,
+                              generation=generation, tokens=tokens)
+
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                # Full jitter: [0, min(max, base * 2^attempt)]
+                backoff = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * (2 ** attempt)))
+                if time.monotonic() + backoff >= deadline:
+                    with self._cond:
+                        self._counters["deadline_exceeded_total"] += 1
+                    raise DeadlineExceeded(f"Gemini təkrar cəhdi deadline-a sığmır (zolaq: {lane}).") from e
+
+                with self._cond:
+                    self._counters["retries_total"] += 1
+                print(f"WARNING: Gemini çağırışı uğursuz oldu ({type(e).__name__}), "
+                      f"{backoff:.2f}s sonra təkrar cəhd ({attempt + 1}/{self.max_retries}).")
+                time.sleep(backoff)
+                attempt += 1
+                continue
+
+            self._release(kind, time.monotonic() - started, throttled=False, failed=False, generation=generation,
+                          tokens=tokens)
+            return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Metrics üçün cari vəziyyət: növbə dərinliyi, limit, throttling sayğacları."""
+        with self._cond:
+            queue_depth = {lane: 0 for lane in LANE_PRIORITY}
+            for _, _, ticket in self._waiting:
+                queue_depth[ticket.lane] = queue_depth.get(ticket.lane, 0) + 1
+            return {
+                "concurrency_limit": round(self._limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": queue_depth,
+                "latency_ewma_ms": {k: round(v * 1000, 1) for k, v in self._latency_ewma.items()},
+                "latency_per_1k_tokens_ewma_ms": {k: round(v * 1e6, 1) for k, v in self._token_latency_ewma.items()},
+                **self._counters,
+            }
+
+
+_scheduler: Optional[GeminiScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GeminiScheduler:
+    """Proses üzrə yeganə planlayıcı obyektini qaytarır."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GeminiScheduler()
+    return _scheduler
+
+
+# --- Planlayıcıdan keçən klient sarğıları ---
+
+class ScheduledEmbeddings:
+    """
+    GoogleGenerativeAIEmbeddings çağırışlarını planlayıcıdan keçirir.
+    LangChain-in Embeddings interfeysini (embed_documents / embed_query) təmin edir; langchain_core-u
+    import etməmək üçün ondan miras alınmır.
+    """
+
+    def __init__(self, inner, scheduler: Optional[GeminiScheduler] = None):
+        self._inner = inner
+        self._scheduler = scheduler or get_scheduler()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._scheduler.run(self._inner.embed_documents, texts, kind="embed", tokens=input_tokens(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._scheduler.run(self._inner.embed_query, text, kind="embed", tokens=input_tokens(text))
+
+    def embed_with_task(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Mətnləri verilmiş Gemini task_type ilə bir batch embedding çağırışında vektorlaşdırır."""
+        return self._scheduler.run(self._inner.embed_documents, texts, task_type=task_type, kind="embed",
+                                   tokens=input_tokens(texts))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Çoxlu axtarış sorğusunu bir batch embedding çağırışı ilə vektorlaşdırır."""
+        return self.embed_with_task(texts, "RETRIEVAL_QUERY")
+
+
+class ScheduledChatModel:
+    """ChatGoogleGenerativeAI üçün sarğı: `invoke` planlayıcıdan keçir, qalan atributlar ötürülür."""
+
+    def __init__(self, inner, scheduler: Optional[GeminiScheduler] = None):
+        self._inner = inner
+        self._scheduler = scheduler or get_scheduler()
+
+    def invoke(self, input, config=None, **kwargs):
+        system_instruction = config.get("system_instruction") if isinstance(config, dict) else None
+        return self._scheduler.run(self._inner.invoke, input, config=config, kind="generate",
+                                   tokens=input_tokens(input) + input_tokens(system_instruction), **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
@@ -0,0 +1,186 @@
+# app/rag/incremental_compare.py
+"""
+/compare-excel üçün inkremental boşluq analizi.
+
+İş kitabı üç səviyyədə barmaq izi (sha256) ilə işarələnir: bütöv fayl, vərəq və sətir bloku.
+Hər səviyyənin kataloqla oxşarlıq nəticəsi (açıqlama başına ən yüksək skor) sessiya üzrə
+compare_blocks cədvəlində saxlanılır. Eyni sessiyada yenidən göndərilən iş kitabında yalnız
+məzmunu dəyişmiş bloklar embedding + oxşarlıq hesablamasından keçir; qalanları cədvəldən götürülür
+və np.maximum ilə birləşdirilir — nəticə tam hesablama ilə eynidir.
+
+Blok sərhədləri sətir məzmununun hash-indən asılıdır: bir xananın düzəlişi və ya sətir
+əlavəsi/silinməsi yalnız həmin bloku (ən çox qonşusunu) dəyişir, sonrakı blokları sürüşdürmür.
+Kataloq yenidən qurulduqda (DisclosureCatalog.version) köhnə nəticələr avtomatik istifadə olunmur.
+"""
+import os
+import hashlib
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.startup_report import lazy_import
+from app.rag.disclosure_catalog import (
+    CATALOG_MAX_EXCEL_ROWS, SIMILARITY_TASK_TYPE, analyze_gaps, embed_texts, get_disclosure_catalog, mark_truncated,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+COMPARE_INCREMENTAL_ENABLED = os.getenv("COMPARE_INCREMENTAL_ENABLED", "true").lower() == "true"
+# Orta blok ölçüsü (sətir); sərhəd tapılmasa blok 4 qat ölçüdə kəsilir
+COMPARE_BLOCK_ROWS = int(os.getenv("COMPARE_BLOCK_ROWS", 25))
+COMPARE_BLOCK_RETENTION_DAYS = int(os.getenv("COMPARE_BLOCK_RETENTION_DAYS", 30))
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def split_row_blocks(rows: List[str]) -> List[List[str]]:
+    """Sətirləri məzmundan asılı sərhədlərlə bloklara bölür."""
+    blocks, current = [], []
+    for row in rows:
+        current.append(row)
+        boundary = int(hashlib.sha256(row.encode("utf-8")).hexdigest()[:8], 16) % COMPARE_BLOCK_ROWS == 0
+        if boundary or len(current) >= COMPARE_BLOCK_ROWS * 4:
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _capped_sheets(sheet_rows: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """CATALOG_MAX_EXCEL_ROWS təhlükəsizlik limiti (analyze_gaps ilə eyni: faylın ilk N sətri)."""
+    capped, remaining = {}, CATALOG_MAX_EXCEL_ROWS
+    for sheet_name, rows in sheet_rows.items():
+        capped[sheet_name] = rows[:max(remaining, 0)]
+        remaining -= len(capped[sheet_name])
+    return capped
+
+
+def _fetch(session_id: str, fingerprints: List[str], size: int) -> Dict[str, "np.ndarray"]:
+    from app.database.compare_blocks import fetch_block_scores
+
+    np = lazy_import("numpy")
+    try:
+        rows = fetch_block_scores(session_id, fingerprints) or {}
+    except Exception as e:
+        print(f"WARNING: Əvvəlki müqayisə blokları oxunmadı, tam analiz edilir: {e}")
+        return {}
+    scores = {fingerprint: np.frombuffer(value, dtype=np.float32) for fingerprint, value in rows.items()}
+    # Kataloq ölçüsü uyğun gəlməyən qeydlər (nəzəri olaraq version ilə ayrılır) nəzərə alınmır
+    return {fingerprint: value for fingerprint, value in scores.items() if value.shape == (size,)}
+
+
+def _store(session_id: str, entries: Dict[str, "np.ndarray"], kinds: Dict[str, str]):
+    from app.database.compare_blocks import store_block_scores
+
+    if not entries:
+        return
+    try:
+        store_block_scores(
+            session_id,
+            {fingerprint: value.astype("float32").tobytes() for fingerprint, value in entries.items()},
+            kinds,
+            COMPARE_BLOCK_RETENTION_DAYS
+        )
+    except Exception as e:
+        print(f"WARNING: Müqayisə blokları saxlanmadı: {e}")
+
+
+def analyze_workbook_gaps(file_content: bytes, query: str,
+                          session_id: Optional[str]) -> Tuple[Optional[Dict[str, List[Dict]]], Optional[Dict]]:
+    """
+    Excel faylının kataloq əsaslı boşluq analizi: (gaps, statistika). Kataloq yoxdursa (None, None).
+    Statistika təkrar istifadə olunan/yenidən hesablanan vərəq və blokların sayını göstərir.
+    """
+    from app.rag.rag_service import EMBEDDING_MODEL, create_embeddings_client, excel_rows_as_text, excel_sheet_rows
+
+    if not COMPARE_INCREMENTAL_ENABLED or not session_id:
+        return analyze_gaps(excel_rows_as_text(file_content), query), None
+
+    catalog = get_disclosure_catalog()
+    if catalog is None:
+        return None, None
+
+    np = lazy_import("numpy")
+    size = len(catalog.entries)
+    namespace = _digest(catalog.version, EMBEDDING_MODEL, SIMILARITY_TASK_TYPE, str(CATALOG_MAX_EXCEL_ROWS))
+    embeddings = create_embeddings_client(os.getenv("GEMINI_API_KEY"))
+    stats = {"workbook_reused": False, "sheets": 0, "sheets_reused": 0,
+             "blocks": 0, "blocks_reused": 0, "rows_embedded": 0}
+
+    # 1. Eyni fayl: parse olunmadan əvvəlki nəticə
+    workbook_fingerprint = _digest(namespace, "workbook", hashlib.sha256(file_content).hexdigest())
+    cached = _fetch(session_id, [workbook_fingerprint], size)
+    if workbook_fingerprint in cached:
+        stats["workbook_reused"] = True
+        query_vector = embeddings.embed_with_task([query], SIMILARITY_TASK_TYPE)[0]
+        return catalog.gaps_from_scores(cached[workbook_fingerprint], query_vector), stats
+
+    # 2. Vərəq və blok barmaq izləri (bir DB sorğusu ilə yoxlanılır)
+    all_sheets = excel_sheet_rows(file_content)
+    rows_total = sum(len(rows) for rows in all_sheets.values())
+    sheets = _capped_sheets(all_sheets)
+    plan = {}
+    for sheet_name, rows in sheets.items():
+        blocks = [(_digest(namespace, "block", *block), block) for block in split_row_blocks(rows)]
+        plan[sheet_name] = (_digest(namespace, "sheet", sheet_name, *rows), blocks)
+    fingerprints = [fp for sheet_fp, blocks in plan.values() for fp in [sheet_fp] + [b for b, _ in blocks]]
+    cached = _fetch(session_id, fingerprints, size)
+
+    pending: List[Tuple[str, str, List[str]]] = []
+    pending_fingerprints = set()
+    for sheet_name, (sheet_fingerprint, blocks) in plan.items():
+        stats["sheets"] += 1
+        stats["blocks"] += len(blocks)
+        if sheet_fingerprint in cached:
+            stats["sheets_reused"] += 1
+            stats["blocks_reused"] += len(blocks)
+            continue
+        for block_fingerprint, block in blocks:
+            if block_fingerprint in cached:
+                stats["blocks_reused"] += 1
+            elif block_fingerprint not in pending_fingerprints:
+                pending_fingerprints.add(block_fingerprint)
+                pending.append((sheet_name, block_fingerprint, block))
+
+    # 3. Yalnız dəyişmiş bloklar + sorğu (CATALOG_EMBED_BATCH_SIZE-lik batch-lərlə)
+    texts = [row for _, _, block in pending for row in block] + [query]
+    vectors = embed_texts(embeddings, texts)
+    stats["rows_embedded"] = len(texts) - 1
+
+    new_entries: Dict[str, "np.ndarray"] = {}
+    kinds: Dict[str, str] = {}
+    offset = 0
+    for _, block_fingerprint, block in pending:
+        new_entries[block_fingerprint] = catalog.best_scores(vectors[offset:offset + len(block)])
+        kinds[block_fingerprint] = "block"
+        offset += len(block)
+
+    scores = {**cached, **new_entries}
+    sheet_scores = []
+    for sheet_fingerprint, blocks in plan.values():
+        if sheet_fingerprint not in scores:
+            block_scores = [scores[fp] for fp, _ in blocks]
+            scores[sheet_fingerprint] = (
+                np.maximum.reduce(block_scores) if block_scores else np.zeros(size, dtype=np.float32)
+            )
+            new_entries[sheet_fingerprint] = scores[sheet_fingerprint]
+            kinds[sheet_fingerprint] = "sheet"
+        sheet_scores.append(scores[sheet_fingerprint])
+
+    best_scores = np.maximum.reduce(sheet_scores) if sheet_scores else np.zeros(size, dtype=np.float32)
+    # Kəsilmiş (CATALOG_MAX_EXCEL_ROWS-dan böyük) fayl üçün fayl səviyyəli nəticə saxlanmır: parse olunmadan
+    # qaytarılsaydı "truncated" işarəsi itərdi
+    if rows_total <= CATALOG_MAX_EXCEL_ROWS:
+        new_entries[workbook_fingerprint] = best_scores
+        kinds[workbook_fingerprint] = "workbook"
+    _store(session_id, new_entries, kinds)
+
+    gaps = catalog.gaps_from_scores(best_scores, vectors[-1])
+    return mark_truncated(gaps, min(rows_total, CATALOG_MAX_EXCEL_ROWS), rows_total), stats
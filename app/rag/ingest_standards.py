@@ -3,9 +3,14 @@ from dotenv import load_dotenv
 from glob import glob
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.document_loaders.pdf import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import OpenSearchVectorSearch
 
+from app.rag.gemini_scheduler import ScheduledEmbeddings, current_lane, LANE_INGESTION
+from app.rag.gemini_cache import CachedEmbeddings
+from app.rag.structured_chunker import split_standard_documents
+from app.rag.chunk_schema import chunk_metadata
+from app.profiling import profiled
+
 load_dotenv()
 
 # --- Konfiqurasiya ---
@@ -31,10 +36,10 @@ def create_embeddings_client(api_key: str):
     os.environ['GEMINI_API_KEY'] = api_key
     os.environ['GOOGLE_API_KEY'] = api_key
 
-    return GoogleGenerativeAIEmbeddings(
+    return CachedEmbeddings(ScheduledEmbeddings(GoogleGenerativeAIEmbeddings(
         model="text-embedding-004",
         api_key=api_key
-    )
+    )), model="text-embedding-004")
 
 
 def get_opensearch_client_standards():
@@ -62,6 +67,7 @@ def get_opensearch_client_standards():
         return None
 
 
+@profiled("ingest_standards_documents")
 def ingest_standards_documents():
     """STANDARDS_DIR qovluğundakı bütün PDF fayllarını OpenSearch-ə yükləyir."""
 
@@ -79,11 +85,6 @@ def ingest_standards_documents():
     if vector_store is None:
         return
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2000,
-        chunk_overlap=200
-    )
-
     print(f"--- {len(pdf_files)} Standart Fayl İndekslənir ---")
 
     for file_path in pdf_files:
@@ -92,11 +93,15 @@ def ingest_standards_documents():
 
             loader = PyPDFLoader(file_path)
             documents = loader.load()
-            texts = text_splitter.split_documents(documents)
+            texts = split_standard_documents(documents, os.path.basename(file_path))
 
+            # Router metadata.source_file üzrə filtrləyir (rag_service.index_standards_from_directory ilə eyni)
             for doc in texts:
-                doc.metadata["source_type"] = "ESG_Standard"
-                doc.metadata["standard_name"] = os.path.basename(file_path)
+                doc.metadata = chunk_metadata(
+                    doc.metadata,
+                    standard_name=os.path.basename(file_path),
+                    source_file=os.path.basename(file_path)
+                )
 
             vector_store.add_documents(texts)
             print(f"✅ Uğurla indeksləndi: {len(texts)} chunks.")
@@ -112,4 +117,6 @@ if __name__ == "__main__":
         print("❌ XƏTA: GEMINI_API_KEY DƏYƏRİ TAPILMADI. Zəhmət olmasa, .env faylını yoxlayın.")
     else:
         print("✅ GEMINI API KEY TAPILDI. İndeksləməyə başlanır...")
+        # Bu skriptin bütün embedding çağırışları ingestion (aşağı prioritet) zolağındadır
+        current_lane.set(LANE_INGESTION)
         ingest_standards_documents()
\ No newline at end of file
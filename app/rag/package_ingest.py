@@ -0,0 +1,325 @@
+# app/rag/package_ingest.py
+"""
+Hesabat paketinin (bir neçə PDF/Excel faylı və ya ZIP arxivi) bir keçiddə indekslənməsi.
+
+Fayllar proses pool-unda paralel parse olunur. Hazır olan hər faylın chunk-ları dərhal ortaq
+embedding batch-lərinə (UPLOAD_EMBED_BATCH_SIZE) yığılır, batch-lər digər fayllar hələ parse
+olunarkən vektorlaşdırılır və bütün paket rag_knowledge_base-ə bir bulk əməliyyatı ilə yazılır.
+Beləliklə paketin ümumi müddəti faylların cəminə deyil, ən böyük faylın emalına yaxınlaşır.
+
+Lokal ölçmə (OpenSearch və GEMINI_API_KEY konfiqurasiya olunmuş mühitdə):
+    python -m app.rag.package_ingest illik_hesabat.pdf kpi_2024.xlsx paket.zip --session-id test
+"""
+import io
+import os
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import contextvars
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.profiling import profiled
+from app.rag.gemini_scheduler import gemini_lane, LANE_INGESTION
+from app.rag.retrieval_cache import bump_generation
+from app.rag.chunk_schema import chunk_metadata
+from app.rag.rag_service import INDEX_NAME, get_opensearch_client, load_and_split_file
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+UPLOAD_PARSE_WORKERS = int(os.getenv("UPLOAD_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+# Gemini batchEmbedContents bir çağırışda ən çox 100 mətn qəbul edir
+UPLOAD_EMBED_BATCH_SIZE = int(os.getenv("UPLOAD_EMBED_BATCH_SIZE", 100))
+UPLOAD_EMBED_CONCURRENCY = int(os.getenv("UPLOAD_EMBED_CONCURRENCY", 4))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", 50))
+# Paketin ümumi ölçüsü (birbaşa yüklənən fayllar + arxivlərin açılmış məzmunu)
+UPLOAD_MAX_UNPACKED_MB = int(os.getenv("UPLOAD_MAX_UNPACKED_MB", 200))
+# Tək faylın (birbaşa və ya arxiv daxilində) ölçü limiti
+UPLOAD_MAX_FILE_MB = int(os.getenv("UPLOAD_MAX_FILE_MB", 50))
+# Yüklənən fayllar bu ölçüdə hissələrlə oxunur — limit aşılan kimi oxuma dayanır
+UPLOAD_READ_CHUNK_BYTES = 1024 * 1024
+
+SUPPORTED_EXTENSIONS = (".pdf", ".xlsx", ".xls")
+ARCHIVE_EXTENSIONS = (".zip",)
+
+
+class PackageError(ValueError):
+    """Paket qəbul edilə bilmir (limitlər, zədəli arxiv, dəstəklənən fayl yoxdur)."""
+
+
+def _extension(filename: str) -> str:
+    return os.path.splitext(filename)[1].lower()
+
+
+async def read_uploads(uploads) -> List[Tuple[str, bytes]]:
+    """
+    UploadFile-ları hissə-hissə oxuyur (fayl_adı, məzmun). Fayl sayı, tək fayl (UPLOAD_MAX_FILE_MB) və
+    ümumi ölçü (UPLOAD_MAX_UNPACKED_MB) limiti aşılan kimi PackageError — böyük fayl yaddaşa tam oxunmur.
+    """
+    if len(uploads) > UPLOAD_MAX_FILES:
+        raise PackageError(f"Sorğuda {len(uploads)} fayl var, limit {UPLOAD_MAX_FILES}-dir.")
+    max_file_bytes = UPLOAD_MAX_FILE_MB * 1024 * 1024
+    max_total_bytes = UPLOAD_MAX_UNPACKED_MB * 1024 * 1024
+    total_bytes = 0
+    result = []
+    for upload in uploads:
+        # Starlette ölçünü əvvəlcədən bilirsə, oxumadan rədd edilir
+        declared = getattr(upload, "size", None)
+        if declared is not None and declared > max_file_bytes:
+            raise PackageError(f"'{upload.filename}' faylı {UPLOAD_MAX_FILE_MB} MB limitini aşır.")
+        parts, size = [], 0
+        while True:
+            part = await upload.read(UPLOAD_READ_CHUNK_BYTES)
+            if not part:
+                break
+            size += len(part)
+            total_bytes += len(part)
+            if size > max_file_bytes:
+                raise PackageError(f"'{upload.filename}' faylı {UPLOAD_MAX_FILE_MB} MB limitini aşır.")
+            if total_bytes > max_total_bytes:
+                raise PackageError(f"Paketin ümumi ölçüsü {UPLOAD_MAX_UNPACKED_MB} MB limitini aşır.")
+            parts.append(part)
+        result.append((upload.filename, b"".join(parts)))
+    return result
+
+
+def collect_package_files(uploads: List[Tuple[str, bytes]]) -> Tuple[List[Tuple[str, bytes]], List[Dict]]:
+    """
+    Yüklənən faylları və ZIP arxivlərinin içindəkiləri (fayl_adı, məzmun) siyahısına açır.
+    Dəstəklənməyən elementlər atılır və səbəbi ilə ikinci siyahıda qaytarılır.
+    Ölçü limitləri birbaşa fayllara və arxiv elementlərinə eyni qaydada tətbiq olunur.
+    """
+    files: List[Tuple[str, bytes]] = []
+    skipped: List[Dict] = []
+    unpacked_bytes = 0
+    max_bytes = UPLOAD_MAX_UNPACKED_MB * 1024 * 1024
+    max_file_bytes = UPLOAD_MAX_FILE_MB * 1024 * 1024
+    seen_names = set()
+
+    def add_file(name: str, content: bytes):
+        # source_file və hesabat fayl adı üzrədir — təkrarlanan adlar "(2)" şəkilçisi ilə ayrılır
+        stem, extension = os.path.splitext(name)
+        unique_name, copy = name, 1
+        while unique_name in seen_names:
+            copy += 1
+            unique_name = f"{stem} ({copy}){extension}"
+        seen_names.add(unique_name)
+        files.append((unique_name, content))
+
+    for filename, content in uploads:
+        extension = _extension(filename)
+        if extension in SUPPORTED_EXTENSIONS:
+            if len(content) > max_file_bytes:
+                raise PackageError(f"'{filename}' faylı {UPLOAD_MAX_FILE_MB} MB limitini aşır.")
+            unpacked_bytes += len(content)
+            if unpacked_bytes > max_bytes:
+                raise PackageError(f"Paketin ümumi ölçüsü {UPLOAD_MAX_UNPACKED_MB} MB limitini aşır.")
+            add_file(filename, content)
+            continue
+        if extension not in ARCHIVE_EXTENSIONS:
+            skipped.append({"filename": filename, "reason": f"dəstəklənməyən tip: {extension or '-'}"})
+            continue
+
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                for member in archive.infolist():
+                    name = member.filename
+                    base_name = os.path.basename(name)
+                    if member.is_dir() or name.startswith("__MACOSX/") or base_name.startswith("."):
+                        continue
+                    if _extension(base_name) not in SUPPORTED_EXTENSIONS:
+                        skipped.append({"filename": f"{filename}/{name}", "reason": "dəstəklənməyən tip"})
+                        continue
+                    # Açılmış ölçü limiti (zip bomb) — elan olunan ölçü oxumadan əvvəl yoxlanılır
+                    if member.file_size > max_file_bytes:
+                        raise PackageError(f"'{filename}/{name}' faylı {UPLOAD_MAX_FILE_MB} MB limitini aşır.")
+                    unpacked_bytes += member.file_size
+                    if unpacked_bytes > max_bytes:
+                        raise PackageError(f"Paketin ümumi ölçüsü {UPLOAD_MAX_UNPACKED_MB} MB limitini aşır.")
+                    add_file(base_name, archive.read(member))
+        except zipfile.BadZipFile:
+            raise PackageError(f"'{filename}' düzgün ZIP arxivi deyil.")
+
+    if len(files) > UPLOAD_MAX_FILES:
+        raise PackageError(f"Paketdə {len(files)} fayl var, limit {UPLOAD_MAX_FILES}-dir.")
+    return files, skipped
+
+
+def _parse_file(path: str, filename: str) -> Tuple[str, Optional[list], float]:
+    """Proses pool-unda işləyir: faylı chunk-lara bölür və parse müddətini qaytarır."""
+    started = time.perf_counter()
+    chunks = load_and_split_file(path, filename)
+    return filename, chunks, time.perf_counter() - started
+
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Parse üçün ortaq proses pool-u (ilk paketdə yaradılır və sonrakı sorğularda təkrar istifadə olunur).
+    'spawn' konteksti: fork server-in thread-lərini (planlayıcı, jurnal yazıcısı) uşaq prosesə köçürmür.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=UPLOAD_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    """Shutdown zamanı proses pool-unu bağlayır."""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+def _parse_all(paths: List[Tuple[str, str]]) -> Iterator[Tuple[str, Optional[list], float, Optional[Exception]]]:
+    """Faylları bitmə sırası ilə qaytarır: (fayl_adı, chunk-lar, parse_saniyə, xəta)."""
+    if len(paths) == 1 or UPLOAD_PARSE_WORKERS <= 1:
+        # Tək fayl üçün proses pool-una göndərmək yalnız IPC yükü əlavə edir
+        for path, filename in paths:
+            try:
+                yield (*_parse_file(path, filename), None)
+            except Exception as e:
+                yield filename, None, 0.0, e
+        return
+
+    pool = get_parse_pool()
+    futures: Dict[Future, str] = {pool.submit(_parse_file, path, filename): filename for path, filename in paths}
+    for future in as_completed(futures):
+        try:
+            yield (*future.result(), None)
+        except BrokenProcessPool as e:
+            # Uşaq proses çökübsə (məs. OOM), pool növbəti paket üçün yenidən yaradılır
+            shutdown_parse_pool()
+            yield futures[future], None, 0.0, e
+        except Exception as e:
+            yield futures[future], None, 0.0, e
+
+
+@profiled("ingest_package")
+def ingest_package(files: List[Tuple[str, bytes]], session_id: str) -> Dict:
+    """
+    Faylları paralel parse edir, chunk-ları ortaq embedding batch-lərində vektorlaşdırır və
+    bir bulk əməliyyatı ilə sessiyanın indeksinə yazır. Hər fayl üzrə nəticə və mərhələ vaxtlarını qaytarır.
+    Embedding və ya indeksləmə xətası istisna kimi ötürülür (paket ya tam, ya heç indekslənmir).
+    """
+    started = time.perf_counter()
+    vector_store = get_opensearch_client(INDEX_NAME)
+    if not vector_store:
+        raise RuntimeError("OpenSearch əlaqəsi qurulmadı.")
+    embeddings = vector_store.embedding_function
+
+    report = {filename: {"filename": filename, "status": "pending", "chunks": 0} for filename, _ in files}
+    temp_dir = tempfile.mkdtemp(prefix="upload_package_")
+    texts: List[str] = []
+    metadatas: List[Dict] = []
+    batches: List[Tuple[int, int, Future]] = []
+    timings = {}
+
+    try:
+        paths = []
+        for position, (filename, content) in enumerate(files):
+            path = os.path.join(temp_dir, f"{position}_{os.path.basename(filename)}")
+            with open(path, "wb") as f:
+                f.write(content)
+            paths.append((path, filename))
+
+        # Bütün Gemini çağırışları ingestion zolağındadır; copy_context zolağı embedding thread-lərinə ötürür
+        with gemini_lane(LANE_INGESTION), ThreadPoolExecutor(max_workers=max(1, UPLOAD_EMBED_CONCURRENCY)) as embed_pool:
+            submitted = 0
+
+            def submit_batches(final: bool = False):
+                nonlocal submitted
+                while len(texts) - submitted >= UPLOAD_EMBED_BATCH_SIZE or (final and len(texts) > submitted):
+                    end = min(submitted + UPLOAD_EMBED_BATCH_SIZE, len(texts))
+                    context = contextvars.copy_context()
+                    batches.append((submitted, end, embed_pool.submit(context.run, embeddings.embed_documents, texts[submitted:end])))
+                    submitted = end
+
+            for filename, chunks, parse_seconds, error in _parse_all(paths):
+                entry = report[filename]
+                entry["parse_ms"] = round(parse_seconds * 1000, 1)
+                if error is not None or chunks is None:
+                    entry["status"] = "error"
+                    entry["error"] = str(error) if error else "dəstəklənməyən tip"
+                    print(f"ERROR: Paket faylı emal olunmadı ({filename}): {entry['error']}")
+                    continue
+
+                for doc in chunks:
+                    texts.append(doc.page_content)
+                    metadatas.append(chunk_metadata(doc.metadata, session_id=session_id, source_file=filename))
+                entry["status"] = "indexed"
+                entry["chunks"] = len(chunks)
+                submit_batches()
+
+            submit_batches(final=True)
+            timings["parse_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+            vectors: List[List[float]] = []
+            for _, _, future in batches:
+                vectors.extend(future.result())
+            timings["embed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        if texts:
+            # bulk_size LangChain-də sənəd sayı üçün yuxarı limitdir; sorğular helpers.bulk ilə baytlara görə bölünür
+            vector_store.add_embeddings(
+                list(zip(texts, vectors)),
+                metadatas=metadatas,
+                bulk_size=max(len(texts), vector_store.bulk_size)
+            )
+            # Bu sessiyanın keşlənmiş axtarış nəticələri etibarsız olur — yeni fayllar dərhal görünür
+            bump_generation(INDEX_NAME, session_id)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f"SUCCESS: Paket: {len(files)} fayl, {len(texts)} parça, {len(batches)} embedding batch-i "
+          f"{session_id} sessiyası üçün {timings['total_ms']} ms-də indeksləndi.")
+    return {
+        "session_id": session_id,
+        "files": list(report.values()),
+        "total_chunks": len(texts),
+        "embedding_batches": len(batches),
+        "timings_ms": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hesabat paketini bir keçiddə indeksləyir və vaxtları çap edir.")
+    parser.add_argument("paths", nargs="+", help="PDF, XLSX, XLS və ya ZIP faylları")
+    parser.add_argument("--session-id", required=True)
+    args = parser.parse_args()
+
+    uploads = []
+    for path in args.paths:
+        with open(path, "rb") as f:
+            uploads.append((os.path.basename(path), f.read()))
+
+    files, skipped = collect_package_files(uploads)
+    for item in skipped:
+        print(f"WARNING: Ötürüldü: {item['filename']} ({item['reason']})")
+
+    result = ingest_package(files, args.session_id)
+    for entry in result["files"]:
+        print(f"  {entry['filename']}: {entry['status']}, {entry['chunks']} parça, parse {entry.get('parse_ms', 0)} ms")
+    slowest = max((entry.get("parse_ms", 0) for entry in result["files"]), default=0)
+    print(f"INFO: Ən uzun parse {slowest} ms, cəmi {sum(e.get('parse_ms', 0) for e in result['files'])} ms; "
+          f"mərhələlər: {result['timings_ms']}")
+    shutdown_parse_pool()
+
+
+if __name__ == "__main__":
+    main()
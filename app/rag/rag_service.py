@@ -1,17 +1,22 @@
 import os
+import io
+import asyncio
 from dotenv import load_dotenv
 from fastapi import UploadFile
-from tempfile import NamedTemporaryFile
-from typing import List
-from typing import Optional
-from opensearchpy import OpenSearch
+from typing import Dict, List, Optional, Tuple
 import shutil  # Fayl kopyalama
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.document_loaders import UnstructuredExcelLoader  # <<< EXCEL LOADER
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import OpenSearchVectorSearch
+# QEYD: LangChain, langchain_google_genai, langchain_community loader-ləri, opensearch-py və pandas
+# ağır modullardır — worker-in sürətli işə düşməsi üçün onlar ilk istifadədə (lazy_import) yüklənir.
+from app.startup_report import lazy_import
+from app.profiling import profiled
+from app.rag.gemini_scheduler import (
+    ScheduledEmbeddings, ScheduledChatModel, gemini_lane, remaining_time, LANE_INGESTION,
+)
+from app.rag.retrieval_cache import bump_generation, cache_key, retrieval_cache
+from app.rag.gemini_cache import CachedEmbeddings, CachedChatModel
+from app.rag.chunk_schema import chunk_metadata
+from app.query_log import record_retrieval, stage
 
 # ... (digər importlar)
 
@@ -19,6 +24,7 @@ load_dotenv()
 
 # ---- Konfiqurasiya ----
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+EMBEDDING_MODEL = "text-embedding-004"
 
 client = None
 
@@ -30,29 +36,38 @@ STANDARDS_INDEX_NAME = "esg_standards"  # Sizin standart fayllarınız
 # --- KLİENT YARATMA FUNKSİYALARI ---
 
 def create_embeddings_client(api_key: str):
-    """Embeddings obyektini yaradır."""
+    """Embeddings obyektini yaradır. Bütün çağırışlar ortaq Gemini planlayıcısından keçir."""
     if not api_key:
         raise ValueError("GEMINI_API_KEY mühit dəyişəni tapılmadı! Zəhmət olmasa terminalda export edin.")
 
     os.environ['GEMINI_API_KEY'] = api_key
     os.environ['GOOGLE_API_KEY'] = api_key
 
-    return GoogleGenerativeAIEmbeddings(
-        model="text-embedding-004",
+    GoogleGenerativeAIEmbeddings = lazy_import("langchain_google_genai", "GoogleGenerativeAIEmbeddings")
+    # langchain-google-genai>=4 embedding klienti google-genai-ya retry_options vermir — SDK təkrar cəhd etmir,
+    # 429-lar planlayıcının AIMD-sinə çatır
+    # Keş planlayıcıdan əvvəl yoxlanılır: keşdə olan mətnlər Gemini kvotasını istifadə etmir
+    return CachedEmbeddings(ScheduledEmbeddings(GoogleGenerativeAIEmbeddings(
+        model=EMBEDDING_MODEL,
         api_key=api_key
-    )
+    )), model=EMBEDDING_MODEL)
 
 
 def create_llm_client(api_key: str):
-    """LLM obyektini yaradır. Gemini modeli istifadə olunur."""
+    """LLM obyektini yaradır. Gemini modeli istifadə olunur, çağırışlar planlayıcıdan keçir."""
     if not api_key:
         raise ValueError("GEMINI_API_KEY mühit dəyişəni tapılmadı.")
 
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
+    ChatGoogleGenerativeAI = lazy_import("langchain_google_genai", "ChatGoogleGenerativeAI")
+    model = "gemini-2.5-flash"
+    return CachedChatModel(ScheduledChatModel(ChatGoogleGenerativeAI(
+        model=model,
         api_key=api_key,
-        temperature=0.0
-    )
+        temperature=0.0,
+        # 429 və təkrar cəhdləri planlayıcı idarə edir: max_retries=1 google-genai-da attempts=1 (yalnız
+        # ilkin sorğu) deməkdir; 0 isə SDK-nın default təkrarlarını aktivləşdirir (langchain-google-genai>=4)
+        max_retries=1
+    )), model=model)
 
 def get_opensearch_client(index_name: str):
     """OpenSearch vektor bazası bağlantısını verir."""
@@ -86,6 +101,7 @@ def get_opensearch_client(index_name: str):
         # 2. OpenSearch Klientini Yaradıb Bağlantını Yoxlayırıq (Ping)
         # Ping uğursuz olsa belə, bu, Langchain obyektini yaratmağa mane olmamalıdır.
         # Əgər Ping bu qısa müddətdə dərhal xəta verirsə, bu Kod 128-in səbəbidir.
+        OpenSearch = lazy_import("opensearchpy", "OpenSearch")
         raw_client = OpenSearch(
             hosts=[{'host': HOST_V, 'port': PORT_V}],
             http_auth=(USER_V, PASSWORD_V),
@@ -106,10 +122,7 @@ def get_opensearch_client(index_name: str):
             # Əgər Ping zamanı birbaşa Connection Refused gəlirsə, onu çap edirik.
             print(f"ERROR: OpenSearch Ping zamanı kritik xəta: {ping_e}")
 
-        index_args = {}
-        if index_name == STANDARDS_INDEX_NAME:
-            index_args = {"pipeline": "pdf_date_fixer"}
-
+        OpenSearchVectorSearch = lazy_import("langchain_community.vectorstores", "OpenSearchVectorSearch")
         return OpenSearchVectorSearch(
             index_name=index_name,
             embedding_function=embeddings,
@@ -119,7 +132,6 @@ def get_opensearch_client(index_name: str):
             verify_certs=False,
             ssl_assert_hostname=False,
             ssl_show_warn=False,
-            index_kwargs=index_args,
             client_kwargs=client_kwargs
         )
     except Exception as e:
@@ -128,58 +140,33 @@ def get_opensearch_client(index_name: str):
         return None
 
 
-def create_pipeline_if_not_exists():
-    """OpenSearch daxilində PDF metadata xətasını düzəldən pipeline-ı yaradır."""
-
+def get_raw_opensearch_client(**client_kwargs):
+    """
+    LangChain sarğısı olmadan birbaşa opensearch-py klientini qaytarır (bulk, scroll, pipeline və s. üçün).
+    Env dəyişənləri natamamdırsa None qaytarır.
+    """
     HOST_V = os.getenv("OPENSEARCH_HOSTS")
     PORT_STR_V = os.getenv("OPENSEARCH_PORT")
     USER_V = os.getenv("OPENSEARCH_USER")
     PASSWORD_V = os.getenv("OPENSEARCH_PASSWORD")
 
     if not (HOST_V and PORT_STR_V and PORT_STR_V.isdigit() and USER_V and PASSWORD_V):
-        print("WARNING: OpenSearch Env Variables incomplete for Pipeline creation.")
-        return False
-
-    try:
-        client = OpenSearch(
-            hosts=[{'host': HOST_V, 'port': int(PORT_STR_V)}],
-            http_auth=(USER_V, PASSWORD_V),
-            use_ssl=True,
-            verify_certs=False,
-            ssl_assert_hostname=False,
-            ssl_show_warn=False
-        )
-
-        pipeline_name = "pdf_date_fixer"
-
-        if client.ingest.get_pipeline(id=pipeline_name, ignore=[404]):
-            print(f"INFO: Pipeline '{pipeline_name}' already exists.")
-            return True
-
-        print(f"INFO: Creating Pipeline '{pipeline_name}' via Python client...")
-
-        client.ingest.put_pipeline(
-            id=pipeline_name,
-            body={
-                "description": "PDF metadata.moddate field cleaner for D:YYYYMMDDhhmmss format",
-                "processors": [
-                    {"grok": {"field": "metadata.moddate", "patterns": ["D:%{NOTSPACE:metadata.moddate_cleaned}"],
-                              "if": "ctx.metadata.moddate != null && ctx.metadata.moddate.startsWith(\"D:\")"}},
-                    {"date": {"field": "metadata.moddate_cleaned", "target_field": "metadata.moddate",
-                              "formats": ["yyyyMMddHHmmss"], "timezone": "UTC"}},
-                    {"remove": {"field": "metadata.moddate_cleaned", "if": "ctx.metadata.moddate_cleaned != null"}}
-                ]
-            }
-        )
-        print(f"SUCCESS: Pipeline '{pipeline_name}' created.")
-        return True
+        return None
 
-    except Exception as e:
-        print(f"ERROR: Failed to create or check pipeline: {e}")
-        return False
+    OpenSearch = lazy_import("opensearchpy", "OpenSearch")
+    return OpenSearch(
+        hosts=[{'host': HOST_V, 'port': int(PORT_STR_V)}],
+        http_auth=(USER_V, PASSWORD_V),
+        use_ssl=True,
+        verify_certs=False,
+        ssl_assert_hostname=False,
+        ssl_show_warn=False,
+        **client_kwargs
+    )
 
 
 # --- STANDARTLARIN AVTOMATİK İNDEKSLƏNMƏSİ FUNKSİYASI ---
+@profiled("index_standards_from_directory")
 def index_standards_from_directory(directory_path: str):
     """
     Verilmiş qovluqdan PDF sənədlərini oxuyur və onları esg_standards indeksinə yükləyir.
@@ -196,6 +183,18 @@ def index_standards_from_directory(directory_path: str):
     except Exception as e:
         print(f"WARNING: Could not check index existence: {e}. Attempting to index.")
 
+    # Snapshot artefaktı varsa, PDF-ləri yenidən embed etmək əvəzinə ondan bulk yükləyirik
+    from app.rag.standards_snapshot import STANDARDS_SNAPSHOT_PATH, import_snapshot
+    if STANDARDS_SNAPSHOT_PATH and os.path.exists(STANDARDS_SNAPSHOT_PATH):
+        try:
+            print(f"INFO: Loading standards from snapshot {STANDARDS_SNAPSHOT_PATH}...")
+            _, failed = import_snapshot(STANDARDS_SNAPSHOT_PATH, STANDARDS_INDEX_NAME, client=vector_store.client)
+            if failed:
+                print(f"WARNING: Snapshot-dan {failed} sənəd yüklənmədi; standartlar indeksi natamamdır.")
+            return
+        except Exception as e:
+            print(f"ERROR: Snapshot yüklənməsi uğursuz oldu: {e}. PDF-lərdən indeksləməyə keçilir.")
+
     if not os.path.exists(directory_path):
         print(f"WARNING: Standards directory not found at {directory_path}. Skipping indexing.")
         return
@@ -208,6 +207,9 @@ def index_standards_from_directory(directory_path: str):
 
     print(f"INFO: Starting indexing of {len(pdf_files)} standards files...")
 
+    PyPDFLoader = lazy_import("langchain_community.document_loaders", "PyPDFLoader")
+    from app.rag.structured_chunker import split_standard_documents
+
     total_chunks = 0
     for filename in pdf_files:
         file_path = os.path.join(directory_path, filename)
@@ -216,14 +218,20 @@ def index_standards_from_directory(directory_path: str):
             loader = PyPDFLoader(file_path)
             docs = loader.load()
 
-            splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
-            chunks = splitter.split_documents(docs)
+            # Açıqlama sərhədlərinə uyğun chunk-lar (disclosure_id/page metadata ilə)
+            chunks = split_standard_documents(docs, filename)
 
+            # Yalnız sxem sahələri indeksə yazılır (tarix klient tərəfində normallaşdırılır)
             for doc in chunks:
-                doc.metadata["standard_name"] = filename.replace('.pdf', '').replace('.PDF', '')
-                doc.metadata["source_file"] = filename
-
-            vector_store.add_documents(chunks)
+                doc.metadata = chunk_metadata(
+                    doc.metadata,
+                    standard_name=filename.replace('.pdf', '').replace('.PDF', ''),
+                    source_file=filename
+                )
+
+            with gemini_lane(LANE_INGESTION):
+                vector_store.add_documents(chunks)
+            bump_generation(STANDARDS_INDEX_NAME)
             total_chunks += len(chunks)
             print(f"Indexed {len(chunks)} chunks from {filename}")
 
@@ -234,6 +242,49 @@ def index_standards_from_directory(directory_path: str):
 
 
 
+def load_and_split_file(file_path: str, filename: str) -> Optional[list]:
+    """
+    Diskdəki PDF/Excel faylını yükləyir, təmizləyir və chunk-lara bölür (indeksləmədən).
+    Dəstəklənməyən tipdə None qaytarır. Çoxfaylı yükləmədə proses pool-unda da çağırılır.
+    """
+    file_extension = os.path.splitext(filename)[1].lower()
+
+    # --- LOADER SEÇİMİ ---
+    if file_extension == '.pdf':
+        print("INFO: Loading file with PyMuPDFLoader...")
+        PyPDFLoader = lazy_import("langchain_community.document_loaders", "PyPDFLoader")
+        loader = PyPDFLoader(file_path)
+    elif file_extension in ['.xlsx', '.xls']:  # <<< EXCEL DƏSTƏYİ
+        print("INFO: Loading file with UnstructuredExcelLoader...")
+        # Problem 1 (Format Xətası) ehtimalını azaltmaq üçün 'mode="elements"' çıxarılır
+        UnstructuredExcelLoader = lazy_import("langchain_community.document_loaders", "UnstructuredExcelLoader")
+        loader = UnstructuredExcelLoader(file_path)
+    else:
+        print(f"ERROR: load_and_split_file received unsupported file type: {file_extension}")
+        return None
+
+    # 1. Faylı yükləyirik
+    docs = loader.load()
+
+    # 2. <<< Problem 2 Həlli: Məzmunun Təmizlənməsi (Sanitizasiya) >>>
+    for doc in docs:
+        if doc.page_content:
+            # Ulduzları ('*') boşluqla əvəz edirik (Markdown formatını aradan qaldırır)
+            doc.page_content = doc.page_content.replace('*', ' ')
+            # Birdən çox olan boşluqları tək boşluğa çeviririk (əlavə təmizlik)
+            doc.page_content = ' '.join(doc.page_content.split())
+    # -------------------------------------------------------------
+
+    # 3. Məzmunu parçalara ayırırıq
+    RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=2000,
+        chunk_overlap=200
+    )
+    return splitter.split_documents(docs)
+
+
+@profiled("process_and_index_file")
 def process_and_index_file(uploaded_file: UploadFile, session_id: str) -> bool:
     """PDF/EXCEL sənədini emal edib İSTİFADƏÇİ bazasına indeksləyir"""
     temp_path = None
@@ -249,46 +300,19 @@ def process_and_index_file(uploaded_file: UploadFile, session_id: str) -> bool:
             shutil.copyfileobj(uploaded_file.file, f)
             temp_path = temp_filepath
 
-        file_extension = os.path.splitext(uploaded_file.filename)[1].lower()
-
-        # --- LOADER SEÇİMİ ---
-        if file_extension == '.pdf':
-            print("INFO: Loading file with PyMuPDFLoader...")
-            loader = PyPDFLoader(temp_path)
-        elif file_extension in ['.xlsx', '.xls']:  # <<< EXCEL DƏSTƏYİ
-            print("INFO: Loading file with UnstructuredExcelLoader...")
-            # Problem 1 (Format Xətası) ehtimalını azaltmaq üçün 'mode="elements"' çıxarılır
-            loader = UnstructuredExcelLoader(temp_path)
-        else:
-            print(f"ERROR: process_and_index_file received unsupported file type: {file_extension}")
+        chunks = load_and_split_file(temp_path, uploaded_file.filename)
+        if chunks is None:
             return False
 
-        # 1. Faylı yükləyirik
-        docs = loader.load()
-
-        # 2. <<< Problem 2 Həlli: Məzmunun Təmizlənməsi (Sanitizasiya) >>>
-        for doc in docs:
-            if doc.page_content:
-                # Ulduzları ('*') boşluqla əvəz edirik (Markdown formatını aradan qaldırır)
-                doc.page_content = doc.page_content.replace('*', ' ')
-                # Birdən çox olan boşluqları tək boşluğa çeviririk (əlavə təmizlik)
-                doc.page_content = ' '.join(doc.page_content.split())
-        # -------------------------------------------------------------
-
-        # 3. Məzmunu parçalara ayırırıq
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=200
-        )
-        chunks = splitter.split_documents(docs)
-
-        # 4. Metadata əlavə edirk
+        # 4. Metadata əlavə edirk (yalnız sxem sahələri; session_id Problem 3 üçün əsas)
         for doc in chunks:
-            doc.metadata["session_id"] = session_id  # Problem 3 üçün əsas
-            doc.metadata["source_file"] = uploaded_file.filename
+            doc.metadata = chunk_metadata(doc.metadata, session_id=session_id, source_file=uploaded_file.filename)
 
-        # 5. OpenSearch-ə indeksləyirik
-        vector_store.add_documents(chunks)
+        # 5. OpenSearch-ə indeksləyirik (embedding-lər ingestion zolağından keçir)
+        with gemini_lane(LANE_INGESTION):
+            vector_store.add_documents(chunks)
+        # Bu sessiyanın keşlənmiş axtarış nəticələri etibarsız olur — yeni fayl dərhal görünür
+        bump_generation(INDEX_NAME, session_id)
 
         print(f"SUCCESS: {len(chunks)} parça {session_id} sessiyası üçün indeksləndi.")
         return True
@@ -328,8 +352,10 @@ async def extract_excel_context_for_comparison(uploaded_file: UploadFile) -> Opt
             return None
 
         # 2. Faylı yükləyirik
+        UnstructuredExcelLoader = lazy_import("langchain_community.document_loaders", "UnstructuredExcelLoader")
         loader = UnstructuredExcelLoader(temp_path)
-        docs = loader.load()
+        # Parse bloklayan işdir — event loop-u tutmasın deyə thread-də
+        docs = await asyncio.to_thread(loader.load)
 
         # 3. Məzmunu təmizləyirik (Markdown, * simvolları və artıq boşluqlar)
         for doc in docs:
@@ -338,6 +364,7 @@ async def extract_excel_context_for_comparison(uploaded_file: UploadFile) -> Opt
                 doc.page_content = ' '.join(doc.page_content.split())
 
         # 4. Məzmunu parçalara ayırırıq
+        RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=2000,
             chunk_overlap=200
@@ -367,6 +394,38 @@ async def extract_excel_context_for_comparison(uploaded_file: UploadFile) -> Opt
                 print(f"WARNING: Temp faylın silinməsi uğursuz oldu: {cleanup_e}")
 
 
+def excel_sheet_rows(file_content: bytes) -> Dict[str, List[str]]:
+    """
+    Excel faylının hər vərəqini oxuyur və başlıqları + hər sətri "başlıq: dəyər" mətnlərinə çevirir
+    (vərəq adı üzrə, faylın sırası ilə).
+    """
+    pd = lazy_import("pandas")
+    sheet_rows = {}
+    sheets = pd.read_excel(io.BytesIO(file_content), sheet_name=None, dtype=str)
+    for sheet_name, df in sheets.items():
+        rows = sheet_rows.setdefault(str(sheet_name), [])
+        df = df.dropna(how="all").fillna("")
+        headers = [str(column) for column in df.columns]
+        named_headers = [h for h in headers if not h.startswith("Unnamed")]
+        if named_headers:
+            rows.append(f"[{sheet_name}] " + " | ".join(named_headers))
+
+        for record in df.itertuples(index=False):
+            cells = [f"{h}: {v}" for h, v in zip(headers, record) if str(v).strip()]
+            if cells:
+                rows.append(f"[{sheet_name}] " + "; ".join(cells))
+
+    return sheet_rows
+
+
+def excel_rows_as_text(file_content: bytes) -> List[str]:
+    """
+    Bütün vərəqlərin sətir mətnləri bir siyahıda.
+    Açıqlama kataloqu ilə vektorlaşdırılmış müqayisə üçün istifadə olunur.
+    """
+    return [row for rows in excel_sheet_rows(file_content).values() for row in rows]
+
+
 # --- Çoxlu Bazadan Axtarış Funksiyaları (MULTI-SOURCE RAG) ---
 # ... (Bu hissə dəyişməz qalır) ...
 
@@ -382,29 +441,191 @@ def search_knowledge_base(query: str, session_id: str) -> List[str]:
         }
     }
 
-    docs = vector_store.similarity_search(
-        query=query,
-        k=4,
-        filter=opensearch_filter
-    )
+    vector = vector_store.embedding_function.embed_query(query)
+    key = cache_key(INDEX_NAME, vector, 4, opensearch_filter, session_id=session_id)
+    sources = cached_search(vector_store.client, INDEX_NAME, key,
+                            knn_search_body(vector, k=4, boolean_filter=opensearch_filter))
+
+    return [src.get(TEXT_FIELD, "") for src in sources]
+
+
+def format_standards_context(standard_name: Optional[str], text: str) -> str:
+    return f"[{standard_name or 'Naməlum Standart'}]: {text}"
 
-    return [d.page_content for d in docs]
+
+def format_standards_sources(sources: List[Dict]) -> List[str]:
+    return [
+        format_standards_context(src.get("metadata", {}).get("standard_name"), src.get(TEXT_FIELD, ""))
+        for src in sources
+    ]
 
 
 def search_standards_base(query: str) -> List[str]:
-    # ...
+    """
+    Standartlar bazasında axtarış. Sorğu konkret standartlara yönləndirilə bilirsə (standards_router),
+    kNN yalnız həmin standartların chunk-ları üzrə aparılır; əks halda bütün indeks üzrə axtarılır.
+    """
+    from app.rag.standards_router import get_standards_router, routed_knn_body
+
     vector_store = get_opensearch_client(STANDARDS_INDEX_NAME)
     if not vector_store:
         return []
 
-    docs = vector_store.similarity_search(
-        query=query,
-        k=4
-    )
+    vector = vector_store.embedding_function.embed_query(query)
+
+    source_files = get_standards_router().route(query, vector)
+    if source_files:
+        key = cache_key(STANDARDS_INDEX_NAME, vector, 4, {"source_files": source_files})
+        sources = cached_search(vector_store.client, STANDARDS_INDEX_NAME, key,
+                                routed_knn_body(vector, 4, source_files))
+        if sources:
+            return format_standards_sources(sources)
+
+    key = cache_key(STANDARDS_INDEX_NAME, vector, 4)
+    sources = cached_search(vector_store.client, STANDARDS_INDEX_NAME, key, knn_search_body(vector, k=4))
+
+    return format_standards_sources(sources)
+
+
+# --- BATCH AXTARIŞ (/chat/batch üçün) ---
+# OpenSearchVectorSearch-in default sahə adları
+VECTOR_FIELD = "vector_field"
+TEXT_FIELD = "text"
+
+
+def knn_search_body(vector: List[float], k: int = 4, boolean_filter: Optional[Dict] = None) -> Dict:
+    """
+    OpenSearchVectorSearch.similarity_search(filter=...) ilə eyni formada approximate kNN sorğusu qurur.
+    """
+    knn_clause = {"knn": {VECTOR_FIELD: {"vector": vector, "k": k}}}
+    if not boolean_filter:
+        return {"size": k, "query": knn_clause}
+    return {"size": k, "query": {"bool": {"filter": boolean_filter, "must": [knn_clause]}}}
+
 
-    context_list = []
-    for d in docs:
-        standard_name = d.metadata.get("standard_name", "Naməlum Standart")
-        context_list.append(f"[{standard_name}]: {d.page_content}")
+def _search_request(body: Dict) -> Dict:
+    # Vektorlar nəticədə lazım deyil — cavab ölçüsü və keşin yaddaşı kiçilir
+    return {**body, "_source": {"excludes": [VECTOR_FIELD]}}
 
-    return context_list
\ No newline at end of file
+
+def _search_timeout() -> Dict:
+    # Sorğunun deadline-ı varsa OpenSearch çağırışı ondan uzun gözləmir
+    remaining = remaining_time()
+    return {"request_timeout": remaining} if remaining is not None else {}
+
+
+def _hit_sources(response: Dict) -> List[Dict]:
+    # Chunk ID-si və skoru sorğu jurnalı üçün saxlanılır
+    return [{**hit["_source"], "_id": hit["_id"], "_score": hit.get("_score")} for hit in response["hits"]["hits"]]
+
+
+def cached_search(client, index_name: str, key: Tuple, body: Dict) -> List[Dict]:
+    """
+    kNN sorğusunu retrieval keşi vasitəsilə icra edir və hit-lərin `_source` siyahısını qaytarır.
+    `key` cache_key(...) ilə sorğudan ƏVVƏL yaradılmalıdır (generasiya o an götürülür).
+    """
+    sources = retrieval_cache.get(key)
+    if sources is None:
+        with stage("search"):
+            sources = _hit_sources(client.search(index=index_name, body=_search_request(body), **_search_timeout()))
+        retrieval_cache.put(key, sources)
+    record_retrieval(index_name, sources)
+    return sources
+
+
+def _msearch_plans(client, plans, found: Dict[Tuple, List[Dict]]):
+    """(indeks, keş açarı, kNN gövdəsi) planlarından keşdə olmayanları bir `_msearch`-də icra edib `found`-a yazır."""
+    body, pending = [], []
+    for index_name, key, search_body in plans:
+        if key in found or key in pending:
+            continue
+        sources = retrieval_cache.get(key)
+        if sources is not None:
+            found[key] = sources
+            continue
+        body.append({"index": index_name})
+        body.append(_search_request(search_body))
+        pending.append(key)
+
+    if not body:
+        return
+    with stage("search"):
+        responses = client.msearch(body=body, **_search_timeout())["responses"]
+    for key, response in zip(pending, responses):
+        if "error" in response:
+            print(f"WARNING: msearch alt-sorğusu uğursuz oldu: {response['error']}")
+            found[key] = []
+            continue
+        found[key] = _hit_sources(response)
+        retrieval_cache.put(key, found[key])
+
+
+def batch_search_contexts(queries: List[str], session_id: str) -> List[Tuple[List[str], List[str]]]:
+    """
+    Hər sorğu üçün (istifadəçi konteksti, standart konteksti) cütünü qaytarır.
+    Bütün sorğular bir batch embedding çağırışı ilə vektorlaşdırılır və hər iki indeksdə
+    axtarış bir `_msearch` sorğusu ilə icra olunur.
+    """
+    empty = [([], []) for _ in queries]
+    if not queries:
+        return empty
+
+    user_store = get_opensearch_client(INDEX_NAME)
+    standards_store = get_opensearch_client(STANDARDS_INDEX_NAME)
+    store = user_store or standards_store
+    if not store:
+        return empty
+
+    from app.rag.standards_router import get_standards_router, routed_knn_body
+
+    vectors = store.embedding_function.embed_queries(queries)
+    router = get_standards_router()
+
+    session_filter = {"term": {"metadata.session_id": session_id}}
+
+    # Hər sorğu üçün (indeks, keş açarı, kNN gövdəsi) planı; keşdə olmayanlar bir _msearch-də icra olunur
+    plans, routed = [], []
+    for i, (query, vector) in enumerate(zip(queries, vectors)):
+        user_plan, standards_plan = None, None
+        if user_store:
+            user_plan = (INDEX_NAME,
+                         cache_key(INDEX_NAME, vector, 4, session_filter, session_id=session_id),
+                         knn_search_body(vector, k=4, boolean_filter=session_filter))
+        if standards_store:
+            source_files = router.route(query, vector)
+            if source_files:
+                standards_plan = (STANDARDS_INDEX_NAME,
+                                  cache_key(STANDARDS_INDEX_NAME, vector, 4, {"source_files": source_files}),
+                                  routed_knn_body(vector, 4, source_files))
+                routed.append(i)
+            else:
+                standards_plan = (STANDARDS_INDEX_NAME,
+                                  cache_key(STANDARDS_INDEX_NAME, vector, 4),
+                                  knn_search_body(vector, k=4))
+        plans.append((user_plan, standards_plan))
+
+    found: Dict[Tuple, List[Dict]] = {}
+    _msearch_plans(store.client, [p for pair in plans for p in pair if p is not None], found)
+
+    # Yönləndirilmiş axtarış boş qayıdıbsa, search_standards_base kimi bütün indeks üzrə təkrarlanır
+    fallbacks = {}
+    for i in routed:
+        if not found[plans[i][1][1]]:
+            vector = vectors[i]
+            fallbacks[i] = (STANDARDS_INDEX_NAME, cache_key(STANDARDS_INDEX_NAME, vector, 4),
+                            knn_search_body(vector, k=4))
+    if fallbacks:
+        _msearch_plans(store.client, list(fallbacks.values()), found)
+        for i, standards_plan in fallbacks.items():
+            plans[i] = (plans[i][0], standards_plan)
+
+    for plan in (p for pair in plans for p in pair if p is not None):
+        record_retrieval(plan[0], found[plan[1]])
+
+    results = []
+    for user_plan, standards_plan in plans:
+        user_context = [src.get(TEXT_FIELD, "") for src in found[user_plan[1]]] if user_plan else []
+        standards_context = format_standards_sources(found[standards_plan[1]]) if standards_plan else []
+        results.append((user_context, standards_context))
+
+    return results
\ No newline at end of file
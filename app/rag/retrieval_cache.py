@@ -0,0 +1,195 @@
+# app/rag/retrieval_cache.py
+"""
+Axtarış (retrieval) nəticələrinin keşi.
+
+Açar: (indeks, generasiya, filtr, k, sorğu vektorunun hash-i). Generasiya sayğacı indeks üzrə
+(esg_standards) və ya indeks + sessiya üzrə (rag_knowledge_base) saxlanılır və həmin yerə
+`add_documents` ilə yazıldıqda artırılır — köhnə nəticələr dərhal əlçatmaz olur, yeni yüklənmiş
+fayl növbəti sorğuda görünür.
+
+Generasiya (ortaq, yerli) cütüdür. Ortaq hissə PostgreSQL-dəki retrieval_generations cədvəlindədir:
+başqa worker-in və ya prosesin (ingest_standards CLI) yazısı bu worker-də ən geci
+RETRIEVAL_GENERATION_REFRESH saniyə sonra görünür. Yerli hissə yalnız bu prosesdə artır — DB
+əlçatmaz olduqda da öz yazıları dərhal görünür. RETRIEVAL_GENERATION_BACKEND=none olduqda sayğaclar
+yalnız proses daxilindədir (tək worker fərziyyəsi); o halda başqa proseslərin yazıları üçün
+RETRIEVAL_CACHE_TTL yuxarı həddir.
+
+Axtarış yolu PostgreSQL-i gözləmir: ortaq dəyər köhnəldikdə cari dəyər qaytarılır, yenisi isə fon
+thread-ində oxunur. RETRIEVAL_CACHE_TTL-dən uzun istifadə olunmayan sayğaclar yaddaşdan silinir —
+onların generasiyası ilə yazılmış keş girişlərinin hamısının vaxtı artıq keçib.
+"""
+import os
+import json
+import time
+import array
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 2048))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", 600))
+# "postgres": generasiya worker-lər arasında ortaqdır; "none": yalnız proses daxilində (tək worker)
+RETRIEVAL_GENERATION_BACKEND = os.getenv("RETRIEVAL_GENERATION_BACKEND", "postgres")
+# Ortaq generasiya bu qədər saniyədən bir yenidən oxunur (başqa worker-in yazısının görünmə gecikməsi)
+RETRIEVAL_GENERATION_REFRESH = float(os.getenv("RETRIEVAL_GENERATION_REFRESH", 2))
+
+# (indeks, session_id) -> [ortaq generasiya, yerli generasiya, ortaq dəyərin oxunduğu an, son istifadə anı];
+# son istifadəyə görə sıralanır (ən köhnə əvvəldə)
+_generations: "OrderedDict[Tuple[str, Optional[str]], List]" = OrderedDict()
+_generations_lock = threading.Lock()
+# Ortaq dəyəri fon thread-ində oxunan açarlar (hər açar üçün eyni anda bir oxunuş)
+_refreshing = set()
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-generation")
+
+
+def _shared_generation(index_name: str, session_id: Optional[str], increment: bool = False) -> Optional[int]:
+    if RETRIEVAL_GENERATION_BACKEND != "postgres":
+        return None
+    from app.database.retrieval_generations import fetch_generation, increment_generation
+
+    try:
+        if increment:
+            return increment_generation(index_name, session_id or "")
+        return fetch_generation(index_name, session_id or "")
+    except Exception as e:
+        print(f"WARNING: Axtarış keşinin ortaq generasiyası oxunmadı, yerli sayğac istifadə olunur: {e}")
+        return None
+
+
+def _state(key: Tuple[str, Optional[str]], now: float) -> List:
+    """Açarın sayğacını qaytarır (yoxdursa yaradır) və boş dayanan sayğacları silir. Kilid altında çağırılır."""
+    while _generations:
+        oldest_key, oldest = next(iter(_generations.items()))
+        if now - oldest[3] <= RETRIEVAL_CACHE_TTL or oldest_key in _refreshing:
+            break
+        del _generations[oldest_key]
+    state = _generations.get(key)
+    if state is None:
+        state = _generations[key] = [0, 0, 0.0, now]
+    state[3] = now
+    _generations.move_to_end(key)
+    return state
+
+
+def _update_shared(key: Tuple[str, Optional[str]], shared: Optional[int]) -> Tuple[int, int]:
+    with _generations_lock:
+        state = _state(key, time.monotonic())
+        # Uğursuz oxunuşda da vaxt yenilənir — DB əlçatmaz olduqda hər axtarış onu gözləmir
+        state[2] = time.monotonic()
+        if shared is not None:
+            state[0] = max(state[0], shared)
+        return state[0], state[1]
+
+
+def _refresh_shared(key: Tuple[str, Optional[str]]):
+    try:
+        _update_shared(key, _shared_generation(*key))
+    finally:
+        with _generations_lock:
+            _refreshing.discard(key)
+
+
+def current_generation(index_name: str, session_id: Optional[str] = None) -> Tuple[int, int]:
+    key = (index_name, session_id)
+    now = time.monotonic()
+    with _generations_lock:
+        state = _state(key, now)
+        generation = state[0], state[1]
+        if (RETRIEVAL_GENERATION_BACKEND != "postgres" or now - state[2] < RETRIEVAL_GENERATION_REFRESH
+                or key in _refreshing):
+            return generation
+        _refreshing.add(key)
+    _refresh_executor.submit(_refresh_shared, key)
+    return generation
+
+
+def bump_generation(index_name: str, session_id: Optional[str] = None) -> Tuple[int, int]:
+    """İndeksə (və ya indeksdəki sessiyaya) yazıldıqdan sonra çağırılır; əvvəlki keş girişlərini etibarsız edir."""
+    key = (index_name, session_id)
+    with _generations_lock:
+        _state(key, time.monotonic())[1] += 1
+    generation = _update_shared(key, _shared_generation(index_name, session_id, increment=True))
+    retrieval_cache.count("invalidations")
+    return generation
+
+
+def vector_hash(vector: List[float]) -> str:
+    return hashlib.blake2b(array.array("f", vector).tobytes(), digest_size=16).hexdigest()
+
+
+def cache_key(index_name: str, vector: List[float], k: int, search_filter: Optional[Dict] = None,
+              session_id: Optional[str] = None) -> Tuple:
+    """
+    Açar yaradılarkən cari generasiya götürülür: axtarış zamanı yazı baş verərsə,
+    nəticə köhnə generasiya ilə saxlanılır və heç vaxt oxunmur.
+    """
+    return (
+        index_name,
+        session_id,
+        current_generation(index_name, session_id),
+        json.dumps(search_filter, sort_keys=True) if search_filter else None,
+        k,
+        vector_hash(vector),
+    )
+
+
+class RetrievalCache:
+    """TTL-li, ölçüsü məhdud LRU keş; dəyərlər axtarış nəticələrinin `_source` siyahısıdır (vektorsuz)."""
+
+    def __init__(self, max_size: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def get(self, key: Tuple) -> Optional[List[Dict]]:
+        if not RETRIEVAL_CACHE_ENABLED:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def put(self, key: Tuple, sources: List[Dict]):
+        if not RETRIEVAL_CACHE_ENABLED:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), sources)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "enabled": RETRIEVAL_CACHE_ENABLED,
+                "generation_backend": RETRIEVAL_GENERATION_BACKEND,
+                "generation_keys": len(_generations),
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,263 @@
+# app/rag/standards_router.py
+"""
+Sorğuların konkret standartlara əvvəlcədən yönləndirilməsi (pre-routing).
+
+Sorğuda standart açıq adlanırsa ("GRI 303", "305-1", "Scope 2 guidance", "PAS 2050") və ya
+sorğu vektoru standart səviyyəli centroid indeksində aydın şəkildə bir neçə standarta yaxındırsa,
+esg_standards üzrə kNN yalnız həmin standartların chunk-ları ilə məhdudlaşdırılır
+(metadata.source_file filtri). Yönləndirmə etibarlı deyilsə None qaytarılır və filtrsiz axtarış edilir.
+Ümumi mövzu sözləri ("cement", "uncertainty", "N2O" ...) heç vaxt təkbaşına filtr yaratmır: onlar
+yalnız etibarlı centroid yönləndirməsinə uyğun standartı əlavə edir (filtri genişləndirir).
+
+Centroid indeksi (hər standart üçün chunk vektorlarının ortalaması) indeksdəki mövcud
+vektorlardan qurulur, heç bir embedding çağırışı tələb etmir:
+    python -m app.rag.standards_router build-centroids
+"""
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.startup_report import lazy_import
+from app.rag.rag_service import (
+    get_raw_opensearch_client, knn_search_body, STANDARDS_INDEX_NAME, VECTOR_FIELD
+)
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STANDARDS_CENTROIDS_PATH = os.getenv(
+    "STANDARDS_CENTROIDS_PATH", os.path.join(BASE_DIR, "..", "..", "standards_data", "standards_centroids.npz")
+)
+# Centroid əsaslı yönləndirmədə saxlanılan standartların sayı
+ROUTER_TOP_STANDARDS = int(os.getenv("ROUTER_TOP_STANDARDS", 3))
+# Ən yaxın centroid-in minimal kosinus oxşarlığı və median üzərindəki minimal üstünlüyü
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", 0.55))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", 0.08))
+# "script_score": filtrlənmiş alt çoxluq üzərində dəqiq kNN (nmslib daxil istənilən mühərrik)
+# "efficient":    knn.filter ilə efficient filtering (yalnız lucene/faiss mühərrikləri)
+ROUTER_FILTER_MODE = os.getenv("ROUTER_FILTER_MODE", "script_score")
+# OpenSearchVectorSearch-in default space_type-ı
+ROUTER_SPACE_TYPE = os.getenv("ROUTER_SPACE_TYPE", "l2")
+# Standart siyahısı alınmadıqda (OpenSearch əlçatmaz) növbəti cəhdə qədər gözləmə (saniyə)
+ROUTER_RETRY_SECONDS = float(os.getenv("ROUTER_RETRY_SECONDS", 60))
+
+SOURCE_FILE_FIELD = "metadata.source_file.keyword"
+
+# (sorğuda axtarılan ifadə, uyğun source_file adlarının şablonu)
+# Standartın açıq adı/ID-si — sərt filtr
+IDENTIFIER_RULES = [
+    (re.compile(r"\bGRI[\s_-]*(\d{1,3})\b", re.IGNORECASE), lambda m: rf"^GRI_{m.group(1)}__"),
+    (re.compile(r"(?<![\d.])([1-4]\d{2})-(\d{1,2})\b"), lambda m: rf"^GRI_{m.group(1)}__"),
+    (re.compile(r"\bscope[\s_-]*2\b", re.IGNORECASE), lambda m: r"^Scope_2_Guidance"),
+    (re.compile(r"\bscope[\s_-]*3\b", re.IGNORECASE), lambda m: r"^Scope3_"),
+    (re.compile(r"\bPAS[\s_-]*2050\b", re.IGNORECASE), lambda m: r"^PAS_2050"),
+    (re.compile(r"\bTCFD\b|climate-related financial disclosures", re.IGNORECASE),
+     lambda m: r"^(Task_Force_on|tcfd-)"),
+    (re.compile(r"\bIWA[\s_-]*48\b", re.IGNORECASE), lambda m: r"^IWA-48"),
+    (re.compile(r"\bGHG\s+protocol\b", re.IGNORECASE), lambda m: r"^(GHG_Protocol|ghg-protocol)"),
+    (re.compile(r"\bCSI\b", re.IGNORECASE), lambda m: r"^co2_CSI_Cement"),
+    (re.compile(r"\bGRI\s+glossary\b", re.IGNORECASE), lambda m: r"^GRI_Standards_Glossary"),
+]
+
+# Ümumi mövzu sözləri (bir çox standartda və hesabatda rast gəlinir) — aşağı etibarlılıq, filtr yaratmır
+TOPIC_RULES = [
+    (re.compile(r"\bcement\b", re.IGNORECASE), lambda m: r"^co2_CSI_Cement"),
+    (re.compile(r"\bpulp\b", re.IGNORECASE), lambda m: r"^Pulp_and_Paper"),
+    (re.compile(r"\bnitric acid\b|\bN2O\b", re.IGNORECASE), lambda m: r"^Calculating_N2O"),
+    (re.compile(r"\bCHP\b|combined heat and power", re.IGNORECASE), lambda m: r"^CHP_guidance"),
+    (re.compile(r"\buncertainty\b", re.IGNORECASE), lambda m: r"(Uncertainty|uncertainty)"),
+    (re.compile(r"\bGWP\b|global warming potential", re.IGNORECASE), lambda m: r"^Global-Warming-Potential"),
+    (re.compile(r"\bHFC\b|\bCFC\b", re.IGNORECASE), lambda m: r"^hfc-cfc"),
+    (re.compile(r"\bSDG\b", re.IGNORECASE), lambda m: r"sdg_indicators"),
+]
+
+
+def build_centroids(out_path: str = STANDARDS_CENTROIDS_PATH, client=None) -> int:
+    """esg_standards-dakı vektorlardan hər source_file üçün centroid hesablayıb fayla yazır."""
+    np = lazy_import("numpy")
+    scan = lazy_import("opensearchpy.helpers", "scan")
+    client = client or get_raw_opensearch_client(timeout=120)
+    if client is None:
+        raise RuntimeError("OpenSearch Env Variables incomplete.")
+
+    sums: Dict[str, "np.ndarray"] = {}
+    counts: Dict[str, int] = {}
+    query = {"query": {"match_all": {}}, "_source": [VECTOR_FIELD, "metadata.source_file"]}
+    for hit in scan(client, index=STANDARDS_INDEX_NAME, query=query, size=1000):
+        source_file = hit["_source"].get("metadata", {}).get("source_file")
+        if not source_file:
+            continue
+        vector = np.asarray(hit["_source"][VECTOR_FIELD], dtype=np.float64)
+        sums[source_file] = sums.get(source_file, 0) + vector
+        counts[source_file] = counts.get(source_file, 0) + 1
+
+    files = sorted(sums)
+    centroids = np.stack([sums[f] / counts[f] for f in files]).astype(np.float32) if files else np.zeros((0, 0))
+    np.savez_compressed(out_path, files=np.array(json.dumps(files)), centroids=centroids)
+    print(f"SUCCESS: {len(files)} standart üçün centroid yazıldı: {out_path}")
+    return len(files)
+
+
+class StandardsRouter:
+    """Sorğunu standart adları/ID-ləri və centroid oxşarlığı əsasında source_file siyahısına yönləndirir."""
+
+    def __init__(self, files: List[str], centroids=None):
+        self.files = files
+        self.centroids = None
+        if centroids is not None and len(centroids):
+            np = lazy_import("numpy")
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = centroids / norms
+        self._lock = threading.Lock()
+        self.counters = {
+            "routed_by_identifier": 0, "routed_by_centroid": 0, "topic_hint_added": 0,
+            "topic_hint_unfiltered": 0, "fallback_unfiltered": 0,
+        }
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def match_identifiers(self, query: str, rules=IDENTIFIER_RULES) -> List[str]:
+        patterns = [make_pattern(m) for regex, make_pattern in rules for m in regex.finditer(query)]
+        if not patterns:
+            return []
+        return [f for f in self.files if any(re.search(p, f) for p in patterns)]
+
+    def match_centroids(self, vector) -> List[str]:
+        if self.centroids is None or vector is None:
+            return []
+        np = lazy_import("numpy")
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.centroids @ query
+        order = np.argsort(-scores)
+        top = float(scores[order[0]])
+        # Etibarlılıq: ən yaxın standart həm kifayət qədər oxşar, həm də digərlərindən aydın şəkildə öndə olmalıdır
+        if top < ROUTER_MIN_SCORE or top - float(np.median(scores)) < ROUTER_MIN_MARGIN:
+            return []
+        return [self.files[i] for i in order[:ROUTER_TOP_STANDARDS]]
+
+    def route(self, query: str, vector=None) -> Optional[List[str]]:
+        """Məhdudlaşdırılacaq source_file siyahısı və ya (etibarlı deyilsə) None."""
+        files = self.match_identifiers(query)
+        if files:
+            self._count("routed_by_identifier")
+            return files
+        topic_files = self.match_identifiers(query, TOPIC_RULES)
+        files = self.match_centroids(vector)
+        if files:
+            self._count("routed_by_centroid")
+            extra = [f for f in topic_files if f not in files]
+            if extra:
+                self._count("topic_hint_added")
+            return files + extra
+        self._count("topic_hint_unfiltered" if topic_files else "fallback_unfiltered")
+        return None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"standards": len(self.files), "centroids": self.centroids is not None, **self.counters}
+
+
+def routed_knn_body(vector: List[float], k: int, source_files: List[str]) -> Dict:
+    """Yalnız verilmiş standartların chunk-ları üzrə kNN sorğusu."""
+    source_filter = {"terms": {SOURCE_FILE_FIELD: source_files}}
+    if ROUTER_FILTER_MODE == "efficient":
+        return {"size": k, "query": {"knn": {VECTOR_FIELD: {"vector": vector, "k": k, "filter": source_filter}}}}
+    if ROUTER_FILTER_MODE == "script_score":
+        return {
+            "size": k,
+            "query": {"script_score": {
+                "query": {"bool": {"filter": source_filter}},
+                "script": {
+                    "source": "knn_score",
+                    "lang": "knn",
+                    "params": {"field": VECTOR_FIELD, "query_value": vector, "space_type": ROUTER_SPACE_TYPE},
+                },
+            }},
+        }
+    return knn_search_body(vector, k=k, boolean_filter=source_filter)
+
+
+def _load_router() -> Optional[StandardsRouter]:
+    """Router-i yükləyir; standart siyahısı alına bilmədikdə None."""
+    if os.path.exists(STANDARDS_CENTROIDS_PATH):
+        np = lazy_import("numpy")
+        data = np.load(STANDARDS_CENTROIDS_PATH)
+        router = StandardsRouter(json.loads(str(data["files"])), data["centroids"])
+        print(f"INFO: Standart router-i centroid indeksi ilə yükləndi ({len(router.files)} standart).")
+        return router
+
+    # Centroid faylı yoxdursa, yalnız ad/ID əsaslı yönləndirmə üçün fayl siyahısını indeksdən götürürük
+    client = get_raw_opensearch_client()
+    if client is None:
+        return None
+    try:
+        response = client.search(index=STANDARDS_INDEX_NAME, body={
+            "size": 0, "aggs": {"files": {"terms": {"field": SOURCE_FILE_FIELD, "size": 1000}}}
+        })
+        files = sorted(b["key"] for b in response["aggregations"]["files"]["buckets"])
+    except Exception as e:
+        print(f"WARNING: Standart fayl siyahısı alınmadı (növbəti cəhd {ROUTER_RETRY_SECONDS:.0f} s sonra): {e}")
+        return None
+    if not files:
+        return None
+    print(f"INFO: Centroid indeksi tapılmadı; router yalnız ad/ID əsasında işləyir ({len(files)} standart).")
+    return StandardsRouter(files)
+
+
+_router: Optional[StandardsRouter] = None
+_router_lock = threading.Lock()
+# Yükləmə uğursuz olduqda: boş (filtrsiz) router və növbəti cəhdin vaxtı
+_fallback_router = StandardsRouter([])
+_retry_at = 0.0
+
+
+def get_standards_router() -> StandardsRouter:
+    """
+    Router-i bir dəfə yükləyir. Standart siyahısı alınmadıqda (məs. OpenSearch əlçatmaz idi) ROUTER_RETRY_SECONDS
+    ərzində filtrsiz router qaytarılır — hər sorğu aqreqasiyanı təkrarlamır.
+    """
+    global _router, _retry_at
+    if _router is None:
+        if time.monotonic() < _retry_at:
+            return _fallback_router
+        with _router_lock:
+            if _router is None:
+                if time.monotonic() < _retry_at:
+                    return _fallback_router
+                router = _load_router()
+                if router is None:
+                    _retry_at = time.monotonic() + ROUTER_RETRY_SECONDS
+                    return _fallback_router
+                _router = router
+    return _router
+
+
+def standards_router_snapshot() -> Dict:
+    """Metrics üçün: router hələ yüklənməyibsa I/O etmədən boş vəziyyət qaytarır."""
+    return _router.snapshot() if _router is not None else {"loaded": False}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standart router-i üçün köməkçi əmrlər.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build-centroids", help="esg_standards vektorlarından centroid indeksi qur")
+    build.add_argument("--out", default=STANDARDS_CENTROIDS_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build-centroids":
+        build_centroids(args.out)
+
+
+if __name__ == "__main__":
+    main()
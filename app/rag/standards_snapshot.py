@@ -0,0 +1,246 @@
+# app/rag/standards_snapshot.py
+"""
+esg_standards indeksinin snapshot-u: chunk-lar, metadata və vektorlar bir versiyalı artefakt faylında.
+
+Yeni mühiti qaldırarkən standartları Gemini ilə yenidən embed etmək əvəzinə artefakt
+istənilən OpenSearch klasterinə bulk API ilə paralel yüklənir (heç bir embedding çağırışı olmadan).
+
+Format (gzip ilə sıxılmış JSON Lines, axınla yazılır/oxunur):
+    1-ci sətir: başlıq  {"format", "version", "index", "embedding_model", "dimension", "mappings", "settings",
+                         "created_at"}
+    sonrakı:    sənədlər {"_id", "text", "metadata", "vector": base64(float32 little-endian)}
+    son sətir:  {"footer": {"count": N}}
+
+Snapshot başqa embedding modeli və ya ölçüsü ilə yaradılıbsa idxal rədd edilir — sorğu vektorları
+ilə müqayisə olunmayan vektorlar indeksə düşmür. Bulk xətası olduqda CLI sıfırdan fərqli kodla çıxır.
+
+İstifadə:
+    python -m app.rag.standards_snapshot export esg_standards.snapshot.jsonl.gz
+    python -m app.rag.standards_snapshot import esg_standards.snapshot.jsonl.gz [--workers 4] [--recreate]
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import array
+import base64
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.startup_report import lazy_import
+from app.rag.rag_service import (
+    get_raw_opensearch_client, EMBEDDING_MODEL, STANDARDS_INDEX_NAME, VECTOR_FIELD, TEXT_FIELD
+)
+from app.rag.chunk_schema import EMBEDDING_DIMENSIONS
+from app.rag.retrieval_cache import bump_generation
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+SNAPSHOT_FORMAT = "esg-standards-snapshot"
+SNAPSHOT_VERSION = 2
+# Mövcud olduqda, startup zamanı boş klaster PDF-lərin embed edilməsi əvəzinə bu fayldan doldurulur
+STANDARDS_SNAPSHOT_PATH = os.getenv("STANDARDS_SNAPSHOT_PATH")
+SNAPSHOT_BULK_WORKERS = int(os.getenv("SNAPSHOT_BULK_WORKERS", 4))
+SNAPSHOT_BULK_CHUNK_SIZE = int(os.getenv("SNAPSHOT_BULK_CHUNK_SIZE", 500))
+
+# Snapshot-a köçürülən indeks parametrləri (klasterə xas uuid, creation_date və s. köçürülmür)
+PORTABLE_SETTINGS = ("number_of_shards", "knn", "knn.algo_param.ef_search")
+
+
+def encode_vector(vector) -> str:
+    values = array.array("f", vector)
+    if values.itemsize != 4:
+        raise ValueError("float32 dəstəklənmir.")
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def decode_vector(encoded: str) -> list:
+    values = array.array("f")
+    values.frombytes(base64.b64decode(encoded))
+    return values.tolist()
+
+
+def _vector_dimension(mappings: Dict) -> Optional[int]:
+    return mappings.get("properties", {}).get(VECTOR_FIELD, {}).get("dimension")
+
+
+def _portable_index_definition(client, index_name: str) -> Tuple[Dict, Dict]:
+    mappings = client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    index_settings = client.indices.get_settings(index=index_name, flat_settings=True)[index_name]["settings"]
+    settings = {
+        key[len("index."):]: value
+        for key, value in index_settings.items()
+        if key[len("index."):] in PORTABLE_SETTINGS
+    }
+    return mappings, settings
+
+
+def export_snapshot(path: str, index_name: str = STANDARDS_INDEX_NAME, client=None) -> int:
+    """İndeksi scroll ilə oxuyub artefakt faylına axınla yazır. Yazılan sənəd sayını qaytarır."""
+    client = client or get_raw_opensearch_client(timeout=120)
+    if client is None:
+        raise RuntimeError("OpenSearch Env Variables incomplete.")
+    scan = lazy_import("opensearchpy.helpers", "scan")
+
+    mappings, settings = _portable_index_definition(client, index_name)
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "index": index_name,
+        "embedding_model": EMBEDDING_MODEL,
+        "dimension": _vector_dimension(mappings) or EMBEDDING_DIMENSIONS,
+        "mappings": mappings,
+        "settings": settings,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+    started = time.monotonic()
+    count = 0
+    tmp_path = f"{path}.part"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+        out.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for hit in scan(client, index=index_name, query={"query": {"match_all": {}}}, size=1000):
+            source = hit["_source"]
+            out.write(json.dumps({
+                "_id": hit["_id"],
+                "text": source.get(TEXT_FIELD, ""),
+                "metadata": source.get("metadata", {}),
+                "vector": encode_vector(source[VECTOR_FIELD]),
+            }, ensure_ascii=False) + "\n")
+            count += 1
+        out.write(json.dumps({"footer": {"count": count}}) + "\n")
+    os.replace(tmp_path, path)
+
+    print(f"SUCCESS: {count} sənəd '{path}' faylına ixrac edildi ({time.monotonic() - started:.1f}s).")
+    return count
+
+
+def _read_snapshot(path: str) -> Tuple[Dict, Iterator[Dict]]:
+    handle = gzip.open(path, "rt", encoding="utf-8")
+    header = json.loads(handle.readline())
+    if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+        handle.close()
+        raise ValueError(f"Dəstəklənməyən snapshot formatı: {header.get('format')} v{header.get('version')}")
+    if header.get("embedding_model") != EMBEDDING_MODEL or header.get("dimension") != EMBEDDING_DIMENSIONS:
+        handle.close()
+        raise ValueError(
+            f"Snapshot {header.get('embedding_model')} ({header.get('dimension')} ölçü) ilə yaradılıb, "
+            f"tətbiq isə {EMBEDDING_MODEL} ({EMBEDDING_DIMENSIONS} ölçü) istifadə edir."
+        )
+
+    def documents() -> Iterator[Dict]:
+        with handle:
+            for line in handle:
+                record = json.loads(line)
+                if "footer" in record:
+                    return
+                yield record
+        raise ValueError("Snapshot faylı natamamdır (footer tapılmadı).")
+
+    return header, documents()
+
+
+def import_snapshot(path: str, index_name: Optional[str] = None, workers: int = SNAPSHOT_BULK_WORKERS,
+                    chunk_size: int = SNAPSHOT_BULK_CHUNK_SIZE, recreate: bool = False,
+                    client=None) -> Tuple[int, int]:
+    """
+    Artefaktı OpenSearch-ə bulk API ilə paralel yükləyir. İndeks yoxdursa snapshot-dakı
+    mapping/settings ilə yaradılır. (yüklənmiş, uğursuz) sənəd saylarını qaytarır.
+    """
+    client = client or get_raw_opensearch_client(timeout=120)
+    if client is None:
+        raise RuntimeError("OpenSearch Env Variables incomplete.")
+    parallel_bulk = lazy_import("opensearchpy.helpers", "parallel_bulk")
+
+    header, documents = _read_snapshot(path)
+    index_name = index_name or header["index"]
+
+    if recreate and client.indices.exists(index=index_name):
+        client.indices.delete(index=index_name)
+    if client.indices.exists(index=index_name):
+        existing = _vector_dimension(client.indices.get_mapping(index=index_name)[index_name]["mappings"])
+        if existing is not None and existing != header["dimension"]:
+            raise ValueError(f"'{index_name}' indeksinin vektor ölçüsü {existing}, snapshot-unku {header['dimension']}.")
+    if not client.indices.exists(index=index_name):
+        client.indices.create(index=index_name, body={
+            "settings": {"index": header["settings"]},
+            "mappings": header["mappings"],
+        })
+
+    # Yükləmə zamanı refresh və replikalar söndürülür, sonda əvvəlki dəyərlər bərpa olunur
+    current = client.indices.get_settings(index=index_name, flat_settings=True)[index_name]["settings"]
+    restore_settings = {
+        "refresh_interval": current.get("index.refresh_interval"),
+        "number_of_replicas": current.get("index.number_of_replicas"),
+    }
+    client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+
+    def actions():
+        for doc in documents:
+            vector = decode_vector(doc["vector"])
+            if len(vector) != header["dimension"]:
+                raise ValueError(f"Sənəd {doc['_id']}: vektor ölçüsü {len(vector)}, gözlənilən {header['dimension']}.")
+            yield {
+                "_index": index_name,
+                "_id": doc["_id"],
+                "_source": {
+                    TEXT_FIELD: doc["text"],
+                    "metadata": doc["metadata"],
+                    VECTOR_FIELD: vector,
+                },
+            }
+
+    started = time.monotonic()
+    count, failed = 0, 0
+    try:
+        for ok, info in parallel_bulk(client, actions(), thread_count=workers, chunk_size=chunk_size,
+                                      raise_on_error=False, request_timeout=120):
+            if ok:
+                count += 1
+            else:
+                failed += 1
+                if failed <= 5:
+                    print(f"WARNING: Bulk xətası: {info}")
+    finally:
+        client.indices.put_settings(index=index_name, body={"index": restore_settings})
+        client.indices.refresh(index=index_name)
+        bump_generation(index_name)
+
+    elapsed = time.monotonic() - started
+    print(f"SUCCESS: {count} sənəd '{index_name}' indeksinə yükləndi, {failed} xəta "
+          f"({elapsed:.1f}s, {count / elapsed if elapsed else 0:.0f} sənəd/s).")
+    return count, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="esg_standards indeksinin snapshot ixracı/idxalı.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="İndeksi artefakt faylına ixrac et")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--index", default=STANDARDS_INDEX_NAME)
+
+    import_parser = subparsers.add_parser("import", help="Artefaktı OpenSearch-ə yüklə")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--index", default=None, help="Default: snapshot-dakı indeks adı")
+    import_parser.add_argument("--workers", type=int, default=SNAPSHOT_BULK_WORKERS)
+    import_parser.add_argument("--chunk-size", type=int, default=SNAPSHOT_BULK_CHUNK_SIZE)
+    import_parser.add_argument("--recreate", action="store_true", help="Mövcud indeksi silib yenidən yarat")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.path, args.index)
+    else:
+        _, failed = import_snapshot(args.path, args.index, args.workers, args.chunk_size, args.recreate)
+        if failed:
+            print(f"ERROR: {failed} sənəd yüklənmədi.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# app/rag/structured_chunker.py
+"""
+GRI/GHG standartları üçün strukturu nəzərə alan chunker.
+
+RecursiveCharacterTextSplitter(2000, 200) səhifə-səhifə işləyir, açıqlama sərhədlərini kəsir və
+mətnin ~10%-ni overlap kimi təkrarlayır. Bu chunker isə:
+  * səhifələri birləşdirir (səhifə sərhədini keçən abzaslar kəsilmir) və təkrarlanan
+    səhifə başlıqlarını/altlıqlarını atır;
+  * mətni struktur başlıqları üzrə bölür ("Disclosure 305-1 ...", "Guidance for Disclosure 305-1",
+    "Topic management disclosures", "Glossary", GHG Protocol-un "Chapter N" başlıqları və s.);
+  * bölmələri token limitinə (CHUNK_MAX_TOKENS) qədər overlap olmadan cümlə sərhədlərində doldurur,
+    kiçik qalıqları eyni açıqlamanın qonşu bölməsi ilə birləşdirir;
+  * hər chunk-a `disclosure_id`, `section` və başlanğıc `page` metadata-sı əlavə edir.
+
+Mövcud splitter ilə müqayisə (chunk sayı, embedding xərci, açıqlamaların bütövlüyü; --embed ilə
+həm də Gemini embedding-ləri üzərində retrieval hit rate):
+    python -m app.rag.structured_chunker compare [--standards-dir standards_data] [--limit 5] [--embed]
+"""
+import os
+import re
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.startup_report import lazy_import
+from app.rag.conversation_summary import estimate_tokens
+
+load_dotenv()
+
+# ---- Konfiqurasiya ----
+# "structured" — bu chunker, "recursive" — əvvəlki RecursiveCharacterTextSplitter(2000, 200)
+STANDARDS_CHUNKER = os.getenv("STANDARDS_CHUNKER", "structured")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 700))
+# Bundan kiçik bölmələr eyni açıqlamanın növbəti bölməsi ilə birləşdirilir
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", 150))
+# Gemini embedding qiyməti (USD / 1M token) — yalnız müqayisə hesabatı üçün
+EMBEDDING_PRICE_PER_MTOK = float(os.getenv("EMBEDDING_PRICE_PER_MTOK", 0.15))
+# GoogleGenerativeAIEmbeddings-in bir sorğudakı mətn sayı
+EMBEDDING_BATCH_SIZE = 100
+
+# (regex, bölmə növü) — sətrin əvvəlində olmalıdır; ilk uyğun gələn götürülür
+HEADING_RULES: List[Tuple["re.Pattern", str]] = [
+    (re.compile(r"^Guidance for Disclosure\s+(\d{1,3}-\d{1,2})\b"), "guidance"),
+    (re.compile(r"^Disclosure\s+(\d{1,3}-\d{1,2})\s+[A-Z(]"), "requirements"),
+    (re.compile(r"^(?:Topic )?[Mm]anagement approach disclosures\b|^Topic management disclosures\b"), "management"),
+    (re.compile(r"^(?:Glossary|Bibliography)\s*$"), "reference"),
+    (re.compile(r"^(?:CHAPTER|Chapter)\s+\d{1,2}\b"), "chapter"),
+    (re.compile(r"^\d{1,2}\.\s+[A-Z][A-Za-z ,\-–()]{3,80}$"), "chapter"),
+]
+# Açıqlama bölməsi daxilində alt bölmələr — yalnız ölçü böyükdürsə bölünmə nöqtəsi kimi istifadə olunur
+SUBSECTION_RE = re.compile(r"^(?:RECOMMENDATIONS|GUIDANCE|Compilation requirements|Background)\b")
+SENTENCE_END_RE = re.compile(r"[.;:!?]\s*$")
+DISCLOSURE_MENTION_RE = re.compile(r"Disclosure\s+(\d{1,3}-\d{1,2})\b")
+
+
+def _page_noise(pages: List[str]) -> set:
+    """Səhifələrin yarısından çoxunda təkrarlanan sətirlər (rəqəmlər normallaşdırılır) — başlıq/altlıq."""
+    if len(pages) < 4:
+        return set()
+    counts = Counter()
+    for page in pages:
+        counts.update({re.sub(r"\d+", "#", line.strip()) for line in page.splitlines() if line.strip()})
+    return {line for line, count in counts.items() if count > len(pages) / 2 and len(line) < 120}
+
+
+def _lines_with_pages(pages: List[str]) -> List[Tuple[str, int]]:
+    noise = _page_noise(pages)
+    lines = []
+    for page_number, page in enumerate(pages):
+        for line in page.splitlines():
+            line = line.strip()
+            if line and re.sub(r"\d+", "#", line) not in noise:
+                lines.append((line, page_number))
+    return lines
+
+
+# Məzmun cədvəli sətri: "Disclosure 305-1 Direct (Scope 1) GHG emissions 9"
+TOC_LINE_RE = re.compile(r"\s\d{1,3}$")
+# Bu qədər məzmun cədvəli sətri olan səhifədə heç bir sətir başlıq sayılmır (sətirə bölünmüş girişlər də daxil)
+TOC_MIN_ENTRIES = 3
+
+
+def _heading_of(line: str) -> Optional[Tuple[str, Optional[str]]]:
+    for regex, section in HEADING_RULES:
+        match = regex.match(line)
+        if match:
+            return section, (match.group(1) if regex.groups else None)
+    return None
+
+
+def _sections(lines: List[Tuple[str, int]]) -> List[Dict]:
+    """Sətirləri struktur başlıqları üzrə bölmələrə ayırır."""
+    toc_entries = Counter(
+        page for line, page in lines if TOC_LINE_RE.search(line) and _heading_of(TOC_LINE_RE.sub("", line))
+    )
+    toc_pages = {page for page, count in toc_entries.items() if count >= TOC_MIN_ENTRIES}
+
+    sections = [{"section": "front", "disclosure_id": None, "lines": []}]
+    for line, page in lines:
+        heading = None if page in toc_pages else _heading_of(line)
+        # Hər səhifədə təkrarlanan fəsil başlığı ("CHAPTER 1 Introduction") yeni bölmə açmır
+        current = sections[-1]["lines"]
+        if heading and current and line == current[0][0]:
+            continue
+        if heading:
+            section, disclosure_id = heading
+            sections.append({"section": section, "disclosure_id": disclosure_id, "lines": []})
+        sections[-1]["lines"].append((line, page))
+    return [s for s in sections if s["lines"]]
+
+
+def _pack(lines: List[Tuple[str, int]], max_tokens: int) -> List[List[Tuple[str, int]]]:
+    """
+    Sətirləri overlap olmadan max_tokens-ə qədər doldurur. Limit aşılanda ən son cümlə sonu ilə
+    bitən sətirdə (limitin yarısından sonra varsa) və ya alt bölmə başlığından əvvəl kəsir.
+    """
+    groups, current, tokens = [], [], 0
+    for line, page in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if current and tokens + line_tokens > max_tokens:
+            cut = len(current)
+            running = 0
+            for i, (text, _) in enumerate(current):
+                running += estimate_tokens(text) + 1
+                if running >= max_tokens // 2 and (SENTENCE_END_RE.search(text) or
+                                                   (i + 1 < len(current) and SUBSECTION_RE.match(current[i + 1][0]))):
+                    cut = i + 1
+            groups.append(current[:cut])
+            current = current[cut:]
+            tokens = sum(estimate_tokens(text) + 1 for text, _ in current)
+        current.append((line, page))
+        tokens += line_tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _heading_prefix(section: Dict) -> str:
+    first_line = section["lines"][0][0]
+    return first_line if _heading_of(first_line) else ""
+
+
+def chunk_standard(pages: List[str], source_file: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                   min_tokens: int = CHUNK_MIN_TOKENS) -> List[Dict]:
+    """
+    Bir standartın səhifə mətnlərindən chunk-lar qaytarır:
+    [{"text", "page", "disclosure_id", "section"}]. Bölünmüş bölmənin sonrakı hissələrinə
+    kontekst üçün bölmə başlığı əlavə edilir.
+    """
+    sections = _sections(_lines_with_pages(pages))
+
+    # Kiçik bölmələr (məs. xülasə cədvəlindəki açıqlama siyahısı) növbəti bölmə ilə birləşdirilir;
+    # fərqli açıqlamalar birləşərsə chunk-a ID verilmir
+    merged: List[Dict] = []
+    for section in sections:
+        previous = merged[-1] if merged else None
+        if previous is not None and sum(estimate_tokens(text) + 1 for text, _ in previous["lines"]) < min_tokens:
+            previous["lines"].extend(section["lines"])
+            if previous["section"] == "front":
+                previous["disclosure_id"] = section["disclosure_id"]
+                previous["section"] = section["section"]
+            elif previous["disclosure_id"] != section["disclosure_id"]:
+                previous["disclosure_id"] = None
+            continue
+        merged.append(section)
+
+    chunks = []
+    for section in merged:
+        prefix = _heading_prefix(section)
+        for i, group in enumerate(_pack(section["lines"], max_tokens)):
+            text = " ".join(line for line, _ in group)
+            if i > 0 and prefix:
+                text = f"{prefix} (davamı): {text}"
+            disclosure_id = section["disclosure_id"]
+            if disclosure_id is None:
+                mentions = {m.group(1) for m in DISCLOSURE_MENTION_RE.finditer(text)}
+                disclosure_id = mentions.pop() if len(mentions) == 1 else None
+            chunks.append({
+                "text": text,
+                "page": group[0][1],
+                "disclosure_id": disclosure_id,
+                "section": section["section"],
+            })
+    return chunks
+
+
+def split_standard_documents(docs, source_file: str) -> List:
+    """
+    PyPDFLoader Document-lərindən (səhifələrdən) LangChain Document chunk-ları qaytarır.
+    STANDARDS_CHUNKER=recursive olduqda əvvəlki splitter istifadə olunur.
+    """
+    if STANDARDS_CHUNKER == "recursive":
+        RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+        return RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200).split_documents(docs)
+
+    Document = lazy_import("langchain_core.documents", "Document")
+    base_metadata = dict(docs[0].metadata) if docs else {}
+    base_metadata.pop("page", None)
+    base_metadata.pop("page_label", None)
+
+    documents = []
+    for chunk in chunk_standard([doc.page_content for doc in docs], source_file):
+        metadata = {**base_metadata, "page": chunk["page"], "section": chunk["section"]}
+        if chunk["disclosure_id"]:
+            metadata["disclosure_id"] = chunk["disclosure_id"]
+        documents.append(Document(page_content=chunk["text"], metadata=metadata))
+    return documents
+
+
+# --- MÜQAYİSƏ ---
+
+def _recursive_chunks(pages: List[str]) -> List[str]:
+    RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
+    return [chunk for page in pages for chunk in splitter.split_text(page)]
+
+
+def _cost_stats(texts: List[str]) -> Dict:
+    tokens = sum(estimate_tokens(t) for t in texts)
+    return {
+        "chunks": len(texts),
+        "tokens": tokens,
+        "avg_tokens": round(tokens / len(texts), 1) if texts else 0,
+        "embedding_requests": -(-len(texts) // EMBEDDING_BATCH_SIZE),
+        "embedding_cost_usd": round(tokens / 1_000_000 * EMBEDDING_PRICE_PER_MTOK, 4),
+    }
+
+
+def _intact_rate(texts: List[str], disclosures: List[Dict]) -> float:
+    """
+    Tələbin əvvəli (ilk 80 simvol) tək bir chunk-da bütöv qalan açıqlamaların payı.
+    Daha uzun prefiks səhifə altlıqlarını ehtiva edə bilər ki, onlar strukturlu chunker-də atılır.
+    """
+    if not disclosures:
+        return 0.0
+    normalized = [" ".join(t.split()) for t in texts]
+    intact = sum(1 for d in disclosures if any(d["requirement"][:80] in t for t in normalized))
+    return round(intact / len(disclosures), 3)
+
+
+def _hit_rate(embeddings, texts: List[str], disclosures: List[Dict], k: int = 4) -> float:
+    """Sorğu = açıqlama başlığı; hit = top-k chunk-lardan biri "Disclosure <ID>" mətnini ehtiva edir."""
+    np = lazy_import("numpy")
+    if not disclosures or not texts:
+        return 0.0
+    chunk_vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    query_vectors = np.asarray(embeddings.embed_queries([d["title"] for d in disclosures]), dtype=np.float32)
+    chunk_vectors /= np.linalg.norm(chunk_vectors, axis=1, keepdims=True)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    top = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :k]
+    hits = sum(
+        1 for d, row in zip(disclosures, top)
+        if any(f"Disclosure {d['disclosure_id']}" in texts[i] for i in row)
+    )
+    return round(hits / len(disclosures), 3)
+
+
+def compare(standards_dir: str, limit: Optional[int] = None, embed: bool = False) -> Dict:
+    """Hər iki chunker-i eyni PDF-lər üzərində müqayisə edir və hesabatı çap edir."""
+    from app.rag.disclosure_catalog import extract_disclosures
+
+    PyPDFLoader = lazy_import("langchain_community.document_loaders", "PyPDFLoader")
+    pdf_files = sorted(f for f in os.listdir(standards_dir) if f.lower().endswith(".pdf"))[:limit]
+
+    recursive_texts, structured_texts, disclosures = [], [], []
+    per_file = []
+    for filename in pdf_files:
+        try:
+            pages = [doc.page_content for doc in PyPDFLoader(os.path.join(standards_dir, filename)).load()]
+        except Exception as e:
+            print(f"ERROR: {filename} oxunmadı: {e}")
+            continue
+        old = _recursive_chunks(pages)
+        new = [c["text"] for c in chunk_standard(pages, filename)]
+        recursive_texts.extend(old)
+        structured_texts.extend(new)
+        disclosures.extend(extract_disclosures(pages, filename))
+        per_file.append((filename, len(old), len(new)))
+
+    report = {
+        "files": len(per_file),
+        "disclosures": len(disclosures),
+        "recursive": {**_cost_stats(recursive_texts), "intact_rate": _intact_rate(recursive_texts, disclosures)},
+        "structured": {**_cost_stats(structured_texts), "intact_rate": _intact_rate(structured_texts, disclosures)},
+    }
+
+    if embed:
+        from app.rag.rag_service import create_embeddings_client
+        from app.rag.gemini_scheduler import current_lane, LANE_INGESTION
+
+        current_lane.set(LANE_INGESTION)
+        embeddings = create_embeddings_client(os.getenv("GEMINI_API_KEY"))
+        report["recursive"]["hit_rate@4"] = _hit_rate(embeddings, recursive_texts, disclosures)
+        report["structured"]["hit_rate@4"] = _hit_rate(embeddings, structured_texts, disclosures)
+
+    print(f"{'Fayl':<60} {'recursive':>10} {'structured':>11}")
+    for filename, old_count, new_count in per_file:
+        print(f"{filename[:60]:<60} {old_count:>10} {new_count:>11}")
+    print()
+    print(f"Fayllar: {report['files']}, açıqlamalar: {report['disclosures']}")
+    for name in ("recursive", "structured"):
+        stats = report[name]
+        print(f"{name:<11} " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strukturlu chunker-in mövcud splitter ilə müqayisəsi.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subparsers.add_parser("compare", help="Chunk sayı, embedding xərci və retrieval keyfiyyəti")
+    compare_parser.add_argument("--standards-dir", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "standards_data"))
+    compare_parser.add_argument("--limit", type=int, default=None, help="Yalnız ilk N PDF")
+    compare_parser.add_argument("--embed", action="store_true",
+                                help="Gemini embedding-ləri ilə hit rate hesabla (API xərci yaradır)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.standards_dir, args.limit, args.embed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# app/startup_report.py
+"""
+İşə salınma vaxtının ölçülməsi: ağır modulların lazy importu və startup mərhələlərinin vaxtları.
+
+`python -X importtime` ilə app.main-in import vaxtını ölçmək üçün:
+    python -m app.startup_report [--top 25]
+"""
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+_PROCESS_STARTED = time.monotonic()
+_import_timings_ms: Dict[str, float] = {}
+_phase_timings_ms: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def lazy_import(module_name: str, attr: Optional[str] = None) -> Any:
+    """
+    Modulu ilk istifadədə import edir və ilk (soyuq) importun vaxtını qeyd edir.
+    `attr` verildikdə moduldakı həmin obyekti qaytarır.
+    """
+    cold = module_name not in sys.modules
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if cold:
+        with _lock:
+            _import_timings_ms.setdefault(module_name, round((time.perf_counter() - started) * 1000, 1))
+    return getattr(module, attr) if attr else module
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Startup mərhələsinin (məs. DB yoxlaması) vaxtını qeyd edir."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phase_timings_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def startup_report() -> Dict[str, Any]:
+    """Metrics üçün: lazy importların və startup mərhələlərinin vaxtları (ms)."""
+    with _lock:
+        return {
+            "uptime_s": round(time.monotonic() - _PROCESS_STARTED, 1),
+            "phases_ms": dict(_phase_timings_ms),
+            "lazy_imports_ms": dict(sorted(_import_timings_ms.items(), key=lambda kv: -kv[1])),
+        }
+
+
+def importtime_report(module: str = "app.main", top: int = 25) -> str:
+    """`python -X importtime -c 'import <module>'` çıxışını kumulyativ vaxta görə sıralayır."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:       123 |       4567 |   langchain_core"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    total_ms = max((row[0] for row in rows), default=0) / 1000
+    lines = [f"{module} import vaxtı: {total_ms:.1f} ms (kumulyativ, ən böyük {top} modul)"]
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:10.1f} ms  {self_us / 1000:8.1f} ms  {name}")
+    if result.returncode != 0:
+        lines.append(f"XƏTA: import uğursuz oldu:\n{result.stderr.strip().splitlines()[-1]}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.main import vaxtını -X importtime ilə ölçür.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    print(importtime_report(args.module, args.top))
+
+
+if __name__ == "__main__":
+    main()
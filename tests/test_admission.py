@@ -0,0 +1,125 @@
+# tests/test_admission.py
+import asyncio
+
+import app.admission as admission
+from app.admission import AdmissionMiddleware, EndpointGate
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    async def scenario():
+        gate = EndpointGate("chat", concurrency=1, queue=3, deadline=10)
+        assert await gate.acquire(10) is None
+        order = []
+
+        async def request(name):
+            assert await gate.acquire(10) is None
+            order.append(name)
+            gate.release(0.01)
+
+        tasks = []
+        for name in ("a", "b", "c"):
+            tasks.append(asyncio.create_task(request(name)))
+            await asyncio.sleep(0)
+        assert gate.snapshot()["queued"] == 3
+
+        gate.release(0.01)
+        await asyncio.gather(*tasks)
+        return gate, order
+
+    gate, order = asyncio.run(scenario())
+    assert order == ["a", "b", "c"]
+    assert gate.in_flight == 0
+    assert gate.counters["admitted"] == 4
+
+
+def test_queue_wait_times_out(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_WAIT_FRACTION", 0.5)
+
+    async def scenario():
+        gate = EndpointGate("chat", concurrency=1, queue=2, deadline=10)
+        await gate.acquire(10)
+        reason = await gate.acquire(0.1)
+        return gate, reason
+
+    gate, reason = asyncio.run(scenario())
+    assert reason == "queue_timeout"
+    assert gate.snapshot()["queued"] == 0
+    assert gate.counters["shed_timeout"] == 1
+    # Vaxtı keçmiş sorğu yeri tutmur
+    gate.release(0.01)
+    assert gate.in_flight == 0
+
+
+def test_full_queue_and_unreachable_deadline_are_shed():
+    async def scenario():
+        gate = EndpointGate("chat", concurrency=1, queue=0, deadline=10)
+        await gate.acquire(10)
+        full = await gate.acquire(10)
+
+        slow = EndpointGate("compare", concurrency=1, queue=4, deadline=10)
+        await slow.acquire(10)
+        slow.service_time_ewma = 30.0
+        predicted = await slow.acquire(10)
+        return full, predicted, slow
+
+    full, predicted, slow = asyncio.run(scenario())
+    assert full == "queue_full"
+    assert predicted == "deadline_unreachable"
+    assert slow.retry_after() == 30
+
+
+def test_middleware_sheds_with_503_and_retry_after(monkeypatch):
+    gate = EndpointGate("chat", concurrency=1, queue=0, deadline=10)
+    monkeypatch.setattr(admission, "gate_for_path", lambda path: gate)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        middleware = AdmissionMiddleware(app)
+        scope = {"type": "http", "path": "/chat", "headers": []}
+
+        first_messages, second_messages = [], []
+
+        async def collect(messages, message):
+            messages.append(message)
+
+        first = asyncio.create_task(middleware(scope, None, lambda m: collect(first_messages, m)))
+        while gate.in_flight == 0:
+            await asyncio.sleep(0)
+        await middleware(scope, None, lambda m: collect(second_messages, m))
+        release.set()
+        await first
+        return first_messages, second_messages
+
+    first_messages, second_messages = asyncio.run(scenario())
+    assert first_messages[0]["status"] == 200
+    assert second_messages[0]["status"] == 503
+    assert dict(second_messages[0]["headers"])[b"retry-after"] == b"1"
+    assert gate.in_flight == 0
+    assert gate.counters["shed_queue_full"] == 1
+
+
+def test_slot_handed_over_as_the_wait_times_out_is_not_leaked(monkeypatch):
+    gate = EndpointGate("chat", concurrency=1, queue=1, deadline=10)
+
+    async def handoff_then_timeout(future, timeout):
+        # release() yeri növbədəkinə ötürür, eyni iterasiyada isə gözləmə vaxtı bitir
+        gate.release(0.01)
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        await gate.acquire(10)
+        monkeypatch.setattr(asyncio, "wait_for", handoff_then_timeout)
+        return await gate.acquire(10)
+
+    reason = asyncio.run(scenario())
+    assert reason is None
+    assert gate.in_flight == 1
+    gate.release(0.01)
+    assert gate.in_flight == 0
+    assert gate.counters["shed_timeout"] == 0
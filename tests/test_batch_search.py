@@ -0,0 +1,100 @@
+# tests/test_batch_search.py
+import json
+from collections import OrderedDict
+
+import pytest
+
+import app.rag.rag_service as rag_service
+import app.rag.retrieval_cache as retrieval_cache
+import app.rag.standards_router as standards_router
+from app.rag.retrieval_cache import RetrievalCache
+
+ROUTED_FILE = "GRI 305.pdf"
+
+
+class FakeClient:
+    """msearch gövdələrini yadda saxlayır; yönləndirilmiş (source_file filtrli) sorğular `routed_hits` qaytarır."""
+
+    def __init__(self, routed_hits):
+        self.routed_hits = routed_hits
+        self.calls = []
+
+    def msearch(self, body, **kwargs):
+        self.calls.append(body)
+        responses = []
+        for header, search in zip(body[::2], body[1::2]):
+            routed = ROUTED_FILE in json.dumps(search)
+            if header["index"] == rag_service.STANDARDS_INDEX_NAME:
+                hits = self.routed_hits if routed else [("std-1", "GRI 303", "Su istifadəsi")]
+            else:
+                hits = [("user-1", None, "İstifadəçi sənədi")]
+            responses.append({"hits": {"hits": [
+                {"_id": hit_id, "_score": 1.0, "_source": {"text": text, "metadata": {"standard_name": name}}}
+                for hit_id, name, text in hits
+            ]}})
+        return {"responses": responses}
+
+    def search(self, index, body, **kwargs):
+        return self.msearch([{"index": index}, body])["responses"][0]
+
+
+class FakeEmbeddings:
+    def embed_queries(self, queries):
+        return [[float(len(query)), float(i)] for i, query in enumerate(queries)]
+
+    def embed_query(self, query):
+        return [float(len(query)), 0.0]
+
+
+class FakeStore:
+    def __init__(self, client):
+        self.client = client
+        self.embedding_function = FakeEmbeddings()
+
+
+class FakeRouter:
+    def route(self, query, vector):
+        return [ROUTED_FILE] if "305" in query else []
+
+
+def _setup(monkeypatch, routed_hits):
+    store = FakeStore(FakeClient(routed_hits))
+    cache = RetrievalCache()
+    monkeypatch.setattr(retrieval_cache, "RETRIEVAL_GENERATION_BACKEND", "none")
+    monkeypatch.setattr(retrieval_cache, "_generations", OrderedDict())
+    monkeypatch.setattr(rag_service, "retrieval_cache", cache)
+    monkeypatch.setattr(rag_service, "get_opensearch_client", lambda index_name: store)
+    monkeypatch.setattr(standards_router, "get_standards_router", lambda: FakeRouter())
+    return store
+
+
+@pytest.mark.parametrize("routed_hits", [[], [("std-2", "GRI 305", "Emissiyalar")]])
+def test_batch_matches_single_query_standards_context(monkeypatch, routed_hits):
+    _setup(monkeypatch, routed_hits)
+    queries = ["GRI 305 Scope 1 nədir?", "Su istifadəsi necə açıqlanır?"]
+
+    batch = rag_service.batch_search_contexts(queries, "s1")
+
+    assert [standards for _, standards in batch] == [rag_service.search_standards_base(q) for q in queries]
+    assert all(user == ["İstifadəçi sənədi"] for user, _ in batch)
+
+
+def test_empty_routed_search_is_rerun_unfiltered_in_one_extra_msearch(monkeypatch):
+    store = _setup(monkeypatch, [])
+
+    batch = rag_service.batch_search_contexts(["GRI 305 hədəflər", "GRI 305 Scope 2"], "s1")
+
+    assert len(store.client.calls) == 2
+    fallback = store.client.calls[1]
+    assert [header["index"] for header in fallback[::2]] == [rag_service.STANDARDS_INDEX_NAME] * 2
+    assert ROUTED_FILE not in json.dumps(fallback)
+    assert all(standards and "GRI 303" in standards[0] for _, standards in batch)
+
+
+def test_routed_hits_need_no_fallback(monkeypatch):
+    store = _setup(monkeypatch, [("std-2", "GRI 305", "Emissiyalar")])
+
+    batch = rag_service.batch_search_contexts(["GRI 305 hədəflər"], "s1")
+
+    assert len(store.client.calls) == 1
+    assert "GRI 305" in batch[0][1][0]
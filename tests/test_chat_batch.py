@@ -0,0 +1,88 @@
+# tests/test_chat_batch.py
+import time
+import asyncio
+import threading
+
+import pytest
+from fastapi import BackgroundTasks
+
+import app.main as main
+from app.main import BatchChatRequest, chat_batch
+
+
+class FakeLLM:
+    """Hər çağırış `delay` saniyə çəkir; eyni vaxtda işləyən çağırışların maksimumu sayılır."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, input, config=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return type("Response", (), {"content": f"cavab: {input[-10:]}"})()
+
+
+class FakeHistory:
+    def __init__(self):
+        self.messages = []
+
+    def add_user_message(self, message):
+        self.messages.append(message)
+
+    def add_ai_message(self, message):
+        self.messages.append(message)
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    llm = FakeLLM()
+    history = FakeHistory()
+    monkeypatch.setattr(main, "CHAT_BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "start_trace", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "_prepare_batch", lambda request: (
+        [(["İstifadəçi sənədi"], []) for _ in request.messages], history, "", llm
+    ))
+    return llm, history
+
+
+def test_results_keep_order_and_concurrency_is_bounded(batch):
+    llm, history = batch
+    messages = [f"sual {i}" for i in range(6)]
+
+    response = asyncio.run(chat_batch(BatchChatRequest(session_id="s1", messages=messages), BackgroundTasks()))
+
+    assert [item.message for item in response.results] == messages
+    assert all(item.error is None for item in response.results)
+    assert llm.calls == 6
+    assert llm.max_active == 2
+    assert len(history.messages) == 12
+
+
+def test_closed_stream_cancels_generations_not_yet_started(batch):
+    llm, history = batch
+    messages = [f"sual {i}" for i in range(10)]
+
+    async def scenario():
+        response = await chat_batch(BatchChatRequest(session_id="s1", messages=messages, stream=True),
+                                    BackgroundTasks())
+        stream = response.body_iterator
+        first = await stream.__anext__()
+        # Müştəri bağlantını kəsir — StreamingResponse generatoru bağlayır
+        await stream.aclose()
+        await asyncio.sleep(5 * llm.delay)
+        return first
+
+    first = asyncio.run(scenario())
+    assert '"index":0' in first
+    # Yalnız artıq başlamış (ən çox CHAT_BATCH_CONCURRENCY qədər) generasiyalar başa çatır
+    assert llm.calls <= 4
+    assert len(history.messages) == 2
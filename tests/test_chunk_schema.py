@@ -0,0 +1,27 @@
+# tests/test_chunk_schema.py
+import pytest
+
+from app.rag.chunk_schema import normalize_pdf_date
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("D:20151102094541+01'00'", "2015-11-02T08:45:41Z"),
+    ("D:20151102094541-05'30'", "2015-11-02T15:15:41Z"),
+    ("D:20151102094541+0100", "2015-11-02T08:45:41Z"),
+    ("D:20151102094541Z", "2015-11-02T09:45:41Z"),
+    ("D:20151102094541", "2015-11-02T09:45:41Z"),
+    ("D:2015", "2015-01-01T00:00:00Z"),
+    ("D:201511", "2015-11-01T00:00:00Z"),
+    ("  D:20151102094541Z  ", "2015-11-02T09:45:41Z"),
+    ("2015-11-02T09:45:41+02:00", "2015-11-02T07:45:41Z"),
+    ("2015-11-02T09:45:41Z", "2015-11-02T09:45:41Z"),
+    ("2015-11-02T09:45:41", "2015-11-02T09:45:41Z"),
+    ("2015-11-02", "2015-11-02T00:00:00Z"),
+])
+def test_normalize_pdf_date(value, expected):
+    assert normalize_pdf_date(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "   ", 20151102, "yesterday", "D:20151302", "2015-13-02"])
+def test_normalize_pdf_date_rejects_invalid_values(value):
+    assert normalize_pdf_date(value) is None
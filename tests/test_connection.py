@@ -0,0 +1,93 @@
+# tests/test_connection.py
+import psycopg2
+import pytest
+
+import app.database.connection as connection
+from app.database.connection import ConnectionPool, get_table_connection
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if self.conn.fail_ddl:
+            self.conn.status = psycopg2.extensions.STATUS_IN_TRANSACTION
+            raise psycopg2.errors.InsufficientPrivilege("permission denied for schema public")
+
+
+class FakeConnection:
+    def __init__(self, fail_ddl=False):
+        self.fail_ddl = fail_ddl
+        self.closed = 0
+        self.status = psycopg2.extensions.STATUS_READY
+        self.executed = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.STATUS_READY
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(max_size=2, timeout=0.05, retry_backoff=0)
+    monkeypatch.setattr(connection, "_pool", pool)
+    monkeypatch.setattr(connection, "_ready_tables", set())
+    return pool
+
+
+def test_failed_ddl_returns_connection_to_pool(monkeypatch, pool):
+    created = []
+    monkeypatch.setattr(connection.psycopg2, "connect",
+                        lambda **kwargs: created.append(FakeConnection(fail_ddl=True)) or created[-1])
+
+    # Pool ölçüsündən çox uğursuz DDL — slot sızsaydı sonrakı çağırışlar timeout-a düşərdi
+    for _ in range(5):
+        assert get_table_connection("CREATE TABLE t ()") is None
+
+    assert len(created) == 1
+    assert created[0].rollbacks >= 1
+    assert pool._slots.acquire(timeout=0) and pool._slots.acquire(timeout=0)
+
+
+def test_ddl_runs_once_per_table(monkeypatch, pool):
+    conn = FakeConnection()
+    monkeypatch.setattr(connection.psycopg2, "connect", lambda **kwargs: conn)
+
+    for _ in range(3):
+        get_table_connection("CREATE TABLE a ()").close()
+    get_table_connection("CREATE TABLE b ()").close()
+
+    assert conn.executed == ["CREATE TABLE a ()", "CREATE TABLE b ()"]
+
+
+def test_pool_is_bounded_and_reuses_connections(monkeypatch, pool):
+    created = []
+    monkeypatch.setattr(connection.psycopg2, "connect", lambda **kwargs: created.append(FakeConnection()) or created[-1])
+
+    first, second = pool.get(), pool.get()
+    assert pool.get() is None  # pool dolu: timeout-dan sonra None
+    first.close()
+    third = pool.get()
+
+    assert third._conn is created[0]
+    assert len(created) == 2
+    second.close()
+    third.close()
@@ -0,0 +1,116 @@
+# tests/test_conversation_summary.py
+import time
+import threading
+
+import pytest
+
+import app.database.summaries as summaries
+import app.rag.conversation_summary as conversation_summary
+import app.rag.rag_service as rag_service
+from app.main import build_history_context, format_messages_for_prompt
+from app.rag.conversation_summary import SUMMARY_MAX_TOKENS, estimate_tokens, update_summary
+
+
+class Message:
+    def __init__(self, type, content):
+        self.type = type
+        self.content = content
+
+
+class FakeHistory:
+    def __init__(self):
+        self.messages = []
+
+
+class FakeLLM:
+    """Xülasə əvəzinə promptun sonunu qaytarır — modelin limiti aşdığı ən pis hal."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def invoke(self, input, config=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        return type("Response", (), {"content": input[-SUMMARY_MAX_TOKENS * 8:]})()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """chat_summaries cədvəli və Gemini yaddaşdakı saxtalarla əvəz olunur."""
+    stored = {}
+    histories = {}
+    llm = FakeLLM()
+
+    def save_summary(session_id, summary, summarized_messages):
+        if summarized_messages > stored.get(session_id, ("", 0))[1]:
+            stored[session_id] = (summary, summarized_messages)
+        return True
+
+    monkeypatch.setattr(summaries, "get_summary", lambda session_id: stored.get(session_id, ("", 0)))
+    monkeypatch.setattr(summaries, "save_summary", save_summary)
+    monkeypatch.setattr(rag_service, "create_llm_client", lambda api_key: llm)
+    return histories, stored, llm
+
+
+def _turn(history, i):
+    table = "\n".join(f"| GRI 305-{j} | Scope {j % 3 + 1} | {i * 100 + j} tCO2e | açıqlanmayıb |" for j in range(40))
+    history.messages.append(Message("human", f"Sual {i}: hesabatın GRI 305 uyğunluğunu yoxla, Scope 1-3 daxil."))
+    history.messages.append(Message("ai", f"Cavab {i}:\n| Açıqlama | Əhatə | Dəyər | Status |\n{table}"))
+
+
+def test_summary_prompt_uses_fewer_tokens_than_full_history(session):
+    histories, stored, llm = session
+    history = histories["s1"] = FakeHistory()
+
+    for i in range(12):
+        _turn(history, i)
+        update_summary("s1", histories.get)
+
+    summary_tokens = estimate_tokens(build_history_context(history, "s1"))
+    last_three_tokens = estimate_tokens(format_messages_for_prompt(history.messages[-3:]))
+    full_tokens = estimate_tokens(format_messages_for_prompt(history.messages))
+
+    assert stored["s1"][1] == len(history.messages)
+    assert summary_tokens <= SUMMARY_MAX_TOKENS + conversation_summary.LAST_TURN_MAX_CHARS // 4 + 50
+    assert summary_tokens < last_three_tokens < full_tokens
+    # Xülasə sessiya uzandıqca böyümür, tam tarixçə isə xətti böyüyür
+    assert full_tokens > 10 * summary_tokens
+
+
+def test_each_update_sends_only_new_messages(session):
+    histories, stored, llm = session
+    history = histories["s1"] = FakeHistory()
+    _turn(history, 0)
+    update_summary("s1", histories.get)
+    update_summary("s1", histories.get)  # yeni mesaj yoxdur — Gemini çağırılmır
+
+    assert llm.calls == 1
+    assert stored["s1"][1] == 2
+
+
+def test_concurrent_updates_of_one_session_run_once_and_release_their_lock(session):
+    histories, stored, llm = session
+    llm.delay = 0.05
+    history = histories["s1"] = FakeHistory()
+    _turn(history, 0)
+
+    threads = [threading.Thread(target=update_summary, args=("s1", histories.get)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert llm.calls == 1
+    assert conversation_summary._session_locks == {}
+
+
+def test_session_locks_do_not_accumulate(session):
+    histories, stored, llm = session
+    for i in range(50):
+        histories[f"s{i}"] = FakeHistory()
+        _turn(histories[f"s{i}"], i)
+        update_summary(f"s{i}", histories.get)
+
+    assert len(stored) == 50
+    assert conversation_summary._session_locks == {}
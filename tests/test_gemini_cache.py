@@ -0,0 +1,100 @@
+# tests/test_gemini_cache.py
+import types
+
+import pytest
+
+import app.database.cache_store as cache_store
+import app.rag.gemini_cache as gemini_cache
+from app.rag.gemini_cache import TwoTierCache, decode_vector, encode_vector
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """gemini_cache-in time.monotonic()-i əl ilə irəlilədilən saatla əvəz olunur."""
+    now = [1000.0]
+    monkeypatch.setattr(gemini_cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setitem(gemini_cache._shared_state, "disabled_until", 0.0)
+    return now
+
+
+def _text_cache(ttl=60, max_items=100):
+    return TwoTierCache("test", ttl, lambda text: text.encode("utf-8"), lambda value: value.decode("utf-8"),
+                        max_items=max_items)
+
+
+def test_l1_entry_expires_after_ttl(monkeypatch, clock):
+    monkeypatch.setattr(gemini_cache, "CACHE_SHARED_BACKEND", "none")
+    cache = _text_cache(ttl=60)
+    cache.put_many({"k": "v"})
+
+    clock[0] += 59
+    assert cache.get_many(["k"]) == {"k": "v"}
+    clock[0] += 2
+    assert cache.get_many(["k"]) == {}
+    assert cache.counters["l1_hits"] == 1
+    assert cache.counters["misses"] == 1
+
+
+def test_l1_evicts_least_recently_used(monkeypatch, clock):
+    monkeypatch.setattr(gemini_cache, "CACHE_SHARED_BACKEND", "none")
+    cache = _text_cache(max_items=2)
+    cache.put_many({"a": "1", "b": "2"})
+    cache.get_many(["a"])
+    cache.put_many({"c": "3"})
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": "1", "c": "3"}
+    assert cache.snapshot()["l1_size"] == 2
+
+
+def test_l2_hit_does_not_outlive_row_expiry(monkeypatch, clock):
+    monkeypatch.setattr(gemini_cache, "CACHE_SHARED_BACKEND", "postgres")
+    monkeypatch.setattr(gemini_cache, "CACHE_TOUCH_BATCH", 1)
+    rows = {"k": (b"v", 5.0)}
+    fetched, touched = [], []
+
+    def fetch_entries(keys):
+        fetched.append(list(keys))
+        return {key: rows[key] for key in keys if key in rows}
+
+    monkeypatch.setattr(cache_store, "fetch_entries", fetch_entries)
+    monkeypatch.setattr(cache_store, "touch_entries", lambda keys: touched.extend(keys))
+
+    cache = _text_cache(ttl=3600)
+    assert cache.get_many(["k"]) == {"k": "v"}
+    assert cache.counters["l2_hits"] == 1
+    assert touched == ["k"]
+
+    # L1-də, L2 sətrinin qalan 5 saniyəsi ərzində
+    clock[0] += 4
+    assert cache.get_many(["k"]) == {"k": "v"}
+    assert len(fetched) == 1
+
+    # Sətrin vaxtı bitdikdən sonra L1 də onu vermir
+    clock[0] += 2
+    rows.clear()
+    assert cache.get_many(["k"]) == {}
+    assert len(fetched) == 2
+
+
+def test_l2_failure_falls_back_to_compute(monkeypatch, clock):
+    monkeypatch.setattr(gemini_cache, "CACHE_SHARED_BACKEND", "postgres")
+    monkeypatch.setattr(cache_store, "fetch_entries", lambda keys: None)
+    monkeypatch.setattr(cache_store, "store_entries", lambda *args: pytest.fail("L2 söndürülməli idi"))
+
+    cache = _text_cache()
+    computed = []
+
+    def compute(indexes):
+        computed.append(indexes)
+        return [f"value-{i}" for i in indexes]
+
+    # Təkrarlanan açar bir dəfə hesablanır
+    assert cache.get_or_compute(["x", "y", "x"], compute) == ["value-0", "value-1", "value-0"]
+    assert computed == [[0, 1]]
+    assert cache.counters["l2_errors"] == 1
+    assert not gemini_cache._shared_available()
+
+
+def test_vector_round_trip():
+    vector = [0.25, -1.5, 3.0]
+    assert decode_vector(encode_vector(vector)) == vector
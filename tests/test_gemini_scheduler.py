@@ -0,0 +1,203 @@
+# tests/test_gemini_scheduler.py
+import time
+import threading
+
+import pytest
+
+import app.rag.gemini_scheduler as gemini_scheduler
+from app.rag.gemini_scheduler import (
+    LANE_CHAT, LANE_COMPARE, LANE_INGESTION, DeadlineExceeded, GeminiScheduler,
+)
+
+
+def _wait_until(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "gözlənilən vəziyyət yaranmadı"
+        time.sleep(0.005)
+
+
+def _start(target, *args, **kwargs) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiting_calls_are_granted_by_lane_priority():
+    scheduler = GeminiScheduler(min_limit=1, max_limit=1, initial_limit=1)
+    release = threading.Event()
+    order = []
+
+    threads = [_start(scheduler.run, release.wait, lane=LANE_CHAT)]
+    _wait_until(lambda: scheduler.snapshot()["in_flight"] == 1)
+    # Növbəyə aşağı prioritetdən yuxarıya doğru düşürlər
+    for lane in (LANE_INGESTION, LANE_COMPARE, LANE_CHAT):
+        threads.append(_start(scheduler.run, order.append, lane, lane=lane))
+        _wait_until(lambda: scheduler.snapshot()["queue_depth"][lane] == 1)
+
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert order == [LANE_CHAT, LANE_COMPARE, LANE_INGESTION]
+
+
+def test_throttled_burst_halves_the_limit_once_per_generation():
+    scheduler = GeminiScheduler(min_limit=1, max_limit=16, initial_limit=8)
+    generations = [scheduler._acquire(LANE_CHAT, None) for _ in range(4)]
+
+    # Eyni nəsildə başlamış dörd çağırışın hamısı 429 alır — limit yalnız bir dəfə azalır
+    for generation in generations:
+        scheduler._release("generate", 0.1, throttled=True, failed=True, generation=generation)
+    assert scheduler.snapshot()["concurrency_limit"] == 4
+    assert scheduler.snapshot()["limit_decreases_total"] == 1
+    assert scheduler.snapshot()["throttled_total"] == 4
+
+    # Azalmadan sonra başlayan çağırışın 429-u yeni siqnaldır
+    generation = scheduler._acquire(LANE_CHAT, None)
+    scheduler._release("generate", 0.1, throttled=True, failed=True, generation=generation)
+    assert scheduler.snapshot()["concurrency_limit"] == 2
+
+    # Uğurlu çağırış additiv artım verir; növün ilk çağırışı (müqayisə bazası yoxdur) limiti azaltmır
+    generation = scheduler._acquire(LANE_CHAT, None)
+    scheduler._release("generate", 30.0, throttled=False, failed=False, generation=generation)
+    assert scheduler.snapshot()["concurrency_limit"] == 2.5
+
+
+def test_limit_never_drops_below_minimum():
+    scheduler = GeminiScheduler(min_limit=2, max_limit=16, initial_limit=2)
+    for _ in range(3):
+        generation = scheduler._acquire(LANE_CHAT, None)
+        scheduler._release("generate", 0.1, throttled=True, failed=True, generation=generation)
+    assert scheduler.snapshot()["concurrency_limit"] == 2
+
+
+def test_rate_limited_call_is_retried(monkeypatch):
+    monkeypatch.setattr(gemini_scheduler, "GEMINI_BACKOFF_BASE", 0.001)
+    scheduler = GeminiScheduler(min_limit=1, max_limit=16, initial_limit=4)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return "ok"
+
+    assert scheduler.run(flaky, deadline=time.monotonic() + 5) == "ok"
+    snapshot = scheduler.snapshot()
+    assert len(attempts) == 2
+    assert snapshot["retries_total"] == 1
+    assert snapshot["concurrency_limit"] < 4
+    assert snapshot["in_flight"] == 0
+
+
+def test_non_retryable_error_is_raised_immediately():
+    scheduler = GeminiScheduler()
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("400 invalid argument")
+
+    with pytest.raises(ValueError):
+        scheduler.run(broken)
+    assert len(attempts) == 1
+    assert scheduler.snapshot()["errors_total"] == 1
+
+
+def test_queued_call_expires_at_its_deadline():
+    scheduler = GeminiScheduler(min_limit=1, max_limit=1, initial_limit=1)
+    release = threading.Event()
+    blocker = _start(scheduler.run, release.wait)
+    _wait_until(lambda: scheduler.snapshot()["in_flight"] == 1)
+
+    called = []
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run(called.append, 1, lane=LANE_COMPARE, deadline=time.monotonic() + 0.1)
+    assert time.monotonic() - started < 1.0
+    assert not called
+
+    snapshot = scheduler.snapshot()
+    assert snapshot["deadline_exceeded_total"] == 1
+    assert snapshot["queue_depth"][LANE_COMPARE] == 0
+
+    release.set()
+    blocker.join(2)
+    assert scheduler.snapshot()["in_flight"] == 0
+
+
+def test_request_deadline_context_is_used():
+    scheduler = GeminiScheduler()
+    with gemini_scheduler.request_deadline_scope(time.monotonic() - 1):
+        with pytest.raises(DeadlineExceeded):
+            scheduler.run(lambda: "ok")
+
+
+def _complete(scheduler, kind, latency, tokens):
+    generation = scheduler._acquire(LANE_CHAT, None)
+    scheduler._release(kind, latency, throttled=False, failed=False, generation=generation, tokens=tokens)
+
+
+def test_latency_rule_is_normalized_per_input_token():
+    scheduler = GeminiScheduler(min_limit=1, max_limit=16, initial_limit=8)
+    _complete(scheduler, "generate", 1.0, 1000)
+
+    # 10 dəfə uzun prompt, 10 dəfə uzun cavab — token başına eyni gecikmə, limit artır
+    _complete(scheduler, "generate", 10.0, 10000)
+    assert scheduler.snapshot()["limit_decreases_total"] == 0
+    assert scheduler.snapshot()["concurrency_limit"] > 8
+
+    # Eyni ölçülü prompt 3 dəfə yavaş — yüklənmə siqnalı
+    limit = scheduler.snapshot()["concurrency_limit"]
+    _complete(scheduler, "generate", 3.0, 1000)
+    assert scheduler.snapshot()["limit_decreases_total"] == 1
+    assert scheduler.snapshot()["concurrency_limit"] == round(limit * 0.9, 2)
+
+
+def test_latency_baseline_is_kept_per_call_kind():
+    scheduler = GeminiScheduler(min_limit=1, max_limit=16, initial_limit=8)
+    _complete(scheduler, "embed", 0.05, 1000)
+    _complete(scheduler, "generate", 2.0, 1000)  # generasiyanın öz bazası — embedding ilə müqayisə olunmur
+
+    assert scheduler.snapshot()["limit_decreases_total"] == 0
+    assert set(scheduler.snapshot()["latency_per_1k_tokens_ewma_ms"]) == {"embed", "generate"}
+
+
+def test_short_inputs_are_compared_at_the_token_floor(monkeypatch):
+    monkeypatch.setattr(gemini_scheduler, "GEMINI_LATENCY_MIN_TOKENS", 256)
+    scheduler = GeminiScheduler(min_limit=1, max_limit=16, initial_limit=8)
+    _complete(scheduler, "generate", 0.5, 200)
+    # 10 tokenlik sorğunun sabit gecikməsi token başına 20 dəfə "yavaş" görünməməlidir
+    _complete(scheduler, "generate", 0.5, 10)
+    assert scheduler.snapshot()["limit_decreases_total"] == 0
+
+
+def test_slow_calls_started_before_a_decrease_do_not_decrease_again():
+    scheduler = GeminiScheduler(min_limit=1, max_limit=16, initial_limit=8)
+    _complete(scheduler, "generate", 1.0, 1000)
+    generations = [scheduler._acquire(LANE_CHAT, None) for _ in range(3)]
+    for generation in generations:
+        scheduler._release("generate", 5.0, throttled=False, failed=False, generation=generation, tokens=1000)
+
+    assert scheduler.snapshot()["limit_decreases_total"] == 1
+
+
+def test_wrappers_pass_estimated_input_tokens():
+    class Recorder(GeminiScheduler):
+        def run(self, fn, *args, **kwargs):
+            self.tokens = kwargs["tokens"]
+            return None
+
+    class Inner:
+        def invoke(self, input, config=None):
+            pass
+
+        def embed_documents(self, texts):
+            pass
+
+    scheduler = Recorder()
+    gemini_scheduler.ScheduledChatModel(Inner(), scheduler).invoke("x" * 400, config={"system_instruction": "y" * 400})
+    assert scheduler.tokens == 200
+    gemini_scheduler.ScheduledEmbeddings(Inner(), scheduler).embed_documents(["x" * 40, "y" * 40])
+    assert scheduler.tokens == 20
@@ -0,0 +1,179 @@
+# tests/test_incremental_compare.py
+import hashlib
+
+import numpy as np
+import pytest
+
+import app.database.compare_blocks as compare_blocks
+import app.rag.disclosure_catalog as disclosure_catalog
+import app.rag.incremental_compare as incremental_compare
+import app.rag.rag_service as rag_service
+from app.rag.disclosure_catalog import DisclosureCatalog, analyze_gaps
+
+DIMENSIONS = 16
+
+
+def _vector(text: str) -> np.ndarray:
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).normal(size=DIMENSIONS).astype(np.float32)
+
+
+CATALOG_VECTORS = np.stack([_vector(f"disclosure-{i}") for i in range(6)])
+CATALOG_ENTRIES = [
+    {"standard": "GRI 305" if i < 3 else "GRI 303", "disclosure_id": f"30{5 if i < 3 else 3}-{i % 3 + 1}",
+     "title": f"Disclosure {i}", "requirement": "shall report", "units": []}
+    for i in range(6)
+]
+
+
+class FakeEmbeddings:
+    """"covers-N" mətni N-ci açıqlamanın vektoruna yaxın, qalanları təsadüfi (deterministik) vektor alır."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_with_task(self, texts, task_type):
+        self.calls.append(list(texts))
+        vectors = []
+        for text in texts:
+            vector = _vector(text)
+            if "covers-" in text:
+                index = int(text.split("covers-")[1][0])
+                vector = CATALOG_VECTORS[index] + 0.1 * vector
+            vectors.append(vector.tolist())
+        return vectors
+
+
+@pytest.fixture
+def workbooks(monkeypatch):
+    """Excel oxunuşu, kataloq, embedding-lər və compare_blocks cədvəli yaddaşdakı saxtalarla əvəz olunur."""
+    catalog = DisclosureCatalog(CATALOG_ENTRIES, CATALOG_VECTORS)
+    embeddings = FakeEmbeddings()
+    sheets = {}
+    stored = {}
+
+    def fetch_block_scores(session_id, fingerprints):
+        return {fp: stored[(session_id, fp)] for fp in fingerprints if (session_id, fp) in stored}
+
+    def store_block_scores(session_id, entries, kinds, retention_days):
+        stored.update({(session_id, fp): value for fp, value in entries.items()})
+        return True
+
+    monkeypatch.setattr(incremental_compare, "get_disclosure_catalog", lambda: catalog)
+    monkeypatch.setattr(disclosure_catalog, "get_disclosure_catalog", lambda: catalog)
+    monkeypatch.setattr(rag_service, "create_embeddings_client", lambda api_key: embeddings)
+    monkeypatch.setattr(rag_service, "excel_sheet_rows", lambda content: sheets[content])
+    monkeypatch.setattr(compare_blocks, "fetch_block_scores", fetch_block_scores)
+    monkeypatch.setattr(compare_blocks, "store_block_scores", store_block_scores)
+    monkeypatch.setattr(incremental_compare, "COMPARE_BLOCK_ROWS", 3)
+    monkeypatch.setattr(incremental_compare, "COMPARE_INCREMENTAL_ENABLED", True)
+    return sheets, embeddings
+
+
+def _workbook(rows_per_sheet: int = 30):
+    return {
+        "Emissions": [f"[Emissions] row {i}" + (" covers-1" if i == 7 else "") for i in range(rows_per_sheet)],
+        "Water": [f"[Water] row {i}" + (" covers-4" if i == 3 else "") for i in range(rows_per_sheet)],
+    }
+
+
+QUERY = "Scope 1 emissiyalarını yoxla"
+
+
+def test_first_run_matches_full_analysis(workbooks):
+    sheets, embeddings = workbooks
+    sheets[b"v1"] = _workbook()
+
+    gaps, stats = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    assert gaps == analyze_gaps(rag_service.excel_rows_as_text(b"v1"), QUERY)
+    assert {entry["disclosure_id"] for entry in gaps["covered"]} == {"305-2", "303-2"}
+    assert stats["rows_embedded"] == 60
+    assert stats["blocks_reused"] == 0
+
+
+def test_changed_block_is_recomputed_and_result_matches_full_analysis(workbooks):
+    sheets, embeddings = workbooks
+    sheets[b"v1"] = _workbook()
+    incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    changed = _workbook()
+    changed["Water"][3] = "[Water] row 3 edited"  # 303-2 artıq əhatə olunmur
+    changed["Emissions"][20] = "[Emissions] row 20 covers-0"
+    sheets[b"v2"] = changed
+
+    gaps, stats = incremental_compare.analyze_workbook_gaps(b"v2", QUERY, "s1")
+
+    assert gaps == analyze_gaps(rag_service.excel_rows_as_text(b"v2"), QUERY)
+    assert {entry["disclosure_id"] for entry in gaps["covered"]} == {"305-1", "305-2"}
+    assert stats["blocks_reused"] > 0
+    assert stats["blocks_reused"] < stats["blocks"]
+    assert 0 < stats["rows_embedded"] < 60
+
+
+def test_unchanged_workbook_is_reused_without_parsing(workbooks):
+    sheets, embeddings = workbooks
+    sheets[b"v1"] = _workbook()
+    first, _ = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+    embeddings.calls.clear()
+
+    second, stats = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    assert second == first
+    assert stats["workbook_reused"] is True
+    assert embeddings.calls == [[QUERY]]
+
+
+def test_unchanged_sheet_is_reused_when_another_sheet_changes(workbooks):
+    sheets, embeddings = workbooks
+    sheets[b"v1"] = _workbook()
+    incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    changed = _workbook()
+    changed["Water"].append("[Water] row 30")
+    sheets[b"v2"] = changed
+    gaps, stats = incremental_compare.analyze_workbook_gaps(b"v2", QUERY, "s1")
+
+    assert gaps == analyze_gaps(rag_service.excel_rows_as_text(b"v2"), QUERY)
+    assert stats["sheets_reused"] == 1
+
+
+def test_other_session_does_not_reuse_blocks(workbooks):
+    sheets, embeddings = workbooks
+    sheets[b"v1"] = _workbook()
+    incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    _, stats = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s2")
+
+    assert stats["workbook_reused"] is False
+    assert stats["rows_embedded"] == 60
+
+
+def test_rows_are_embedded_in_batches_without_dropping_any(workbooks, monkeypatch):
+    sheets, embeddings = workbooks
+    monkeypatch.setattr(disclosure_catalog, "CATALOG_EMBED_BATCH_SIZE", 7)
+    sheets[b"v1"] = _workbook(rows_per_sheet=300)
+
+    gaps, stats = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    assert all(len(call) <= 7 for call in embeddings.calls)
+    assert stats["rows_embedded"] == 600
+    assert "truncated" not in gaps
+    assert gaps == analyze_gaps(rag_service.excel_rows_as_text(b"v1"), QUERY)
+
+
+def test_workbook_over_safety_cap_is_flagged_truncated(workbooks, monkeypatch):
+    sheets, embeddings = workbooks
+    monkeypatch.setattr(disclosure_catalog, "CATALOG_MAX_EXCEL_ROWS", 40)
+    monkeypatch.setattr(incremental_compare, "CATALOG_MAX_EXCEL_ROWS", 40)
+    sheets[b"v1"] = _workbook()
+
+    gaps, stats = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+
+    assert gaps["truncated"] == {"rows_analyzed": 40, "rows_total": 60}
+    assert gaps == analyze_gaps(rag_service.excel_rows_as_text(b"v1"), QUERY)
+    # Fayl səviyyəli nəticə saxlanmır — təkrar göndərişdə də işarə itmir
+    again, stats = incremental_compare.analyze_workbook_gaps(b"v1", QUERY, "s1")
+    assert stats["workbook_reused"] is False
+    assert stats["rows_embedded"] == 0
+    assert again["truncated"] == {"rows_analyzed": 40, "rows_total": 60}
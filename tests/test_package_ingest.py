@@ -0,0 +1,107 @@
+# tests/test_package_ingest.py
+import io
+import asyncio
+import zipfile
+
+import pytest
+
+import app.rag.package_ingest as package_ingest
+from app.rag.package_ingest import PackageError, collect_package_files, read_uploads
+
+MB = 1024 * 1024
+
+
+class FakeUpload:
+    """UploadFile-ın read(size) interfeysi; oxunan hissələr sayılır."""
+
+    def __init__(self, filename: str, content: bytes, size=None):
+        self.filename = filename
+        self.size = size
+        self._stream = io.BytesIO(content)
+        self.reads = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        return self._stream.read(size)
+
+
+def _zip(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(package_ingest, "UPLOAD_MAX_FILE_MB", 2)
+    monkeypatch.setattr(package_ingest, "UPLOAD_MAX_UNPACKED_MB", 3)
+    monkeypatch.setattr(package_ingest, "UPLOAD_MAX_FILES", 3)
+
+
+def test_read_uploads_returns_contents(limits):
+    uploads = [FakeUpload("a.pdf", b"x" * 10), FakeUpload("b.xlsx", b"y" * (MB + 5))]
+    assert asyncio.run(read_uploads(uploads)) == [("a.pdf", b"x" * 10), ("b.xlsx", b"y" * (MB + 5))]
+
+
+def test_read_uploads_stops_at_per_file_limit(limits):
+    upload = FakeUpload("big.pdf", b"x" * (10 * MB))
+    with pytest.raises(PackageError, match="big.pdf"):
+        asyncio.run(read_uploads([upload]))
+    # 10 MB-ın hamısı deyil, yalnız limiti aşan hissəyə qədər oxunur
+    assert upload.reads == 3
+
+
+def test_read_uploads_rejects_declared_size_without_reading(limits):
+    upload = FakeUpload("big.pdf", b"x" * 10, size=5 * MB)
+    with pytest.raises(PackageError):
+        asyncio.run(read_uploads([upload]))
+    assert upload.reads == 0
+
+
+def test_read_uploads_enforces_total_and_count_limits(limits):
+    uploads = [FakeUpload(f"{name}.pdf", b"x" * int(1.5 * MB)) for name in "abc"]
+    with pytest.raises(PackageError, match="ümumi ölçüsü"):
+        asyncio.run(read_uploads(uploads))
+    assert uploads[2].reads == 1
+
+    with pytest.raises(PackageError, match="limit 3"):
+        asyncio.run(read_uploads([FakeUpload(f"{i}.pdf", b"x") for i in range(4)]))
+
+
+def test_collect_expands_zip_and_skips_unsupported(limits):
+    archive = _zip({
+        "report/energy.pdf": b"pdf",
+        "report/water.xlsx": b"xlsx",
+        "report/notes.txt": b"txt",
+        "__MACOSX/report/._energy.pdf": b"meta",
+        "report/.hidden.pdf": b"hidden",
+    })
+    files, skipped = collect_package_files([("package.zip", archive), ("readme.docx", b"doc")])
+
+    assert files == [("energy.pdf", b"pdf"), ("water.xlsx", b"xlsx")]
+    assert {entry["filename"] for entry in skipped} == {"package.zip/report/notes.txt", "readme.docx"}
+
+
+def test_collect_suffixes_duplicate_names(limits):
+    archive = _zip({"2023/emissions.pdf": b"2023", "2024/emissions.pdf": b"2024"})
+    files, _ = collect_package_files([("emissions.pdf", b"direct"), ("package.zip", archive)])
+
+    assert [name for name, _ in files] == ["emissions.pdf", "emissions (2).pdf", "emissions (3).pdf"]
+    assert [content for _, content in files] == [b"direct", b"2023", b"2024"]
+
+
+def test_collect_enforces_size_and_count_limits(limits):
+    with pytest.raises(PackageError, match="big.pdf"):
+        collect_package_files([("package.zip", _zip({"big.pdf": b"x" * (3 * MB)}))])
+    with pytest.raises(PackageError, match="ümumi ölçüsü"):
+        collect_package_files([("a.pdf", b"x" * (2 * MB)),
+                               ("package.zip", _zip({"b.pdf": b"x" * int(1.5 * MB)}))])
+    with pytest.raises(PackageError, match="limit 3"):
+        collect_package_files([("package.zip", _zip({f"{i}.pdf": b"x" for i in range(4)}))])
+
+
+def test_collect_rejects_corrupt_zip(limits):
+    with pytest.raises(PackageError, match="ZIP"):
+        collect_package_files([("broken.zip", b"not a zip")])
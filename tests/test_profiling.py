@@ -0,0 +1,157 @@
+# tests/test_profiling.py
+import time
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+import app.profiling as profiling
+from app.profiling import Profile, ProfileStore, ProfilingMiddleware, SamplingProfiler
+
+
+def busy_profiled(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_unrelated(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_on_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _roots(profile):
+    return {stack[0] for stack in profile.stacks}
+
+
+def _functions_under(profile, prefix):
+    return {frame.split(" ")[0] for stack in profile.stacks if stack[0].startswith(prefix) for frame in stack[1:]}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ProfileStore(max_size=5)
+    monkeypatch.setattr(profiling, "profile_store", store)
+    monkeypatch.setattr(main, "profile_store", store)
+    return store
+
+
+def _sample_profile():
+    profile = Profile("abc123", "POST /chat")
+    profile.interval_ms = 5
+    profile.stacks = {
+        ("thread:request_0", "chat (main.py:1)", "invoke (gemini.py:10)"): 3,
+        ("thread:request_0", "chat (main.py:1)"): 1,
+        ("shared-loop:MainThread", "run (base_events.py:1)"): 2,
+    }
+    return profile
+
+
+def test_collapsed_format_lists_stacks_by_weight():
+    lines = _sample_profile().to_collapsed().splitlines()
+    assert lines == [
+        "thread:request_0;chat (main.py:1);invoke (gemini.py:10) 3",
+        "shared-loop:MainThread;run (base_events.py:1) 2",
+        "thread:request_0;chat (main.py:1) 1",
+    ]
+
+
+def test_speedscope_format_shares_frames_and_weights_by_interval():
+    document = _sample_profile().to_speedscope()
+    frames = [frame["name"] for frame in document["shared"]["frames"]]
+    sampled = document["profiles"][0]
+
+    assert len(frames) == len(set(frames)) == 5
+    assert sampled["type"] == "sampled" and sampled["unit"] == "milliseconds"
+    assert sampled["weights"] == [15, 5, 10]
+    assert sampled["endValue"] == 30
+    assert [[frames[i] for i in sample] for sample in sampled["samples"]][0] == \
+        ["thread:request_0", "chat (main.py:1)", "invoke (gemini.py:10)"]
+
+
+def test_only_attached_threads_are_sampled(store):
+    profiler = SamplingProfiler("test").start()
+    worker = threading.Thread(target=profiler.run_in_thread, args=(busy_profiled, 0.2), name="worker")
+    other = threading.Thread(target=busy_unrelated, args=(0.2,), name="other")
+    worker.start()
+    other.start()
+    worker.join()
+    other.join()
+    profile = profiler.stop()
+
+    assert "thread:worker" in _roots(profile)
+    assert "busy_profiled" in _functions_under(profile, "thread:worker")
+    assert not any("busy_unrelated" in frame for stack in profile.stacks for frame in stack)
+    assert store.get(profile.id) is profile
+
+
+def test_middleware_marks_event_loop_samples_as_shared(store):
+    async def app(scope, receive, send):
+        busy_on_loop(0.1)
+        await asyncio.to_thread(busy_profiled, 0.1)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def scenario():
+        asyncio.get_running_loop().set_default_executor(
+            profiling._ProfiledThreadPoolExecutor(max_workers=2, thread_name_prefix="request"))
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/chat", "headers": [(b"x-profile", b"1")]}
+        await ProfilingMiddleware(app)(scope, None, send)
+        return messages
+
+    messages = asyncio.run(scenario())
+    profile_id = dict(messages[0]["headers"])[b"x-profile-id"].decode()
+    profile = store.get(profile_id)
+
+    loop_root = f"shared-loop:{threading.current_thread().name}"
+    assert loop_root in _roots(profile)
+    assert "busy_on_loop" in _functions_under(profile, "shared-loop:")
+    assert "busy_profiled" in _functions_under(profile, "thread:request")
+    assert "busy_profiled" not in _functions_under(profile, "shared-loop:")
+
+
+def test_request_without_profile_header_is_not_profiled(store, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(profiling.active_profiler.get())
+
+    asyncio.run(ProfilingMiddleware(app)({"type": "http", "method": "GET", "path": "/", "headers": []}, None, None))
+    assert calls == [None]
+    assert store.list() == []
+
+
+def test_admin_profiles_endpoints(store, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    store.add(_sample_profile())
+    client = TestClient(main.app)
+    headers = {"X-Admin-Token": "secret"}
+
+    assert client.get("/admin/profiles").status_code == 403
+    listing = client.get("/admin/profiles", headers=headers).json()
+    assert [entry["id"] for entry in listing["profiles"]] == ["abc123"]
+    assert listing["profiles"][0]["samples"] == 6
+
+    speedscope = client.get("/admin/profiles/abc123", headers=headers)
+    assert speedscope.json()["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+
+    collapsed = client.get("/admin/profiles/abc123", params={"format": "collapsed"}, headers=headers)
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    assert collapsed.text == _sample_profile().to_collapsed()
+
+    assert client.get("/admin/profiles/missing", headers=headers).status_code == 404
@@ -0,0 +1,298 @@
+# tests/test_query_log.py
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app.database.connection as connection
+import app.database.query_log as db_query_log
+import app.query_log as query_log
+from app.query_log import QueryLogWriter, QueryTrace, query_trace, record_retrieval, stage, start_trace
+
+
+def _record(i, **fields):
+    return {"created_at": 1000.0 + i, "endpoint": "/chat", "session_id": "s1", "question": f"sual {i}",
+            "payload": {"session_id": "s1", "message": f"sual {i}"}, "retrieved": [], "timings_ms": {},
+            "prompt_tokens": 10, "response_tokens": 5, "status_code": 200, "duration_ms": 120.0, **fields}
+
+
+class FakeInsert:
+    """insert_query_logs əvəzi: batch-ləri yadda saxlayır; `ok=False` — DB xətası."""
+
+    def __init__(self):
+        self.batches = []
+        self.ok = True
+        self.flushed = threading.Event()
+
+    def __call__(self, records):
+        self.batches.append(list(records))
+        self.flushed.set()
+        return self.ok
+
+
+@pytest.fixture
+def insert(monkeypatch):
+    fake = FakeInsert()
+    monkeypatch.setattr(db_query_log, "insert_query_logs", fake)
+    return fake
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "gözlənilən vəziyyət yaranmadı"
+        time.sleep(0.005)
+
+
+# --- Qeyd (trace) ---
+
+def test_trace_collects_stages_hits_and_tokens_once(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(query_log, "query_log_writer", type("W", (), {"submit": staticmethod(submitted.append)})())
+    monkeypatch.setattr(query_log, "QUERY_LOG_ENABLED", True)
+
+    def scenario():
+        trace = start_trace("/chat", "s1", "GRI 305?", payload={"session_id": "s1", "message": "GRI 305?"})
+        with stage("search"):
+            record_retrieval("esg_standards", [{"_id": "a", "_score": 0.9}, {"_id": "b", "_score": 0.5}])
+        with stage("search"):
+            pass
+        trace.add_tokens(100, 20)
+        trace.finish()
+        trace.finish()
+        trace.add_tokens(1, 1)  # bağlanmış qeyd dəyişmir
+        return trace
+
+    contextvars.copy_context().run(scenario)
+
+    assert len(submitted) == 1
+    record = submitted[0]
+    assert record["retrieved"] == [{"index": "esg_standards", "id": "a", "score": 0.9},
+                                   {"index": "esg_standards", "id": "b", "score": 0.5}]
+    assert set(record["timings_ms"]) == {"search"}
+    assert (record["prompt_tokens"], record["response_tokens"]) == (100, 20)
+
+
+def test_query_trace_records_error_status(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(query_log, "query_log_writer", type("W", (), {"submit": staticmethod(submitted.append)})())
+    monkeypatch.setattr(query_log, "QUERY_LOG_ENABLED", True)
+
+    class Unavailable(Exception):
+        status_code = 503
+
+    def scenario():
+        with pytest.raises(Unavailable):
+            with query_trace("/compare-excel", "s1", "yoxla"):
+                raise Unavailable()
+
+    contextvars.copy_context().run(scenario)
+    assert submitted[0]["status_code"] == 503
+
+
+def test_helpers_are_noops_without_trace():
+    with stage("search"):
+        record_retrieval("esg_standards", [{"_id": "a"}])
+    assert query_log.current_trace.get() is None
+
+
+# --- Yazıcı ---
+
+def test_writer_flushes_full_batches(insert, monkeypatch):
+    monkeypatch.setattr(query_log, "QUERY_LOG_BATCH_SIZE", 3)
+    monkeypatch.setattr(query_log, "QUERY_LOG_FLUSH_SECONDS", 30)
+    writer = QueryLogWriter()
+
+    for i in range(7):
+        writer.submit(_record(i))
+    _wait_until(lambda: len(insert.batches) == 2)
+    assert [len(batch) for batch in insert.batches] == [3, 3]
+
+    # Qalan bir qeyd bağlananda yazılır
+    writer.close()
+    assert [len(batch) for batch in insert.batches] == [3, 3, 1]
+    assert [r["question"] for batch in insert.batches for r in batch] == [f"sual {i}" for i in range(7)]
+    assert writer.snapshot()["written"] == 7
+    assert writer.snapshot()["flushes"] == 3
+
+
+def test_writer_flushes_partial_batch_after_interval(insert, monkeypatch):
+    monkeypatch.setattr(query_log, "QUERY_LOG_BATCH_SIZE", 100)
+    monkeypatch.setattr(query_log, "QUERY_LOG_FLUSH_SECONDS", 0.05)
+    writer = QueryLogWriter()
+
+    writer.submit(_record(0))
+    assert insert.flushed.wait(2)
+    assert insert.batches == [[_record(0)]]
+    writer.close()
+
+
+def test_close_without_records_does_not_start_thread(insert):
+    writer = QueryLogWriter()
+    writer.close()
+    assert insert.batches == []
+
+
+def test_failed_write_counts_dropped_records(insert, monkeypatch):
+    monkeypatch.setattr(query_log, "QUERY_LOG_BATCH_SIZE", 2)
+    insert.ok = False
+    writer = QueryLogWriter()
+
+    writer.submit(_record(0))
+    writer.submit(_record(1))
+    writer.close()
+
+    snapshot = writer.snapshot()
+    assert snapshot["write_errors"] == 1
+    assert snapshot["dropped"] == 2
+    assert snapshot["written"] == 0
+
+
+def test_full_queue_drops_instead_of_blocking(monkeypatch):
+    monkeypatch.setattr(query_log, "QUERY_LOG_QUEUE_SIZE", 2)
+    writer = QueryLogWriter()
+    monkeypatch.setattr(writer, "_ensure_started", lambda: None)  # istehlakçı yoxdur — növbə dolur
+
+    for i in range(3):
+        writer.submit(_record(i))
+
+    assert writer.snapshot()["submitted"] == 2
+    assert writer.snapshot()["dropped"] == 1
+
+
+# --- DB qatı ---
+
+def test_db_functions_without_connection(monkeypatch):
+    monkeypatch.setattr(db_query_log, "get_table_connection", lambda ddl: None)
+    assert db_query_log.insert_query_logs([_record(0)]) is False
+    assert db_query_log.fetch_query_logs() == []
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    if not os.getenv("DB_URL"):
+        pytest.skip("DB_URL təyin olunmayıb")
+    monkeypatch.setattr(connection, "_pool", connection.ConnectionPool(max_size=2))
+    monkeypatch.setattr(connection, "_ready_tables", set())
+    conn = connection.get_pooled_connection()
+    if conn is None:
+        pytest.skip("PostgreSQL əlçatan deyil")
+    conn.close()
+    endpoint = f"/test-{uuid.uuid4().hex[:8]}"
+    yield endpoint
+    conn = connection.get_pooled_connection()
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM query_log WHERE endpoint = %s", (endpoint,))
+    conn.commit()
+    conn.close()
+
+
+def test_insert_and_fetch_round_trip(postgres):
+    endpoint = postgres
+    records = [_record(i, endpoint=endpoint, retrieved=[{"index": "esg_standards", "id": f"c{i}", "score": 0.5}],
+                       timings_ms={"search": 12.5}, question=f"Sual {i}: Scope 2 nədir?")
+               for i in range(3)]
+
+    assert db_query_log.insert_query_logs(records) is True
+    fetched = db_query_log.fetch_query_logs(endpoints=[endpoint])
+
+    assert [r["question"] for r in fetched] == [r["question"] for r in records]
+    assert fetched[0]["payload"] == records[0]["payload"]
+    assert fetched[0]["retrieved"] == records[0]["retrieved"]
+    assert fetched[0]["created_at"] == pytest.approx(1000.0)
+    assert len(db_query_log.fetch_query_logs(endpoints=[endpoint], limit=2)) == 2
+    assert db_query_log.fetch_query_logs(since="1970-01-01 00:16:41+00", endpoints=[endpoint])[0]["question"] \
+        == records[1]["question"]
+
+
+# --- Replay CLI ---
+
+@pytest.fixture
+def server():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            received.append((time.monotonic(), self.path, body))
+            status = 500 if body.get("message") == "xəta" else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", received
+    httpd.shutdown()
+
+
+def _write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_replay_cli_sends_replayable_records(server, tmp_path, monkeypatch, capsys):
+    base_url, received = server
+    path = tmp_path / "jurnal.jsonl"
+    _write_jsonl(path, [
+        _record(0),
+        _record(1, endpoint="/chat/batch", payload={"session_id": "s2", "messages": ["a", "b"], "stream": True}),
+        _record(2, endpoint="/compare-excel", payload=None),
+        _record(3, payload={"session_id": "s1", "message": "xəta"}),
+    ])
+    monkeypatch.setattr(sys, "argv", ["query_log", "replay", "--input", str(path), "--base-url", base_url,
+                                      "--speed", "0"])
+
+    query_log.main()
+
+    assert sorted((p, b.get("session_id")) for _, p, b in received) == [
+        ("/chat", "replay-s1"), ("/chat", "replay-s1"), ("/chat/batch", "replay-s2")]
+    assert all("stream" not in body for _, _, body in received)
+    report = json.loads(capsys.readouterr().out.split("\n", 1)[1])
+    assert report["sent"] == 3
+    assert report["skipped"] == 1
+    assert report["errors"] == 1
+
+
+def test_replay_keeps_original_spacing_scaled_by_speed(server):
+    base_url, received = server
+    records = [_record(0), _record(0.4)]
+
+    query_log.replay(records, base_url, speed=2.0, session_prefix="")
+
+    gap = received[1][0] - received[0][0]
+    assert 0.15 < gap < 0.6
+    assert received[0][2]["session_id"] == "s1"
+
+
+def test_export_cli_writes_filtered_jsonl(tmp_path, monkeypatch):
+    records = [_record(0), _record(1, endpoint="/compare-excel"), _record(2)]
+    requested = {}
+
+    def fetch(since, until, endpoints, limit):
+        requested.update(since=since, until=until, endpoints=endpoints, limit=limit)
+        return [r for r in records if not endpoints or r["endpoint"] in endpoints]
+
+    monkeypatch.setattr(db_query_log, "fetch_query_logs", fetch)
+    path = tmp_path / "export.jsonl"
+    monkeypatch.setattr(sys, "argv", ["query_log", "export", str(path), "--since", "2026-01-01",
+                                      "--endpoint", "/chat"])
+
+    query_log.main()
+
+    with open(path, encoding="utf-8") as f:
+        exported = [json.loads(line) for line in f]
+    assert exported == [records[0], records[2]]
+    assert requested == {"since": "2026-01-01", "until": None, "endpoints": ["/chat"], "limit": None}
@@ -0,0 +1,133 @@
+# tests/test_retrieval_cache.py
+import time
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import app.database.retrieval_generations as retrieval_generations
+import app.rag.retrieval_cache as retrieval_cache
+from app.rag.retrieval_cache import RetrievalCache, bump_generation, cache_key, current_generation
+
+INDEX = "rag_knowledge_base"
+VECTOR = [0.1, 0.2, 0.3]
+
+
+class FakeGenerations:
+    """retrieval_generations cədvəlinin yaddaşdakı əvəzi; `down=True` olduqda DB əlçatmazdır."""
+
+    def __init__(self):
+        self.values = {}
+        self.down = False
+        self.fetches = 0
+
+    def fetch(self, index_name, session_key=""):
+        self.fetches += 1
+        if self.down:
+            raise ConnectionError("DB əlçatmazdır")
+        return self.values.get((index_name, session_key), 0)
+
+    def increment(self, index_name, session_key=""):
+        if self.down:
+            raise ConnectionError("DB əlçatmazdır")
+        self.values[(index_name, session_key)] = self.values.get((index_name, session_key), 0) + 1
+        return self.values[(index_name, session_key)]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeGenerations()
+    monkeypatch.setattr(retrieval_generations, "fetch_generation", db.fetch)
+    monkeypatch.setattr(retrieval_generations, "increment_generation", db.increment)
+    monkeypatch.setattr(retrieval_cache, "RETRIEVAL_GENERATION_BACKEND", "postgres")
+    monkeypatch.setattr(retrieval_cache, "_generations", OrderedDict())
+    monkeypatch.setattr(retrieval_cache, "_refreshing", set())
+    return db
+
+
+def _drain():
+    # Fon oxunuşları bir thread-dədir: növbəyə qoyulan boş iş əvvəlkilərin bitməsini gözləyir
+    retrieval_cache._refresh_executor.submit(lambda: None).result()
+
+
+def test_shared_generation_is_read_in_background(db, monkeypatch):
+    db.values[(INDEX, "s1")] = 5
+    released = threading.Event()
+    monkeypatch.setattr(retrieval_generations, "fetch_generation", lambda *args: released.wait(5) and db.fetch(*args))
+
+    started = time.monotonic()
+    assert current_generation(INDEX, "s1") == (0, 0)
+    assert time.monotonic() - started < 1  # axtarış yolu DB-ni gözləmir
+    released.set()
+    _drain()
+
+    assert current_generation(INDEX, "s1") == (5, 0)
+
+
+def test_shared_value_is_refreshed_only_after_interval(db, monkeypatch):
+    current_generation(INDEX)
+    _drain()
+    for _ in range(10):
+        current_generation(INDEX)
+    _drain()
+    assert db.fetches == 1
+
+    # Başqa worker-in yazısı REFRESH intervalından sonra görünür
+    db.values[(INDEX, "")] = 3
+    monkeypatch.setattr(retrieval_cache, "RETRIEVAL_GENERATION_REFRESH", 0)
+    current_generation(INDEX)
+    _drain()
+    assert current_generation(INDEX) == (3, 0)
+
+
+def test_bump_changes_key_through_shared_and_local_parts(db):
+    before = cache_key(INDEX, VECTOR, 4, session_id="s1")
+    _drain()
+
+    assert bump_generation(INDEX, "s1") == (1, 1)
+    after = cache_key(INDEX, VECTOR, 4, session_id="s1")
+
+    assert before != after
+    assert db.values[(INDEX, "s1")] == 1
+
+
+def test_db_down_falls_back_to_local_counter(db):
+    db.down = True
+    cache = RetrievalCache()
+    key = cache_key(INDEX, VECTOR, 4, session_id="s1")
+    _drain()
+    cache.put(key, [{"text": "köhnə"}])
+    assert cache.get(cache_key(INDEX, VECTOR, 4, session_id="s1")) == [{"text": "köhnə"}]
+
+    # Ortaq sayğac yazılmasa da bu prosesin öz yazısı keşi dərhal etibarsız edir
+    assert bump_generation(INDEX, "s1") == (0, 1)
+    assert cache.get(cache_key(INDEX, VECTOR, 4, session_id="s1")) is None
+
+    # DB qayıtdıqda ortaq dəyər yerli sayğacla birlikdə istifadə olunur
+    db.down = False
+    db.values[(INDEX, "s1")] = 7
+    retrieval_cache._generations[(INDEX, "s1")][2] = 0.0
+    current_generation(INDEX, "s1")
+    _drain()
+    assert current_generation(INDEX, "s1") == (7, 1)
+
+
+def test_idle_counters_are_dropped_after_cache_ttl(db, monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "RETRIEVAL_GENERATION_BACKEND", "none")
+    monkeypatch.setattr(retrieval_cache, "RETRIEVAL_CACHE_TTL", 0.05)
+    cache = RetrievalCache(ttl=0.05)
+
+    for i in range(100):
+        current_generation(INDEX, f"session-{i}")
+    key = cache_key(INDEX, VECTOR, 4, session_id="s1")
+    cache.put(key, [{"text": "köhnə"}])
+    bump_generation(INDEX, "s1")
+    assert len(retrieval_cache._generations) == 101
+
+    time.sleep(0.1)
+    current_generation(INDEX, "fresh")
+    assert list(retrieval_cache._generations) == [(INDEX, "fresh")]
+
+    # Silinmiş sayğac sıfırdan başlayır, amma həmin generasiya ilə yazılmış girişlərin vaxtı artıq keçib
+    assert cache_key(INDEX, VECTOR, 4, session_id="s1") == key
+    assert cache.get(key) is None
@@ -0,0 +1,172 @@
+# tests/test_standards_router.py
+import json
+
+import numpy as np
+import pytest
+
+import app.rag.standards_router as standards_router
+from app.rag.standards_router import StandardsRouter, get_standards_router, routed_knn_body
+
+FILES = [
+    "GRI_3__Material_Topics_2021.pdf",
+    "GRI_303__Water_and_Effluents_2018.pdf",
+    "GRI_305__Emissions_2016.pdf",
+    "GRI_305__Emissions_2016 (1).pdf",
+    "GRI_Standards_Glossary_2022.pdf",
+    "PAS_2050_2011.pdf",
+    "Scope_2_Guidance.pdf",
+    "Scope3_Calculation_Guidance.pdf",
+    "co2_CSI_Cement_Protocol.pdf",
+    "Calculating_N2O_Emissions_from_the_Production_of_Nitric_Acid.pdf",
+    "Task_Force_on_Climate-related_Financial_Disclosures.pdf",
+]
+GRI_305 = ["GRI_305__Emissions_2016.pdf", "GRI_305__Emissions_2016 (1).pdf"]
+CEMENT = "co2_CSI_Cement_Protocol.pdf"
+
+
+def _near(file_name):
+    """Verilmiş standartın centroid-inə (vahid vektor) yaxın sorğu vektoru."""
+    vector = np.full(len(FILES), 0.05)
+    vector[FILES.index(file_name)] = 1.0
+    return vector.tolist()
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(standards_router, "ROUTER_TOP_STANDARDS", 1)
+    return StandardsRouter(FILES, np.eye(len(FILES), dtype=np.float32))
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("GRI 305 üzrə emissiyalar", GRI_305),
+    ("gri-305 tələbləri", GRI_305),
+    ("305-1 birbaşa emissiyalar", GRI_305),
+    ("GRI 3 material mövzular", ["GRI_3__Material_Topics_2021.pdf"]),
+    ("303-3 su götürülməsi", ["GRI_303__Water_and_Effluents_2018.pdf"]),
+    ("Scope 2 market-based metod", ["Scope_2_Guidance.pdf"]),
+    ("scope-3 kateqoriyaları", ["Scope3_Calculation_Guidance.pdf"]),
+    ("PAS 2050 məhsul karbon izi", ["PAS_2050_2011.pdf"]),
+    ("TCFD ssenari təhlili", ["Task_Force_on_Climate-related_Financial_Disclosures.pdf"]),
+    ("CSI metodologiyası", [CEMENT]),
+    ("GRI glossary tərifləri", ["GRI_Standards_Glossary_2022.pdf"]),
+])
+def test_identifiers_force_a_filter(router, query, expected):
+    assert router.route(query, None) == expected
+    # Ad/ID centroid-dən üstündür — vektor başqa standarta yaxın olsa belə
+    assert router.route(query, _near(FILES[9])) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "cement istehsalında emissiyalar",
+    "N2O emissiya faktoru",
+    "uncertainty qiymətləndirməsi",
+    "2023-2024 hesabat dövrü",
+    "3.305-1 bəndi",
+    "Su istifadəsi necə açıqlanır?",
+])
+def test_topics_and_non_identifiers_alone_do_not_filter(router, query):
+    assert router.route(query, None) is None
+
+
+@pytest.mark.parametrize("query, vector, expected", [
+    # Etibarlı centroid yönləndirməsi
+    ("Birbaşa emissiyaları necə hesablayım?", _near(GRI_305[0]), [GRI_305[0]]),
+    # Mövzu sözü etibarlı yönləndirməni genişləndirir
+    ("cement zavodunun emissiyaları", _near(GRI_305[0]), [GRI_305[0], CEMENT]),
+    # Mövzu sözü artıq seçilmiş standarta uyğundursa təkrar əlavə olunmur
+    ("cement klinker nisbəti", _near(CEMENT), [CEMENT]),
+    # Bütün standartlara bərabər yaxın — etibarlı deyil
+    ("ümumi sual", [1.0] * len(FILES), None),
+    ("cement ümumi sual", [1.0] * len(FILES), None),
+])
+def test_centroid_routing(router, query, vector, expected):
+    assert router.route(query, vector) == expected
+
+
+def test_counters_record_each_routing_path(router):
+    router.route("GRI 305", None)
+    router.route("emissiyalar", _near(GRI_305[0]))
+    router.route("cement emissiyaları", _near(GRI_305[0]))
+    router.route("cement", None)
+    router.route("ümumi sual", None)
+
+    snapshot = router.snapshot()
+    assert snapshot["routed_by_identifier"] == 1
+    assert snapshot["routed_by_centroid"] == 2
+    assert snapshot["topic_hint_added"] == 1
+    assert snapshot["topic_hint_unfiltered"] == 1
+    assert snapshot["fallback_unfiltered"] == 1
+
+
+def test_router_without_centroids_routes_by_identifier_only():
+    router = StandardsRouter(FILES)
+    assert router.route("GRI 305", None) == GRI_305
+    assert router.route("emissiyalar", _near(GRI_305[0])) is None
+
+
+@pytest.mark.parametrize("mode, marker", [
+    ("efficient", "knn"),
+    ("script_score", "script_score"),
+    ("post_filter", "bool"),
+])
+def test_routed_knn_body_modes(monkeypatch, mode, marker):
+    monkeypatch.setattr(standards_router, "ROUTER_FILTER_MODE", mode)
+    body = routed_knn_body([0.1, 0.2], 4, GRI_305)
+    assert body["size"] == 4
+    assert marker in body["query"]
+    assert str(GRI_305) in str(body)
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    """_load_router çağırışlarını sayır; nəticə `results` siyahısından götürülür."""
+    calls = []
+    results = []
+
+    def load():
+        calls.append(1)
+        return results.pop(0)
+
+    monkeypatch.setattr(standards_router, "_load_router", load)
+    monkeypatch.setattr(standards_router, "_router", None)
+    monkeypatch.setattr(standards_router, "_retry_at", 0.0)
+    monkeypatch.setattr(standards_router, "ROUTER_RETRY_SECONDS", 60)
+    return calls, results
+
+
+def test_load_failure_backs_off_then_retries(loader, monkeypatch):
+    calls, results = loader
+    results.append(None)
+
+    for _ in range(5):
+        assert get_standards_router() is standards_router._fallback_router
+    assert len(calls) == 1  # hər sorğu aqreqasiyanı təkrarlamır
+
+    # Gözləmə bitdikdən sonra yenidən cəhd olunur; uğurlu yükləmə saxlanılır
+    loaded = StandardsRouter(FILES)
+    results.append(loaded)
+    monkeypatch.setattr(standards_router, "_retry_at", 0.0)
+    assert get_standards_router() is loaded
+    assert get_standards_router() is loaded
+    assert len(calls) == 2
+
+
+def test_failed_file_listing_returns_none(monkeypatch, tmp_path):
+    class BrokenClient:
+        def search(self, index, body):
+            raise ConnectionError("OpenSearch əlçatmazdır")
+
+    monkeypatch.setattr(standards_router, "STANDARDS_CENTROIDS_PATH", str(tmp_path / "missing.npz"))
+    monkeypatch.setattr(standards_router, "get_raw_opensearch_client", lambda: BrokenClient())
+    assert standards_router._load_router() is None
+
+
+def test_centroid_file_is_loaded(monkeypatch, tmp_path):
+    path = tmp_path / "centroids.npz"
+    np.savez_compressed(path, files=np.array(json.dumps(FILES)),
+                        centroids=np.eye(len(FILES), dtype=np.float32))
+    monkeypatch.setattr(standards_router, "STANDARDS_CENTROIDS_PATH", str(path))
+
+    router = standards_router._load_router()
+    assert router.files == FILES
+    assert router.centroids is not None
@@ -0,0 +1,172 @@
+# tests/test_standards_snapshot.py
+import gzip
+import json
+import sys
+
+import pytest
+
+import app.rag.standards_snapshot as standards_snapshot
+from app.rag.chunk_schema import EMBEDDING_DIMENSIONS
+from app.rag.standards_snapshot import decode_vector, encode_vector, export_snapshot, import_snapshot
+
+INDEX = "esg_standards"
+MAPPINGS = {"properties": {"vector_field": {"type": "knn_vector", "dimension": EMBEDDING_DIMENSIONS}}}
+
+
+def _hits(count):
+    return [
+        {"_id": f"doc-{i}", "_source": {
+            "text": f"Standart mətni {i}",
+            "metadata": {"standard_name": "GRI 305", "page": i},
+            "vector_field": [i + j / 1024 for j in range(EMBEDDING_DIMENSIONS)],
+        }}
+        for i in range(count)
+    ]
+
+
+class FakeIndices:
+    def __init__(self, exists=True, mappings=MAPPINGS):
+        self._exists = exists
+        self.mappings = mappings
+        self.created = None
+
+    def exists(self, index):
+        return self._exists
+
+    def create(self, index, body):
+        self._exists = True
+        self.created = body
+
+    def delete(self, index):
+        self._exists = False
+
+    def get_mapping(self, index):
+        return {index: {"mappings": self.mappings}}
+
+    def get_settings(self, index, flat_settings=True):
+        return {index: {"settings": {"index.number_of_shards": "1", "index.knn": "true", "index.uuid": "x"}}}
+
+    def put_settings(self, index, body):
+        pass
+
+    def refresh(self, index):
+        pass
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.indices = FakeIndices(**kwargs)
+
+
+@pytest.fixture
+def helpers(monkeypatch):
+    """opensearchpy.helpers-in scan/parallel_bulk-u yaddaşdakı saxtalarla əvəz olunur."""
+    loaded = []
+    state = {"hits": _hits(3), "fail_ids": set()}
+
+    def scan(client, index, query, size):
+        return iter(state["hits"])
+
+    def parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            loaded.append(action)
+            yield action["_id"] not in state["fail_ids"], {"index": {"_id": action["_id"]}}
+
+    monkeypatch.setattr(standards_snapshot, "lazy_import",
+                        lambda module, name: {"scan": scan, "parallel_bulk": parallel_bulk}[name])
+    monkeypatch.setattr(standards_snapshot, "bump_generation", lambda index_name: None)
+    return state, loaded
+
+
+def _rewrite_header(path, **changes):
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        lines = handle.readlines()
+    lines[0] = json.dumps({**json.loads(lines[0]), **changes}) + "\n"
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        handle.writelines(lines)
+
+
+def test_vector_encoding_round_trips_float32():
+    vector = [0.5, -1.25, 3.0, 1e-3]
+    decoded = decode_vector(encode_vector(vector))
+    assert decoded == pytest.approx(vector, rel=1e-6)
+    assert len(encode_vector([0.0] * EMBEDDING_DIMENSIONS)) == len(encode_vector([1.0] * EMBEDDING_DIMENSIONS))
+
+
+def test_export_then_import_round_trips_documents(tmp_path, helpers):
+    state, loaded = helpers
+    path = str(tmp_path / "snapshot.jsonl.gz")
+
+    assert export_snapshot(path, INDEX, client=FakeClient()) == 3
+    target = FakeClient(exists=False)
+    assert import_snapshot(path, client=target) == (3, 0)
+
+    assert target.indices.created["mappings"] == MAPPINGS
+    assert target.indices.created["settings"] == {"index": {"number_of_shards": "1", "knn": "true"}}
+    for action, hit in zip(loaded, state["hits"]):
+        assert action["_id"] == hit["_id"]
+        assert action["_source"]["text"] == hit["_source"]["text"]
+        assert action["_source"]["metadata"] == hit["_source"]["metadata"]
+        assert action["_source"]["vector_field"] == pytest.approx(hit["_source"]["vector_field"], rel=1e-6)
+
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        lines = handle.readlines()
+    header = json.loads(lines[0])
+    assert header["embedding_model"] == standards_snapshot.EMBEDDING_MODEL
+    assert header["dimension"] == EMBEDDING_DIMENSIONS
+    assert json.loads(lines[-1]) == {"footer": {"count": 3}}
+
+
+def test_snapshot_without_footer_is_rejected(tmp_path, helpers):
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    export_snapshot(path, INDEX, client=FakeClient())
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        lines = handle.readlines()
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        handle.writelines(lines[:-1])
+
+    with pytest.raises(ValueError, match="footer"):
+        import_snapshot(path, client=FakeClient(exists=False))
+
+
+@pytest.mark.parametrize("changes", [
+    {"embedding_model": "gemini-embedding-001"},
+    {"dimension": 3072},
+    {"embedding_model": None, "dimension": None},
+])
+def test_snapshot_from_other_embedding_model_is_refused(tmp_path, helpers, changes):
+    state, loaded = helpers
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    export_snapshot(path, INDEX, client=FakeClient())
+    _rewrite_header(path, **changes)
+
+    with pytest.raises(ValueError, match="ölçü"):
+        import_snapshot(path, client=FakeClient(exists=False))
+    assert loaded == []
+
+
+def test_existing_index_with_other_dimension_is_refused(tmp_path, helpers):
+    state, loaded = helpers
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    export_snapshot(path, INDEX, client=FakeClient())
+    other = {"properties": {"vector_field": {"type": "knn_vector", "dimension": 3072}}}
+
+    with pytest.raises(ValueError, match="3072"):
+        import_snapshot(path, client=FakeClient(exists=True, mappings=other))
+    assert loaded == []
+
+
+def test_cli_import_exits_non_zero_on_bulk_failures(tmp_path, helpers, monkeypatch):
+    state, loaded = helpers
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    export_snapshot(path, INDEX, client=FakeClient())
+    state["fail_ids"] = {"doc-1"}
+    monkeypatch.setattr(standards_snapshot, "get_raw_opensearch_client", lambda timeout: FakeClient(exists=False))
+    monkeypatch.setattr(sys, "argv", ["standards_snapshot", "import", path])
+
+    with pytest.raises(SystemExit) as exit_info:
+        standards_snapshot.main()
+    assert exit_info.value.code == 1
+
+    state["fail_ids"] = set()
+    standards_snapshot.main()  # xətasız idxal sıfır kodla bitir
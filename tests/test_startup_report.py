@@ -0,0 +1,98 @@
+# tests/test_startup_report.py
+import sys
+import json
+import subprocess
+
+import pytest
+
+import app.startup_report as startup_report
+from app.startup_report import importtime_report, lazy_import, timed_phase
+
+# app.main importu zamanı yüklənməməli olan ağır modullar (lazy_import ilə ilk istifadədə yüklənir)
+HEAVY_MODULES = [
+    "numpy", "pandas", "langchain_google_genai", "langchain_community.vectorstores",
+    "langchain_community.document_loaders", "opensearchpy.helpers",
+]
+
+
+@pytest.fixture
+def timings(monkeypatch):
+    monkeypatch.setattr(startup_report, "_import_timings_ms", {})
+    monkeypatch.setattr(startup_report, "_phase_timings_ms", {})
+
+
+@pytest.fixture
+def fresh_module(tmp_path, monkeypatch):
+    """sys.path-ə əlavə olunmuş, hələ import edilməmiş modul; testdən sonra sys.modules-dan silinir."""
+    name = f"lazy_probe_{tmp_path.name.replace('-', '_')}"
+    (tmp_path / f"{name}.py").write_text("VALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))  # importtime_report alt prosesi üçün
+    yield name
+    sys.modules.pop(name, None)
+
+
+def test_lazy_import_records_only_the_cold_import(timings, fresh_module):
+    module = lazy_import(fresh_module)
+    first = startup_report.startup_report()["lazy_imports_ms"][fresh_module]
+
+    assert lazy_import(fresh_module) is module
+    assert lazy_import(fresh_module, "VALUE") == 42
+    assert startup_report.startup_report()["lazy_imports_ms"] == {fresh_module: first}
+
+
+def test_lazy_import_of_already_loaded_module_is_not_recorded(timings):
+    assert lazy_import("json", "dumps") is json.dumps
+    assert startup_report.startup_report()["lazy_imports_ms"] == {}
+
+
+def test_lazy_import_failure_is_raised_and_not_recorded(timings):
+    with pytest.raises(ImportError):
+        lazy_import("no_such_module_for_startup_report")
+    with pytest.raises(AttributeError):
+        lazy_import("json", "no_such_attr")
+    assert startup_report.startup_report()["lazy_imports_ms"] == {}
+
+
+def test_timed_phase_records_duration_even_on_error(timings):
+    with timed_phase("db_check"):
+        pass
+    with pytest.raises(RuntimeError):
+        with timed_phase("standards_indexing"):
+            raise RuntimeError("OpenSearch əlçatmazdır")
+
+    phases = startup_report.startup_report()["phases_ms"]
+    assert set(phases) == {"db_check", "standards_indexing"}
+    assert all(value >= 0 for value in phases.values())
+
+
+def test_report_sorts_imports_by_duration(timings, monkeypatch):
+    monkeypatch.setattr(startup_report, "_import_timings_ms", {"a": 1.0, "b": 30.0, "c": 5.0})
+    report = startup_report.startup_report()
+    assert list(report["lazy_imports_ms"]) == ["b", "c", "a"]
+    assert report["uptime_s"] >= 0
+
+
+def test_importtime_report_parses_importtime_output(fresh_module):
+    report = importtime_report(fresh_module, top=5).splitlines()
+
+    assert report[0].startswith(f"{fresh_module} import vaxtı:")
+    assert any(line.endswith(fresh_module) for line in report[1:])
+    assert len(report) <= 6
+    assert not any("XƏTA" in line for line in report)
+
+
+def test_importtime_report_shows_import_error():
+    report = importtime_report("no_such_module_for_startup_report")
+    assert "XƏTA: import uğursuz oldu" in report
+    assert "ModuleNotFoundError" in report
+
+
+def test_app_main_import_does_not_load_heavy_modules():
+    code = (
+        "import sys, json, app.main\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,65 @@
+# tests/test_structured_chunker.py
+from app.rag.conversation_summary import estimate_tokens
+from app.rag.structured_chunker import SENTENCE_END_RE, chunk_standard
+
+HEADING = "Disclosure 305-1 Direct (Scope 1) GHG emissions"
+
+
+def _lines(count: int, sentence_every: int = 3, start: int = 0):
+    """~15 tokenlik sətirlər; hər `sentence_every`-ci sətir cümlə sonu ilə bitir."""
+    return [
+        f"The organization shall report gross direct emissions item {i:03d}"
+        + ("." if (i + 1) % sentence_every == 0 else " and")
+        for i in range(start, start + count)
+    ]
+
+
+def _body(chunk):
+    prefix = f"{HEADING} (davamı): "
+    return chunk["text"][len(prefix):] if chunk["text"].startswith(prefix) else chunk["text"]
+
+
+def test_chunks_respect_token_limit():
+    pages = ["\n".join([HEADING] + _lines(40)), "\n".join(_lines(40, start=40))]
+
+    chunks = chunk_standard(pages, "GRI_305.pdf", max_tokens=100, min_tokens=20)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(_body(chunk)) <= 100 for chunk in chunks)
+    # Overlap yoxdur: bütün sətirlər tam bir dəfə görünür
+    text = " ".join(_body(chunk) for chunk in chunks)
+    assert all(text.count(f"item {i:03d}") == 1 for i in range(80))
+
+
+def test_chunks_are_cut_at_sentence_boundaries():
+    pages = ["\n".join([HEADING] + _lines(60))]
+
+    chunks = chunk_standard(pages, "GRI_305.pdf", max_tokens=100, min_tokens=20)
+
+    assert len(chunks) > 2
+    assert all(SENTENCE_END_RE.search(chunk["text"]) for chunk in chunks[:-1])
+
+
+def test_continuation_chunks_carry_heading_and_metadata():
+    pages = ["\n".join(["Introduction text of the standard."] * 3),
+             "\n".join([HEADING] + _lines(30)),
+             "\n".join(_lines(30, sentence_every=2, start=30))]
+
+    chunks = chunk_standard(pages, "GRI_305.pdf", max_tokens=100, min_tokens=5)
+    disclosure_chunks = [chunk for chunk in chunks if chunk["disclosure_id"] == "305-1"]
+
+    assert chunks[0]["section"] == "front"
+    assert disclosure_chunks[0]["text"].startswith(HEADING)
+    assert disclosure_chunks[0]["page"] == 1
+    assert all(chunk["section"] == "requirements" for chunk in disclosure_chunks)
+    assert all(chunk["text"].startswith(f"{HEADING} (davamı): ") for chunk in disclosure_chunks[1:])
+    assert disclosure_chunks[-1]["page"] == 2
+
+
+def test_new_heading_starts_new_chunk():
+    pages = ["\n".join([HEADING] + _lines(3)
+                       + ["Disclosure 305-2 Energy indirect (Scope 2) GHG emissions"] + _lines(3))]
+
+    chunks = chunk_standard(pages, "GRI_305.pdf", max_tokens=500, min_tokens=5)
+
+    assert [chunk["disclosure_id"] for chunk in chunks] == ["305-1", "305-2"]